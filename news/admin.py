@@ -10,6 +10,10 @@ class PostAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'rating', 'updated_at', 'category_list_display']
     date_hierarchy = 'created_at'
 
+    def get_queryset(self, request):
+        # Автор и категории загружаются заранее, а не отдельным запросом на строку
+        return super().get_queryset(request).for_listing()
+
     # Не включаем categories в fields - используем только для отображения
     fields = [
         'title',
@@ -47,28 +51,40 @@ class PostAdmin(admin.ModelAdmin):
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'post_count', 'news_count', 'articles_count', 'subscriber_count']
-    search_fields = ['name', 'description']
+    list_display = ['name', 'post_count', 'news_count', 'articles_count', 'subscriber_count', 'last_post_at']
+    search_fields = ['name']
+    # Счетчики берутся из CategoryStats одним JOIN, а не COUNT на каждую строку
+    list_select_related = ['stats']
 
     def post_count(self, obj):
-        return obj.post_set.count()
+        return obj.get_stats().posts
 
     post_count.short_description = 'Всего постов'
+    post_count.admin_order_field = 'stats__posts'
 
     def news_count(self, obj):
-        return obj.post_set.filter(post_type='NW').count()
+        return obj.get_stats().news
 
     news_count.short_description = 'Новостей'
+    news_count.admin_order_field = 'stats__news'
 
     def articles_count(self, obj):
-        return obj.post_set.filter(post_type='AR').count()
+        return obj.get_stats().articles
 
     articles_count.short_description = 'Статей'
+    articles_count.admin_order_field = 'stats__articles'
 
     def subscriber_count(self, obj):
-        return obj.subscription_set.count()
+        return obj.get_stats().subscribers
 
     subscriber_count.short_description = 'Подписчики'
+    subscriber_count.admin_order_field = 'stats__subscribers'
+
+    def last_post_at(self, obj):
+        return obj.get_stats().last_post_at
+
+    last_post_at.short_description = 'Последний пост'
+    last_post_at.admin_order_field = 'stats__last_post_at'
 
 
 @admin.register(Author)
@@ -7,3 +7,7 @@ class NewsConfig(AppConfig):
 
     def ready(self):
         import news.signals
+        from news import votes
+
+        # Буфер голосов на кэше без атомарного incr терял бы голоса - ошибка сразу при запуске
+        votes.is_buffered()
@@ -0,0 +1,314 @@
+"""
+Двухуровневый кэш: маленький LRU в памяти процесса (L1) перед общим кэшем (L2).
+
+L2 - любой общий для всех процессов бэкенд из CACHES (файловый, Redis, memcached),
+его алиас задается опцией SHARED. Все записи идут в L2, чтения сначала смотрят в L1.
+
+Согласованность между процессами держится на ключе поколения в L2: перезапись
+или удаление ключа, который уже есть в L2 (и поэтому может лежать в чьем-то L1),
+меняет поколение. Первое заполнение ключа поколение не меняет - после промаха
+кэш не сбрасывает L1 остальных процессов. Процесс сверяет поколение один раз за
+HTTP-запрос (вне запросов - при каждом чтении) и при несовпадении очищает свой
+L1. Поэтому в пределах одного запроса данные согласованы, а изменения из других
+процессов видны со следующего запроса. Ключ, вытесненный из L2 и заполненный
+заново, может остаться в чужом L1 старым, но не дольше LOCAL_TIMEOUT.
+
+Ключи с префиксами из LOCAL_EXCLUDE_PREFIXES в L1 не попадают и поколение не
+меняют: это часто меняющиеся счетчики (голоса, поколения тегов), которые
+всегда читаются из L2.
+
+L1 - один на LOCATION (Django передает бэкенду LOCATION, а не алиас). Без
+LOCATION имя L1 - алиас общего кэша SHARED, поэтому двум алиасам TwoTierCache
+над одним общим кэшем нужны разные LOCATION.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'news.cache_backends.TwoTierCache',
+            'LOCATION': 'default',
+            'OPTIONS': {'SHARED': 'shared', 'LOCAL_MAX_ENTRIES': 1000, 'LOCAL_TIMEOUT': 60},
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/var/tmp/newsportal_cache',
+        },
+    }
+"""
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.signals import request_finished, request_started
+
+GENERATION_KEY = 'two_tier:generation'
+# Смена поколения: кто начал последним и кто меняет сейчас (см. _bump_generation)
+BUMP_LAST_KEY = 'two_tier:bump_last'
+BUMP_OWNER_KEY = 'two_tier:bump_owner'
+BUMP_TIMEOUT = 5
+BUMP_WAIT = 0.5
+
+_MISSING = object()
+
+# L1 общий для всех потоков процесса (как у LocMemCache), по одному на LOCATION
+_stores = {}
+_stores_lock = threading.Lock()
+
+# Какие кэши уже сверили поколение в текущем запросе (None - поток вне запроса)
+_request_state = threading.local()
+
+
+def _start_request(**kwargs):
+    _request_state.synced = set()
+
+
+def _finish_request(**kwargs):
+    _request_state.synced = None
+
+
+request_started.connect(_start_request)
+request_finished.connect(_finish_request)
+
+
+class LocalStore:
+    """LRU-словарь в памяти процесса со временем жизни записей"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = None
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, pickled = entry
+            if expires_at < time.monotonic():
+                del self.data[key]
+                return _MISSING
+            self.data.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def set(self, key, value, ttl):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.data[key] = (time.monotonic() + ttl, pickled)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        name = self._name = location or f'shared:{self._shared_alias}'
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self._exclude = tuple(options.get('LOCAL_EXCLUDE_PREFIXES', ()))
+        with _stores_lock:
+            if name not in _stores:
+                _stores[name] = LocalStore(options.get('LOCAL_MAX_ENTRIES', 1000))
+            self._store = _stores[name]
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # --- L1 ---
+
+    def _local_key(self, key, version):
+        return self.make_and_validate_key(key, version=version)
+
+    def _is_local(self, key):
+        return not key.startswith(self._exclude)
+
+    def _local_ttl(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self._local_timeout
+        return min(timeout, self._local_timeout)
+
+    def _remember(self, key, value, version, timeout=DEFAULT_TIMEOUT):
+        ttl = self._local_ttl(timeout)
+        if ttl > 0:
+            self._store.set(self._local_key(key, version), value, ttl)
+
+    def _forget(self, key, version):
+        self._store.delete(self._local_key(key, version))
+
+    def sync(self):
+        """Сверяет поколение с L2 и очищает L1, если другой процесс что-то изменил"""
+        synced = getattr(_request_state, 'synced', None)
+        if synced is not None and self._name in synced:
+            return
+        generation = self.shared.get(GENERATION_KEY)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            if not self.shared.add(GENERATION_KEY, generation, None):
+                generation = self.shared.get(GENERATION_KEY)
+        store = self._store
+        with store.lock:
+            if store.generation != generation:
+                store.data.clear()
+                store.generation = generation
+        if synced is not None:
+            synced.add(self._name)
+
+    def _bump_generation(self):
+        """
+        Меняет поколение. Свой L1 остается действительным (новое поколение сразу
+        записывается в store.generation), только если смену поколения не пересек
+        другой процесс: иначе его запись между нашими чтением и записью поколения
+        потерялась бы для нас. Пересечения ловит быстрый путь алгоритма Лампорта на
+        двух ключах: атомарного add у файлового кэша нет, но get/set одного ключа
+        атомарны. Проигравший ждет победителя и меняет поколение без сохранения L1.
+        """
+        shared, token = self.shared, uuid.uuid4().hex
+        shared.set(BUMP_LAST_KEY, token, BUMP_TIMEOUT)
+        if shared.get(BUMP_OWNER_KEY) is None:
+            shared.set(BUMP_OWNER_KEY, token, BUMP_TIMEOUT)
+            if shared.get(BUMP_LAST_KEY) == token:
+                previous = shared.get(GENERATION_KEY)
+                shared.set(GENERATION_KEY, token, None)
+                alone = shared.get(BUMP_OWNER_KEY) == token
+                shared.delete(BUMP_OWNER_KEY)
+                if alone:
+                    store = self._store
+                    with store.lock:
+                        # Поколение до записи поменял кто-то еще - L1 устарел и без нас
+                        if store.generation != previous:
+                            store.data.clear()
+                        store.generation = token
+                return
+        deadline = time.monotonic() + BUMP_WAIT
+        while shared.get(BUMP_OWNER_KEY) not in (None, token) and time.monotonic() < deadline:
+            time.sleep(0.001)
+        # Метка владельца до записи поколения: начавший после нас победитель не сохранит L1
+        shared.set(BUMP_OWNER_KEY, token, BUMP_TIMEOUT)
+        shared.set(GENERATION_KEY, token, None)
+        if shared.get(BUMP_OWNER_KEY) == token:
+            shared.delete(BUMP_OWNER_KEY)
+
+    def _existing(self, keys, version):
+        """Ключи L1, которые уже есть в L2: их перезапись должна сменить поколение"""
+        local = [key for key in keys if self._is_local(key)]
+        if not local:
+            return []
+        found = self.shared.get_many(local, version=version)
+        return [key for key in local if key in found]
+
+    # --- API кэша ---
+
+    def get(self, key, default=None, version=None):
+        if self._is_local(key):
+            self.sync()
+            value = self._store.get(self._local_key(key, version))
+            if value is not _MISSING:
+                return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        if self._is_local(key):
+            self._remember(key, value, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        rest = []
+        for key in keys:
+            if self._is_local(key):
+                self.sync()
+                value = self._store.get(self._local_key(key, version))
+                if value is not _MISSING:
+                    found[key] = value
+                    continue
+            rest.append(key)
+        if rest:
+            fetched = self.shared.get_many(rest, version=version)
+            for key, value in fetched.items():
+                if self._is_local(key):
+                    self._remember(key, value, version)
+            found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        if self._is_local(key):
+            self.sync()
+            if self._store.get(self._local_key(key, version)) is not _MISSING:
+                return True
+        return self.shared.has_key(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Успешный add создает новый ключ: ни у кого в L1 его нет, поколение не меняется
+        added = self.shared.add(key, value, timeout, version=version)
+        if added and self._is_local(key):
+            self._remember(key, value, version, timeout)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        existed = self._is_local(key) and self.shared.has_key(key, version=version)
+        self.shared.set(key, value, timeout, version=version)
+        if self._is_local(key):
+            self._remember(key, value, version, timeout)
+            if existed:
+                self._bump_generation()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        existing = self._existing(data, version)
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key in data:
+            if self._is_local(key) and key not in failed:
+                self._remember(key, data[key], version, timeout)
+        if existing:
+            self._bump_generation()
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.shared.delete(key, version=version)
+        if self._is_local(key):
+            self._forget(key, version)
+            if deleted:
+                self._bump_generation()
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        existing = self._existing(keys, version)
+        self.shared.delete_many(keys, version=version)
+        for key in keys:
+            if self._is_local(key):
+                self._forget(key, version)
+        if existing:
+            self._bump_generation()
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        if self._is_local(key):
+            self._forget(key, version)
+            self._bump_generation()
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def clear(self):
+        # Вместе с L2 пропадает и ключ поколения - остальные процессы очистят L1 при сверке
+        self.shared.clear()
+        self._store.clear()
@@ -0,0 +1,183 @@
+import hashlib
+import re
+from html import unescape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.defaultfilters import linebreaks_filter
+from django.utils.html import strip_tags
+
+# Более полный список корней с разными вариантами
+CENSOR_ROOTS = [
+    'ху[йяюе]',  # хуй, хуя, хую, хуе
+    'пизд',  # пизда, пиздец, распиздяй
+    'еб[ауё]',  # ебать, ебун, ебёшь
+    'бля[дт]',  # блядь, блять
+    'гондон',  # гондон
+    'мудак',  # мудак
+    'су[кч]',  # сука, сучара
+]
+
+# Список запрещенных слов для нового фильтра
+FORBIDDEN_WORDS = [
+    'редиска',
+    'плохой',
+    'нежелательный',
+    'запрещенный',
+    'секрет',
+    'конфиденциально',
+    # добавьте другие слова по необходимости
+]
+
+# Символы, которые отбрасываются по краям слова перед сравнением
+PUNCTUATION = '.,!?;:"()[]'
+
+HTML_TAG_RE = re.compile(r'(<[^>]+>)')
+WORD_RE = re.compile(r'\w+')
+
+
+def mask_forbidden(word):
+    """Маскирует запрещенное слово: р*****а"""
+    if len(word) <= 2:
+        return '*' * len(word)
+    return word[0] + '*' * (len(word) - 2) + word[-1]
+
+
+def mask_obscene(word):
+    """Маскирует матное слово: х**"""
+    if len(word) > 1:
+        return word[0] + '*' * (len(word) - 1)
+    return word
+
+
+class CensorEngine:
+    """
+    Движок цензуры, собираемый один раз при загрузке модуля.
+
+    Запрещенные слова хранятся во frozenset, а корни объединены в одно
+    скомпилированное регулярное выражение. Дополнительное выражение
+    ``scan_re`` проверяет весь текст за один проход: если в нем нет ни
+    одного подозрительного фрагмента, пословная обработка пропускается.
+    """
+
+    def __init__(self, roots, forbidden_words):
+        self.roots = tuple(roots)
+        self.forbidden_words = tuple(forbidden_words)
+        self.forbidden = frozenset(word.lower() for word in self.forbidden_words)
+        # Отпечаток списков: входит в ключи кэша, поэтому после изменения
+        # списков старые результаты цензуры перестают читаться
+        self.lists_hash = hashlib.sha1(
+            repr((self.roots, sorted(self.forbidden))).encode('utf-8')
+        ).hexdigest()[:12]
+
+        roots_alternation = '|'.join(f'(?:{root})' for root in self.roots)
+        forbidden_alternation = '|'.join(re.escape(word) for word in self.forbidden)
+
+        self.roots_re = re.compile(roots_alternation, re.IGNORECASE) if self.roots else None
+        self.forbidden_re = (
+            re.compile(forbidden_alternation, re.IGNORECASE) if self.forbidden else None
+        )
+        self.scan_re = re.compile(
+            '|'.join(filter(None, [roots_alternation, forbidden_alternation])),
+            re.IGNORECASE
+        ) if (self.roots or self.forbidden) else None
+
+    def censor_word(self, word):
+        """Цензурирует одно слово"""
+        if word.strip(PUNCTUATION).lower() in self.forbidden:
+            return mask_forbidden(word)
+        if self.roots_re is not None and self.roots_re.search(word):
+            return mask_obscene(word)
+        return word
+
+    def censor_plain(self, text):
+        """Цензура простого текста: слова разделяются одним пробелом"""
+        words = text.split()
+        if self.scan_re is None or not self.scan_re.search(text):
+            return ' '.join(words)
+        return ' '.join([self.censor_word(word) for word in words])
+
+    def censor(self, value):
+        """Убирает HTML и цензурирует текст по обоим спискам"""
+        text = unescape(strip_tags(value))
+        return self.censor_plain(text)
+
+    def censor_html(self, value):
+        """Цензура HTML-текста с сохранением разметки"""
+        value = unescape(value)
+        if '<' in value and '>' in value:
+            return ''.join(
+                part if part.startswith('<') and part.endswith('>') else self.censor(part)
+                for part in HTML_TAG_RE.split(value)
+            )
+        return self.censor(value)
+
+    def _hide_word(self, match):
+        word = match.group()
+        if word.lower() in self.forbidden:
+            return mask_forbidden(word)
+        return word
+
+    def _hide_part(self, text):
+        if self.forbidden_re is None or not self.forbidden_re.search(text):
+            return text
+        return WORD_RE.sub(self._hide_word, text)
+
+    def hide_forbidden(self, value):
+        """Скрывает только слова из списка запрещенных, сохраняя HTML"""
+        value = unescape(value)
+        if '<' in value and '>' in value:
+            return ''.join(
+                part if part.startswith('<') and part.endswith('>') else self._hide_part(part)
+                for part in HTML_TAG_RE.split(value)
+            )
+        return self._hide_part(value)
+
+
+engine = CensorEngine(CENSOR_ROOTS, FORBIDDEN_WORDS)
+
+
+# Кэш уже процензурированных полей поста.
+# Ключ: id поста + updated_at + отпечаток списков слов, поэтому:
+#   - редактирование поста меняет updated_at, и старая версия больше не читается;
+#   - изменение CENSOR_ROOTS/FORBIDDEN_WORDS меняет отпечаток у всех ключей сразу;
+#   - неактуальные записи никто не читает, они вытесняются по таймауту.
+CENSORED_CACHE_TIMEOUT = getattr(settings, 'CENSORED_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+
+# Варианты отображения, которые используются в шаблонах
+CENSORED_VARIANTS = {
+    'title': lambda post: engine.censor(post.title),
+    'title_html': lambda post: engine.censor_html(post.title),
+    'content': lambda post: engine.censor(post.content),
+    'content_html': lambda post: engine.censor_html(post.content),
+    'content_linebreaks': lambda post: engine.censor(linebreaks_filter(post.content)),
+}
+
+
+def censored_cache_key(post, variant):
+    """Ключ кэша для варианта отображения поста"""
+    version = int(post.updated_at.timestamp() * 1000000) if post.updated_at else 0
+    return f'censored:{post.pk}:{version}:{engine.lists_hash}:{variant}'
+
+
+def get_censored(post, variant):
+    """Возвращает процензурированное поле из кэша, при промахе считает и сохраняет"""
+    key = censored_cache_key(post, variant)
+    value = cache.get(key)
+    if value is None:
+        value = CENSORED_VARIANTS[variant](post)
+        cache.set(key, value, CENSORED_CACHE_TIMEOUT)
+    return value
+
+
+def warm_censored_cache(post):
+    """Заполняет кэш всеми вариантами отображения поста (вызывается при сохранении)"""
+    cache.set_many(
+        {censored_cache_key(post, variant): render(post) for variant, render in CENSORED_VARIANTS.items()},
+        CENSORED_CACHE_TIMEOUT
+    )
+
+
+def evict_censored_cache(post):
+    """Удаляет из кэша текущую версию поста (вызывается при удалении)"""
+    cache.delete_many([censored_cache_key(post, variant) for variant in CENSORED_VARIANTS])
@@ -0,0 +1,190 @@
+"""
+Кэш вычисляемых значений с защитой от "набега" (cache stampede).
+
+    categories = cached_compute('categories', lambda: list(Category.objects.all()), 600)
+
+- В кэше лежит конверт (значение, время вычисления, срок годности). Сама запись
+  живет в кэше вдвое дольше срока годности, чтобы было что отдать, пока значение
+  пересчитывается.
+- Вероятностное раннее обновление (XFetch): незадолго до истечения срока
+  один из запросов пересчитывает значение заранее. Чем дольше вычисление и
+  ближе срок, тем выше вероятность.
+- Single-flight: пересчитывает только тот, кто взял блокировку (внутри
+  процесса - запись в _inflight, между процессами - cache.add). Остальные отдают
+  устаревшее значение, а если его нет - ждут результата.
+- Пустые результаты (None, пустой список) тоже кэшируются, но на меньший срок.
+
+compute должен возвращать готовые данные (списки, словари), а не ленивые queryset'ы.
+"""
+import math
+import random
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from . import tagged_cache
+
+DEFAULT_TIMEOUT = 60 * 5
+NEGATIVE_TIMEOUT = 30
+LOCK_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+
+
+# Внутри процесса вычисление ключа регистрируется в _inflight (add у файлового кэша
+# не атомарен, и без этого два потока могут взять одну блокировку). Блокировка
+# корзины (по хэшу ключа) держится только на время регистрации, а остальные потоки
+# ждут событие своего ключа - медленное вычисление не задерживает другие ключи
+_stripes = [threading.Lock() for _ in range(64)]
+_inflight = {}
+_MISSING = object()
+
+
+class _Flight:
+    """Вычисление ключа, которое идет в одном из потоков процесса"""
+
+    def __init__(self):
+        self.owner = threading.get_ident()
+        self.value = _MISSING
+        self.done = threading.Event()
+
+
+def _stripe(key):
+    return _stripes[hash(key) % len(_stripes)]
+
+
+def _claim(key):
+    """(вычисление ключа, True если его ведет текущий поток)"""
+    with _stripe(key):
+        flight = _inflight.get(key)
+        if flight is not None:
+            # Вложенный cached_compute с тем же ключом не должен ждать сам себя
+            return flight, flight.owner == threading.get_ident()
+        flight = _inflight[key] = _Flight()
+        return flight, True
+
+
+def _finish(key, flight, value=_MISSING):
+    with _stripe(key):
+        if _inflight.get(key) is flight:
+            del _inflight[key]
+    if value is not _MISSING:
+        flight.value = value
+    flight.done.set()
+
+
+def _lock_key(key):
+    return f'compute_lock:{key}'
+
+
+def _acquire(key, lock_timeout):
+    """Блокировка между процессами"""
+    token = uuid.uuid4().hex
+    if cache.add(_lock_key(key), token, lock_timeout):
+        return token
+    return None
+
+
+def _release(key, token):
+    # Не снимаем чужую блокировку, если наша уже истекла
+    if cache.get(_lock_key(key)) == token:
+        cache.delete(_lock_key(key))
+
+
+def _is_empty(value):
+    if value is None:
+        return True
+    try:
+        return len(value) == 0
+    except TypeError:
+        return False
+
+
+def should_refresh(delta, expires_at, beta=1.0, now=None):
+    """XFetch: пора ли пересчитать значение, вычисление которого заняло delta секунд"""
+    now = time.time() if now is None else now
+    # 1 - random() лежит в (0, 1], логарифм от нуля не берется
+    return now - delta * beta * math.log(1 - random.random()) >= expires_at
+
+
+def _compute_and_store(key, compute, timeout, negative_timeout):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    ttl = negative_timeout if _is_empty(value) else timeout
+    cache.set(key, (value, delta, time.time() + ttl), ttl * 2)
+    return value
+
+
+def cached_compute(key, compute, timeout=DEFAULT_TIMEOUT, tags=None, beta=1.0,
+                   negative_timeout=NEGATIVE_TIMEOUT, lock_timeout=LOCK_TIMEOUT):
+    """
+    Значение compute() из кэша по ключу key. tags - теги зависимостей
+    (news/tagged_cache.py): после их сброса значение вычисляется заново
+    """
+    if tags:
+        key = tagged_cache.make_key(key, tags)
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires_at = entry
+        if not should_refresh(delta, expires_at, beta):
+            return value
+        flight, owner = _claim(key)
+        if not owner:
+            # Пересчитывает другой поток - пока отдаем то, что есть
+            return value
+        result = _MISSING
+        try:
+            token = _acquire(key, lock_timeout)
+            if token is None:
+                return value
+            try:
+                result = _compute_and_store(key, compute, timeout, negative_timeout)
+                return result
+            finally:
+                _release(key, token)
+        finally:
+            _finish(key, flight, result)
+
+    flight, owner = _claim(key)
+    if not owner:
+        # Значение уже вычисляет другой поток процесса - ждем его
+        flight.done.wait(lock_timeout)
+        if flight.value is not _MISSING:
+            return flight.value
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+        # Вычислявший поток не успел или упал - считаем сами
+        return _compute_and_store(key, compute, timeout, negative_timeout)
+
+    result = _MISSING
+    try:
+        # Пока регистрировались, значение мог сохранить другой поток
+        entry = cache.get(key)
+        if entry is not None:
+            result = entry[0]
+            return result
+        token = _acquire(key, lock_timeout)
+        if token is not None:
+            try:
+                result = _compute_and_store(key, compute, timeout, negative_timeout)
+                return result
+            finally:
+                _release(key, token)
+
+        # Значения нет, его уже вычисляет другой процесс - ждем результата
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None:
+                result = entry[0]
+                return result
+        # Вычислявший процесс не успел или упал - считаем сами
+        result = _compute_and_store(key, compute, timeout, negative_timeout)
+        return result
+    finally:
+        _finish(key, flight, result)
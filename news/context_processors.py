@@ -1,14 +1,16 @@
 from django.utils import timezone
-import pytz
+from django.utils.functional import SimpleLazyObject
+from . import roles
 
 
 def timezone_context(request):
+    # Список поясов здесь больше не передается: <select> строит {% timezone_select %} из кэша
     return {
         'current_time': timezone.now(),
-        'timezones': pytz.common_timezones,
     }
 
 def user_groups(request):
+    # Лениво: страницы без проверки роли не трогают ни кэш, ни базу
     return {
-        'is_author': request.user.groups.filter(name='authors').exists() if request.user.is_authenticated else False
-    }
\ No newline at end of file
+        'is_author': SimpleLazyObject(lambda: roles.is_author(request.user))
+    }
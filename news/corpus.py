@@ -0,0 +1,236 @@
+"""
+Синтетический корпус для нагрузочных замеров (команда generate_corpus).
+
+    CorpusGenerator(rows=1_000_000, seed=42).run()
+
+Создает пользователей, авторов, категории, посты, связи PostCategory, комментарии
+и подписки через bulk_create пачками, общим объемом около rows строк (до 10M).
+Память не зависит от объема: объекты создаются генераторами, id назначаются
+явно подряд от текущего максимума, и внешние ключи выбираются из известных
+диапазонов без чтения таблиц.
+
+Данные детерминированы: у каждой таблицы свой генератор случайных чисел от seed,
+поэтому один и тот же seed и rows дают тот же корпус (даты отсчитываются от
+начала текущих суток). Популярность категорий и авторов распределена по Ципфу,
+посты идут по времени в порядке id, в части предложений есть слова для цензуры.
+
+Сигналы при bulk_create не срабатывают - рейтинги авторов, CategoryStats,
+поисковый индекс и кэш пересчитываются один раз в конце.
+"""
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import reset_queries, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import dump
+from .censorship import FORBIDDEN_WORDS
+from .models import Author, Category, Comment, Post, PostCategory, Subscription
+
+MAX_ROWS = 10_000_000
+DEFAULT_BATCH_SIZE = 5000
+PASSWORD = 'corpus'
+
+WORDS = [
+    'правительство', 'заявило', 'новых', 'мерах', 'поддержки', 'экономики', 'регионах', 'страны',
+    'эксперты', 'считают', 'решение', 'поможет', 'малому', 'бизнесу', 'повысит', 'доходы',
+    'граждан', 'однако', 'мнению', 'аналитиков', 'эффект', 'будет', 'заметен', 'лишь', 'через',
+    'год', 'инфляция', 'снизилась', 'данным', 'Росстата', 'Москва', 'Санкт-Петербург', 'Казань',
+    'министерство', 'сообщило', 'рост', 'цен', 'на', 'в', 'и', 'по', 'с', 'о', 'для', 'что',
+    'команда', 'выиграла', 'матч', 'счетом', 'тренер', 'отметил', 'игру', 'защиты', 'сезон',
+    'чемпионат', 'болельщики', 'стадион', 'компания', 'представила', 'смартфон', 'процессор',
+    'искусственный', 'интеллект', 'разработчики', 'обновление', 'безопасности', 'данных',
+    'пользователей', 'сеть', 'выставка', 'откроется', 'музее', 'картины', 'художника', 'фильм',
+    'режиссер', 'премьера', 'театр', 'спектакль', 'зрители', 'ученые', 'обнаружили', 'новый',
+    'вид', 'исследование', 'показало', 'климат', 'температура', 'погода', 'выходные', 'дожди',
+    'рынок', 'акции', 'курс', 'рубля', 'нефть', 'банк', 'ставку', 'кредиты', 'ипотека',
+    'школы', 'студенты', 'экзамены', 'университет', 'врачи', 'больница', 'лечение', 'вакцина',
+    'депутаты', 'закон', 'приняли', 'чтении', 'губернатор', 'встреча', 'переговоры', 'соглашение',
+]
+# Попадают под CENSOR_ROOTS и FORBIDDEN_WORDS (news/censorship.py)
+CENSORED_WORDS = [*FORBIDDEN_WORDS, 'мудак', 'сука', 'пиздец']
+CENSORED_SHARE = 0.05  # доля предложений с "плохим" словом
+
+CATEGORY_NAMES = [
+    'Политика', 'Экономика', 'Технологии', 'Спорт', 'Культура', 'Наука', 'Здоровье',
+    'Образование', 'Общество', 'Происшествия', 'Авто', 'Недвижимость', 'Туризм', 'Погода',
+]
+
+SENTENCE_POOL = 5000
+# Показатель степени: чем больше, тем чаще комментируют свежие посты
+RECENT_COMMENTS_SKEW = 1.5
+
+
+def plan(rows):
+    """Сколько строк каждой таблицы создать при общем объеме около rows"""
+    users = max(rows * 3 // 100, 4)
+    return {
+        'users': users,
+        'authors': max(users // 4, 1),
+        'categories': min(max(rows // 50_000, 10), 200),
+        'posts': max(rows // 5, 1),
+        'comments': rows * 3 // 10,
+    }
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def zipf_weights(count, skew=1.0):
+    """Накопленные веса: первые элементы популярнее остальных"""
+    return list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+class CorpusGenerator:
+    def __init__(self, rows, seed=0, batch_size=DEFAULT_BATCH_SIZE, days=365, progress=None):
+        if rows > MAX_ROWS:
+            raise ValueError(f'Не больше {MAX_ROWS} строк')
+        self.seed = seed
+        self.counts = plan(rows)
+        self.batch_size = batch_size
+        self.progress = progress
+        self.end = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.span = int(timedelta(days=days).total_seconds())
+        self.start = self.end - timedelta(seconds=self.span)
+        self.sentences = self.make_sentences(self.rng('sentences'))
+        self.created = {}
+
+    def rng(self, table):
+        # Свой генератор на таблицу: изменение объема одной таблицы не меняет остальные
+        return random.Random(f'{self.seed}:{table}')
+
+    @staticmethod
+    def make_sentences(rng):
+        sentences = []
+        for _ in range(SENTENCE_POOL):
+            words = rng.choices(WORDS, k=rng.randint(6, 16))
+            if rng.random() < CENSORED_SHARE:
+                words[rng.randrange(len(words))] = rng.choice(CENSORED_WORDS)
+            sentences.append(' '.join(words).capitalize() + '.')
+        return sentences
+
+    def text(self, rng, low, high):
+        return ' '.join(rng.choices(self.sentences, k=rng.randint(low, high)))
+
+    def post_time(self, index):
+        """Посты равномерно по времени в порядке id"""
+        return self.start + timedelta(seconds=self.span * index // self.counts['posts'])
+
+    def insert(self, model, objects):
+        """bulk_create пачками по batch_size, каждая пачка в своей транзакции"""
+        created = 0
+        objects = iter(objects)
+        while batch := list(itertools.islice(objects, self.batch_size)):
+            with transaction.atomic(), dump.keep_timestamps(model):
+                model.objects.bulk_create(batch)
+            # При DEBUG=True Django хранит текст запросов, а INSERT на пачку - мегабайты
+            reset_queries()
+            created += len(batch)
+            if self.progress:
+                self.progress(model._meta.label_lower, created)
+        self.created[model._meta.label_lower] = created
+        return created
+
+    # --- Таблицы ---
+
+    def users(self):
+        rng = self.rng('users')
+        password = make_password(PASSWORD)
+        for pk in range(self.user_id, self.user_id + self.counts['users']):
+            yield User(
+                pk=pk, username=f'corpus{pk}', email=f'corpus{pk}@example.com', password=password,
+                date_joined=self.start - timedelta(seconds=rng.randrange(self.span)),
+            )
+
+    def author_groups(self):
+        group, _ = Group.objects.get_or_create(name='authors')
+        for user_id in range(self.user_id, self.user_id + self.counts['authors']):
+            yield User.groups.through(user_id=user_id, group_id=group.pk)
+
+    def authors(self):
+        # Авторы - первые пользователи корпуса
+        for number in range(self.counts['authors']):
+            yield Author(pk=self.author_id + number, user_id=self.user_id + number)
+
+    def categories(self):
+        for number in range(self.counts['categories']):
+            pk = self.category_id + number
+            yield Category(pk=pk, name=f'{CATEGORY_NAMES[number % len(CATEGORY_NAMES)]} {pk}')
+
+    def posts(self):
+        rng = self.rng('posts')
+        author_ids = range(self.author_id, self.author_id + self.counts['authors'])
+        author_weights = zipf_weights(len(author_ids))
+        for number in range(self.counts['posts']):
+            created_at = self.post_time(number) + timedelta(seconds=rng.randrange(60))
+            yield Post(
+                pk=self.post_id + number,
+                author_id=rng.choices(author_ids, cum_weights=author_weights)[0],
+                post_type=Post.NEWS if rng.random() < 0.7 else Post.ARTICLE,
+                title=self.text(rng, 1, 1).rstrip('.')[:200],
+                content=self.text(rng, 3, 20),
+                rating=int(rng.gauss(0, 15)),
+                is_published=rng.random() > 0.03,
+                created_at=created_at,
+                updated_at=created_at,
+            )
+
+    def post_categories(self):
+        rng = self.rng('post_categories')
+        category_ids = range(self.category_id, self.category_id + self.counts['categories'])
+        weights = zipf_weights(len(category_ids))
+        for post_id in range(self.post_id, self.post_id + self.counts['posts']):
+            chosen = set(rng.choices(category_ids, cum_weights=weights, k=rng.randint(1, 3)))
+            for category_id in sorted(chosen):
+                yield PostCategory(post_id=post_id, category_id=category_id)
+
+    def comments(self):
+        rng = self.rng('comments')
+        posts = self.counts['posts']
+        for _ in range(self.counts['comments']):
+            index = posts - 1 - int(posts * rng.random() ** RECENT_COMMENTS_SKEW)
+            created_at = self.post_time(index) + timedelta(seconds=rng.randrange(3 * 24 * 3600))
+            yield Comment(
+                post_id=self.post_id + index,
+                user_id=self.user_id + rng.randrange(self.counts['users']),
+                text=self.text(rng, 1, 3),
+                created_at=min(created_at, self.end),
+                rating=int(rng.gauss(0, 3)),
+            )
+
+    def subscriptions(self):
+        rng = self.rng('subscriptions')
+        category_ids = range(self.category_id, self.category_id + self.counts['categories'])
+        weights = zipf_weights(len(category_ids))
+        for user_id in range(self.user_id, self.user_id + self.counts['users']):
+            chosen = set(rng.choices(category_ids, cum_weights=weights, k=rng.choice([0, 0, 1, 1, 2, 3])))
+            for category_id in sorted(chosen):
+                yield Subscription(
+                    user_id=user_id, category_id=category_id,
+                    subscribed_at=self.start + timedelta(seconds=rng.randrange(self.span)),
+                )
+
+    def run(self):
+        """Создает корпус и возвращает {модель: количество строк}"""
+        self.user_id = next_id(User)
+        self.author_id = next_id(Author)
+        self.category_id = next_id(Category)
+        self.post_id = next_id(Post)
+
+        self.insert(User, self.users())
+        self.insert(User.groups.through, self.author_groups())
+        self.insert(Author, self.authors())
+        self.insert(Category, self.categories())
+        self.insert(Post, self.posts())
+        self.insert(PostCategory, self.post_categories())
+        self.insert(Comment, self.comments())
+        self.insert(Subscription, self.subscriptions())
+
+        Author.reconcile_ratings()
+        dump.finish_load()
+        return self.created
@@ -0,0 +1,482 @@
+"""
+Потоковый экспорт и импорт данных портала (команды dumpnews / loadnews).
+
+Формат - JSON Lines в gzip: одна строка на объект в формате сериализаторов
+Django ({"model": ..., "pk": ..., "fields": {...}}). Модели идут в порядке
+зависимостей (DUMP_MODELS), ManyToMany пишутся отдельными строками своих
+промежуточных моделей (auth.user_groups, news.postcategory), поэтому ни экспорт,
+ни импорт не делают запросов на каждый объект.
+
+Экспорт читает таблицы через iterator(chunk_size=...), импорт читает файл
+построчно и пишет пачками через bulk_create - память не зависит от объема данных.
+Загрузка идет в пустую базу: конфликт первичного ключа - ошибка, а не пропущенная
+строка (дописать выгрузку в базу с данными - load(force=True)).
+
+bulk_create не отправляет сигналы сохранения: при импорте не сбрасывается кэш на
+каждый пост и не уходят письма подписчикам. Производные данные (CategoryStats,
+поисковый индекс, кэш) пересчитываются один раз в конце загрузки (finish_load).
+
+Группы сопоставляются по имени (у групп authors/common в разных базах разные id),
+права пользователей (user_permissions) не переносятся.
+
+Параллельный экспорт (dumpnews --workers N, dump_parallel) пишет каталог: большие
+таблицы (SHARDED_MODELS) делятся на N диапазонов pk, каждый диапазон - отдельный
+файл, который сериализует процесс пула. Все процессы читают один снимок базы:
+в PostgreSQL - снимок транзакции REPEATABLE READ (pg_export_snapshot / SET
+TRANSACTION SNAPSHOT), в SQLite - копия файла базы через backup API, сделанная
+в один момент. В конце пишется manifest.json: порядок файлов, число строк и
+sha256 каждого файла. loadnews принимает и файл, и такой каталог.
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core import serializers
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, reset_queries, transaction
+from django.utils import timezone
+
+DUMP_MODELS = [
+    'auth.group',
+    'auth.user',
+    'auth.user_groups',
+    'news.userprofile',
+    'news.author',
+    'news.category',
+    'news.subscription',
+    'news.post',
+    'news.postcategory',
+    'news.comment',
+]
+
+# Таблицы, которые при параллельном экспорте делятся на диапазоны pk
+SHARDED_MODELS = {'news.post', 'news.postcategory', 'news.comment'}
+
+DEFAULT_CHUNK_SIZE = 2000
+MANIFEST_NAME = 'manifest.json'
+
+
+class JSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder обрезает время до миллисекунд, для резервной копии нужны микросекунды"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def dump_fields(model):
+    """Обычные поля и внешние ключи модели, без ManyToMany"""
+    return [field.name for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def dump_queryset(label):
+    model = apps.get_model(label)
+    return model._default_manager.order_by('pk')
+
+
+def write_queryset(stream, queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Пишет объекты queryset в открытый текстовый поток, по строке на объект. Возвращает их количество"""
+    counter = CountingStream(stream)
+    serializers.serialize(
+        'jsonl', queryset.iterator(chunk_size=chunk_size), stream=counter,
+        fields=dump_fields(queryset.model), cls=JSONEncoder,
+    )
+    return counter.lines
+
+
+def dump(path, chunk_size=DEFAULT_CHUNK_SIZE, labels=DUMP_MODELS):
+    """Экспорт в path (.jsonl.gz). Возвращает {модель: количество объектов}"""
+    with gzip.open(path, 'wt', encoding='utf-8') as stream:
+        return {label: write_queryset(stream, dump_queryset(label), chunk_size) for label in labels}
+
+
+class CountingStream:
+    """Обертка над потоком, считающая записанные строки (объекты)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lines = 0
+
+    def write(self, data):
+        self.lines += data.count('\n')
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+# --- Параллельный экспорт ---
+
+# Снимок, который читает процесс пула (задается в init_worker)
+_worker_snapshot = None
+
+
+@contextmanager
+def snapshot(directory):
+    """
+    Согласованный снимок базы на время экспорта. Возвращает описание, по которому
+    процессы пула читают тот же снимок
+    """
+    if connection.vendor == 'sqlite':
+        path = os.path.join(directory, '.snapshot.sqlite3')
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        try:
+            connection.connection.backup(target)
+        finally:
+            target.close()
+        try:
+            yield {'vendor': 'sqlite', 'name': path}
+        finally:
+            os.remove(path)
+    elif connection.vendor == 'postgresql':
+        # Транзакция держит снимок открытым, пока процессы пула его читают
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            cursor.execute('SELECT pg_export_snapshot()')
+            yield {'vendor': 'postgresql', 'id': cursor.fetchone()[0]}
+    else:
+        raise NotImplementedError(f'Параллельный экспорт не поддерживается для {connection.vendor}')
+
+
+def init_worker(snapshot_info):
+    """
+    Инициализация процесса пула: Django и подключение к снимку. Поэтому модели в
+    модуле берутся через apps, а не импортом: модуль загружается до django.setup()
+    """
+    import django
+    django.setup()
+
+    global _worker_snapshot
+    _worker_snapshot = snapshot_info
+    if snapshot_info['vendor'] == 'sqlite':
+        connection.settings_dict['NAME'] = snapshot_info['name']
+
+
+@contextmanager
+def snapshot_transaction():
+    if _worker_snapshot is None or _worker_snapshot['vendor'] != 'postgresql':
+        yield
+        return
+    snapshot_id = _worker_snapshot['id']
+    # SET TRANSACTION не принимает параметры запроса, поэтому id проверяется
+    if not re.fullmatch(r'[0-9A-F-]+', snapshot_id):
+        raise ValueError(f'Некорректный id снимка: {snapshot_id}')
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        cursor.execute(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'")
+        yield
+
+
+def shard_bounds(queryset, shards):
+    """Диапазоны pk [от, до), делящие таблицу на shards частей примерно поровну"""
+    total = queryset.count()
+    if shards < 2 or total < shards:
+        return [(None, None)]
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    # Крайние диапазоны открыты: строки, добавленные после подсчета, тоже попадут в выгрузку
+    edges = [None, *(pks[total * number // shards] for number in range(1, shards)), None]
+    return list(zip(edges, edges[1:]))
+
+
+def shard_queryset(label, start=None, end=None):
+    queryset = dump_queryset(label)
+    if start is not None:
+        queryset = queryset.filter(pk__gte=start)
+    if end is not None:
+        queryset = queryset.filter(pk__lt=end)
+    return queryset
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dump_shard(task):
+    """Выполняется в процессе пула: пишет один файл и возвращает его запись манифеста"""
+    with snapshot_transaction(), gzip.open(task['path'], 'wt', encoding='utf-8') as stream:
+        rows = write_queryset(stream, shard_queryset(task['model'], task['start'], task['end']), task['chunk_size'])
+    return {
+        'file': os.path.basename(task['path']),
+        'model': task['model'],
+        'pk_range': [task['start'], task['end']],
+        'rows': rows,
+        'sha256': file_checksum(task['path']),
+    }
+
+
+def dump_parallel(directory, workers, chunk_size=DEFAULT_CHUNK_SIZE, labels=DUMP_MODELS):
+    """Экспорт в каталог процессами пула из одного снимка. Возвращает манифест"""
+    os.makedirs(directory, exist_ok=True)
+    with snapshot(directory) as snapshot_info:
+        tasks = []
+        for number, label in enumerate(labels):
+            bounds = shard_bounds(dump_queryset(label), workers) if label in SHARDED_MODELS else [(None, None)]
+            for shard, (start, end) in enumerate(bounds):
+                tasks.append({
+                    'model': label,
+                    'start': start,
+                    'end': end,
+                    'path': os.path.join(directory, f'{number:02d}-{label}-{shard:03d}.jsonl.gz'),
+                    'chunk_size': chunk_size,
+                })
+        # spawn, а не fork: дочерние процессы не должны унаследовать соединение с базой
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker,
+                                 initargs=(snapshot_info,)) as pool:
+            files = list(pool.map(dump_shard, tasks))
+
+    manifest = {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'snapshot': snapshot_info['vendor'],
+        'files': files,
+    }
+    with open(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def verify(path):
+    """Файлы каталога выгрузки, чья контрольная сумма не совпала с манифестом (или которых нет)"""
+    if not os.path.isdir(path):
+        return []
+    broken = []
+    for entry in read_manifest(path)['files']:
+        file_path = os.path.join(path, entry['file'])
+        if not os.path.exists(file_path) or file_checksum(file_path) != entry['sha256']:
+            broken.append(entry['file'])
+    return broken
+
+
+def dump_files(path):
+    """Файлы выгрузки по порядку загрузки: сам файл или файлы из манифеста каталога"""
+    if os.path.isdir(path):
+        return [os.path.join(path, entry['file']) for entry in read_manifest(path)['files']]
+    return [path]
+
+
+# --- Импорт ---
+
+def checkpoint_path(path):
+    return f'{path.rstrip(os.sep)}.checkpoint'
+
+
+def new_state():
+    # file - номер файла выгрузки, line - сколько его строк уже загружено
+    return {'file': 0, 'line': 0, 'groups': {}}
+
+
+def read_checkpoint(path):
+    try:
+        with open(checkpoint_path(path), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return new_state()
+
+
+
+def write_checkpoint(path, state):
+    # Через временный файл: оборванная запись не должна испортить контрольную точку
+    tmp_path = checkpoint_path(path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, checkpoint_path(path))
+
+
+def _read_lines(path, skip):
+    with gzip.open(path, 'rt', encoding='utf-8') as stream:
+        for number, line in enumerate(stream):
+            if number >= skip:
+                yield json.loads(line)
+
+
+def read_batches(path, batch_size, skip=0):
+    """
+    Пачки объектов одной модели подряд: (модель, [объекты], номер строки после пачки).
+    Первые skip строк пропускаются без разбора
+    """
+    batch = []
+    model = None
+    line = skip
+    for obj in serializers.deserialize('python', _read_lines(path, skip), ignorenonexistent=True):
+        if batch and (obj.object.__class__ is not model or len(batch) >= batch_size):
+            yield model, batch, line
+            batch = []
+        model = obj.object.__class__
+        batch.append(obj.object)
+        line += 1
+    if batch:
+        yield model, batch, line
+
+
+def load_groups(objects, group_ids):
+    """Группы ищутся и создаются по имени; group_ids запоминает id из файла -> id в базе"""
+    Group = apps.get_model('auth.group')
+    names = {group.name: group.pk for group in objects}
+    Group.objects.bulk_create([Group(name=name) for name in names], ignore_conflicts=True)
+    for name, pk in Group.objects.filter(name__in=names).values_list('name', 'pk'):
+        group_ids[str(names[name])] = pk
+
+
+@contextmanager
+def keep_timestamps(model):
+    """
+    bulk_create вызывает pre_save полей, и auto_now/auto_now_add заменили бы
+    заданные даты текущим временем - на время вставки эти флаги снимаются
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    flags = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in flags:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class TargetNotEmpty(Exception):
+    """В базе уже есть данные, а загрузка не должна молча пропускать конфликтующие строки"""
+
+
+def filled_models():
+    """Модели выгрузки, в таблицах которых уже есть строки (группы сопоставляются по имени и не в счет)"""
+    return [
+        label for label in DUMP_MODELS
+        if label != 'auth.group' and apps.get_model(label)._default_manager.exists()
+    ]
+
+
+def already_loaded(model, objects):
+    """Все строки пачки уже есть в базе: пачка зафиксирована, но контрольная точка не успела записаться"""
+    if model._meta.label_lower == 'auth.group':
+        # Группы загружаются по имени, повторная загрузка ничего не меняет
+        return False
+    pks = [obj.pk for obj in objects]
+    return model._default_manager.filter(pk__in=pks).count() == len(pks)
+
+
+def load_batch(model, objects, group_ids, force=False):
+    from . import roles
+
+    label = model._meta.label_lower
+    if label == 'auth.group':
+        load_groups(objects, group_ids)
+        return
+    if label == 'auth.user_groups':
+        for membership in objects:
+            membership.group_id = group_ids.get(str(membership.group_id), membership.group_id)
+        # Сигнал m2m_changed при bulk_create не срабатывает
+        user_ids = {membership.user_id for membership in objects}
+        transaction.on_commit(lambda: roles.invalidate(*user_ids))
+    # Без force конфликт первичного ключа - ошибка (IntegrityError), а не молча пропущенная строка;
+    # с force строки, которые уже есть в базе, остаются как есть
+    with keep_timestamps(model):
+        model._default_manager.bulk_create(objects, ignore_conflicts=force)
+
+
+def load(path, batch_size=DEFAULT_CHUNK_SIZE, resume=True, progress=None, force=False):
+    """
+    Загрузка из файла или каталога выгрузки с продолжением с контрольной точки
+    (path.checkpoint), которая обновляется после каждой зафиксированной пачки.
+    Новая загрузка требует пустой базы (TargetNotEmpty), force - дописать выгрузку
+    в непустую базу, пропуская уже существующие строки. Возвращает {модель: количество}
+    """
+    state = read_checkpoint(path) if resume else new_state()
+    resumed = bool(state['file'] or state['line'])
+    if not resumed and not force:
+        filled = filled_models()
+        if filled:
+            raise TargetNotEmpty(f'В базе уже есть данные: {", ".join(filled)}')
+    counts = {}
+    for number, file_path in enumerate(dump_files(path)):
+        if number < state['file']:
+            continue
+        skip = state['line'] if number == state['file'] else 0
+        for model, objects, line in read_batches(file_path, batch_size, skip=skip):
+            # Сбой мог случиться между фиксацией пачки и записью контрольной точки
+            if not (resumed and already_loaded(model, objects)):
+                with transaction.atomic():
+                    load_batch(model, objects, state['groups'], force=force)
+            resumed = False
+            # При DEBUG=True Django хранит текст запросов, а INSERT на пачку - мегабайты
+            reset_queries()
+            state.update(file=number, line=line)
+            write_checkpoint(path, state)
+            label = model._meta.label_lower
+            counts[label] = counts.get(label, 0) + len(objects)
+            if progress:
+                progress(label, counts[label], line)
+        state.update(file=number + 1, line=0)
+        write_checkpoint(path, state)
+    finish_load()
+    try:
+        os.remove(checkpoint_path(path))
+    except FileNotFoundError:
+        pass
+    return counts
+
+
+def finish_load():
+    """Пересчет того, что при обычном сохранении поддерживают сигналы"""
+    from . import search
+    from .models import CategoryStats, Post
+
+    reset_sequences()
+    CategoryStats.rebuild()
+    search.rebuild_index(Post.objects.all())
+    invalidate_caches()
+
+
+def invalidate_caches():
+    """
+    Сбрасывает записи кэша, зависящие от загруженных данных. cache.clear() не подходит:
+    он стер бы и то, чего нет в базе, - буфер голосов, счетчики лимита публикаций
+    """
+    from . import publish_limit, tagged_cache
+    from .models import Category, Post
+
+    tagged_cache.invalidate(
+        tagged_cache.list_tag(Post.NEWS), tagged_cache.list_tag(Post.ARTICLE), tagged_cache.categories_tag(),
+        *(tagged_cache.category_tag(pk) for pk in Category.objects.values_list('pk', flat=True)),
+    )
+    # Записи cached_compute без тегов
+    cache.delete_many(['categories', 'popular_posts'])
+    # Посты за последние сутки (в любом часовом поясе) входят в дневной лимит авторов
+    since = timezone.now() - datetime.timedelta(days=2)
+    user_ids = Post.objects.filter(created_at__gte=since).values_list('author__user_id', flat=True).distinct()
+    for user_id in user_ids:
+        publish_limit.invalidate(user_id)
+
+
+def reset_sequences():
+    """После вставки строк с явными id счетчики автоинкремента (PostgreSQL и др.) нужно сдвинуть"""
+    models = [apps.get_model(label) for label in DUMP_MODELS]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,136 @@
+#команда python manage.py benchmark_censor --words 5000 --repeat 20
+
+import random
+import re
+import timeit
+from html import unescape
+
+from django.core.management.base import BaseCommand
+from django.utils.html import strip_tags
+
+from news.censorship import CENSOR_ROOTS, FORBIDDEN_WORDS
+from news.templatetags.censor_filters import censor, censor_text, hide_forbidden
+
+SAMPLE_WORDS = [
+    'правительство', 'заявило', 'о', 'новых', 'мерах', 'поддержки', 'экономики',
+    'в', 'регионах', 'страны', 'эксперты', 'считают', 'что', 'решение', 'поможет',
+    'малому', 'бизнесу', 'и', 'повысит', 'доходы', 'граждан.', 'Однако,', 'по',
+    'мнению', 'аналитиков', 'эффект', 'будет', 'заметен', 'лишь', 'через', 'год!',
+    'Москва', 'Санкт-Петербург', '(по', 'данным', 'Росстата)', 'инфляция', 'снизилась',
+]
+DIRTY_WORDS = ['редиска', 'Секрет,', 'плохой', 'сука', 'пиздец', 'мудак!', 'конфиденциально.']
+
+
+# Реализация фильтров до перехода на CensorEngine, оставлена для сравнения
+def legacy_censor(value):
+    text = unescape(strip_tags(value))
+    result = []
+    for word in text.split():
+        clean_word = word.strip('.,!?;:"()[]').lower()
+        if clean_word in [fw.lower() for fw in FORBIDDEN_WORDS]:
+            if len(word) <= 2:
+                result.append('*' * len(word))
+            else:
+                result.append(word[0] + '*' * (len(word) - 2) + word[-1])
+        else:
+            censored = False
+            for root_pattern in CENSOR_ROOTS:
+                if re.search(root_pattern, word, re.IGNORECASE):
+                    if len(word) > 1:
+                        result.append(word[0] + '*' * (len(word) - 1))
+                        censored = True
+                        break
+            if not censored:
+                result.append(word)
+    return ' '.join(result)
+
+
+def legacy_censor_text(value):
+    value = unescape(value)
+    if '<' in value and '>' in value:
+        parts = re.split(r'(<[^>]+>)', value)
+        return ''.join(
+            part if part.startswith('<') and part.endswith('>') else legacy_censor(part)
+            for part in parts
+        )
+    return legacy_censor(value)
+
+
+def legacy_hide_forbidden(value):
+    value = unescape(value)
+
+    def process(text):
+        processed = []
+        for word in re.split(r'(\W+)', text):
+            if word.strip():
+                clean_word = word.strip('.,!?;:"()[]')
+                if clean_word.lower() in [fw.lower() for fw in FORBIDDEN_WORDS]:
+                    if len(word) <= 2:
+                        processed.append('*' * len(word))
+                    else:
+                        processed.append(word[0] + '*' * (len(word) - 2) + word[-1])
+                    continue
+            processed.append(word)
+        return ''.join(processed)
+
+    if '<' in value and '>' in value:
+        parts = re.split(r'(<[^>]+>)', value)
+        return ''.join(
+            part if part.startswith('<') and part.endswith('>') else process(part)
+            for part in parts
+        )
+    return process(value)
+
+
+def make_article(words_count, dirty_ratio, rng):
+    """Генерирует длинную HTML-статью на русском языке"""
+    paragraphs = []
+    words = []
+    for i in range(words_count):
+        source = DIRTY_WORDS if rng.random() < dirty_ratio else SAMPLE_WORDS
+        words.append(rng.choice(source))
+        if (i + 1) % 60 == 0:
+            paragraphs.append('<p>' + ' '.join(words) + '</p>')
+            words = []
+    if words:
+        paragraphs.append('<p>' + ' '.join(words) + '</p>')
+    return '\n'.join(paragraphs)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость фильтров цензуры с прежней реализацией'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, default=5000, help='Количество слов в статье')
+        parser.add_argument('--repeat', type=int, default=20, help='Количество прогонов')
+        parser.add_argument('--dirty-ratio', type=float, default=0.01,
+                            help='Доля запрещенных слов в тексте')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        repeat = options['repeat']
+        samples = {
+            'чистая статья': make_article(options['words'], 0, rng),
+            'статья с матом': make_article(options['words'], options['dirty_ratio'], rng),
+        }
+        filters = [
+            ('censor', legacy_censor, censor),
+            ('censor_text', legacy_censor_text, censor_text),
+            ('hide_forbidden', legacy_hide_forbidden, hide_forbidden),
+        ]
+
+        self.stdout.write(f'📊 Статья: {options["words"]} слов, прогонов: {repeat}')
+        for sample_name, text in samples.items():
+            self.stdout.write(f'\n📄 {sample_name}')
+            for name, old, new in filters:
+                if old(text) != new(text):
+                    self.stdout.write(self.style.ERROR(f'❌ {name}: результат отличается от прежнего'))
+                    continue
+                old_time = timeit.timeit(lambda: old(text), number=repeat) / repeat
+                new_time = timeit.timeit(lambda: new(text), number=repeat) / repeat
+                self.stdout.write(
+                    f'   {name:15} было {old_time * 1000:8.2f} мс, '
+                    f'стало {new_time * 1000:8.2f} мс, '
+                    f'ускорение x{old_time / new_time:.1f}'
+                )
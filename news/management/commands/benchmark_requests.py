@@ -0,0 +1,275 @@
+#команда python manage.py benchmark_requests [--rows 100000] [--iterations 50] [--baseline old.json]
+# Сквозной замер горячих страниц портала через тестовый клиент Django: списки новостей
+# и статей, страницы постов, поиск, создание новости, подписка и отписка.
+# Для каждой страницы - p50/p95 времени ответа, запросов к базе на запрос и пик памяти
+# (tracemalloc). Результат пишется в JSON; с --baseline сравнивается с прошлым замером,
+# и при регрессии больше --threshold команда завершается с ошибкой.
+#
+# Все изменения (корпус из --rows, созданные посты, подписки) делаются в транзакции,
+# которая в конце откатывается, но кэш после замера очищается целиком - запускайте
+# на отдельной базе для замеров, а не на рабочей.
+
+import json
+import math
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from news import corpus
+from news.models import Author, Category, Post, Subscription
+
+SEARCH_QUERIES = ['экономики', 'матч', 'закон', 'искусственный интеллект', 'курс рубля', 'премьера']
+DETAIL_POSTS = 100  # страницы скольких свежих постов открываются по кругу
+
+# Разница меньше этих значений - шум между запусками, а не регрессия
+NOISE_FLOOR = {'p50_ms': 1.0, 'p95_ms': 5.0, 'alloc_kb': 64}
+
+
+def percentile(values, share):
+    """Процентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Scenario:
+    """Запрос, повторяемый в замере; prepare(i) готовит данные вне замера времени"""
+
+    def __init__(self, name, client, method, url, data=None, prepare=None, expected=200):
+        self.name = name
+        self.client = client
+        self.method = method
+        self.url = url
+        self.data = data
+        self.prepare = prepare
+        self.expected = expected
+
+    def setup(self, iteration):
+        if self.prepare:
+            self.prepare(iteration)
+
+    def send(self, iteration):
+        """Выполняет запрос и возвращает время ответа в секундах"""
+        url = self.url(iteration)
+        data = self.data(iteration) if self.data else None
+        started = time.perf_counter()
+        response = getattr(self.client, self.method)(url, data)
+        elapsed = time.perf_counter() - started
+        if response.status_code != self.expected:
+            raise CommandError(f'{self.name}: {url} вернул {response.status_code}, ожидался {self.expected}')
+        return elapsed
+
+    def request(self, iteration):
+        self.setup(iteration)
+        return self.send(iteration)
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время ответа, запросы к базе и память горячих страниц портала'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=0, help='Сгенерировать корпус такого объема (generate_corpus) на время замера')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора корпуса')
+        parser.add_argument('--iterations', type=int, default=50, help='Замеров времени на страницу')
+        parser.add_argument('--warmup', type=int, default=3, help='Запросов на прогрев перед замером')
+        parser.add_argument('--profile-iterations', type=int, default=5, help='Запросов для подсчета SQL и памяти')
+        parser.add_argument('--only', nargs='+', help='Замерить только указанные страницы')
+        parser.add_argument('--output', help='Файл результатов (по умолчанию benchmark_<дата>.json)')
+        parser.add_argument('--baseline', help='Прошлый результат для сравнения')
+        parser.add_argument('--threshold', type=float, default=0.5, help='Допустимое ухудшение времени и памяти, доля (0.5 = 50%%)')
+
+    def handle(self, *args, **options):
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        # Лимит публикаций не должен остановить замер создания новостей, письма - в память
+        with override_settings(ALLOWED_HOSTS=hosts, POSTS_PER_DAY=10 ** 9,
+                               EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            with transaction.atomic():
+                try:
+                    report = self.run_benchmark(options)
+                finally:
+                    transaction.set_rollback(True)
+                    cache.clear()
+
+        path = options['output'] or f'benchmark_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.print_report(report)
+        self.stdout.write(f'Результаты: {path}')
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = self.compare(baseline['results'], report['results'], options['threshold'])
+            if regressions:
+                raise CommandError('Регрессия относительно базового замера:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('✓ Регрессий нет'))
+
+    def run_benchmark(self, options):
+        if options['rows']:
+            self.stdout.write(f'Генерация корпуса: {options["rows"]} строк...')
+            corpus.CorpusGenerator(options['rows'], seed=options['seed']).run()
+        if not Post.objects.exists():
+            raise CommandError('В базе нет постов: запустите generate_corpus или укажите --rows')
+
+        scenarios = self.build_scenarios()
+        if options['only']:
+            unknown = set(options['only']) - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError(f'Неизвестные страницы: {", ".join(sorted(unknown))}')
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['only']]
+
+        results = {}
+        for scenario in scenarios:
+            results[scenario.name] = self.measure(scenario, options)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'   {scenario.name}: {results[scenario.name]}')
+
+        return {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'posts': Post.objects.count(),
+                'rows': options['rows'],
+                'seed': options['seed'],
+                'iterations': options['iterations'],
+            },
+            'results': results,
+        }
+
+    def build_scenarios(self):
+        anonymous = Client()
+
+        author_user = User.objects.create_user('benchmark_author')
+        author_user.groups.add(Group.objects.get(name='authors'))
+        Author.objects.create(user=author_user)
+        author = Client()
+        author.force_login(author_user)
+
+        reader_user = User.objects.create_user('benchmark_reader')
+        reader = Client()
+        reader.force_login(reader_user)
+
+        news_ids = list(Post.objects.filter(post_type=Post.NEWS).order_by('-created_at')
+                        .values_list('pk', flat=True)[:DETAIL_POSTS])
+        article_ids = list(Post.objects.filter(post_type=Post.ARTICLE).order_by('-created_at')
+                           .values_list('pk', flat=True)[:DETAIL_POSTS])
+        category_ids = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+
+        def category(i):
+            return category_ids[i % len(category_ids)]
+
+        def ensure_subscribed(subscribed):
+            def prepare(i):
+                if subscribed:
+                    Subscription.objects.get_or_create(user=reader_user, category_id=category(i))
+                else:
+                    Subscription.objects.filter(user=reader_user, category_id=category(i)).delete()
+            return prepare
+
+        scenarios = [
+            Scenario('news_list', anonymous, 'get', lambda i: reverse('news_list')),
+            Scenario('article_list', anonymous, 'get', lambda i: reverse('article_list')),
+            Scenario('news_search', anonymous, 'get', lambda i: reverse('news_search'),
+                     data=lambda i: {'q': SEARCH_QUERIES[i % len(SEARCH_QUERIES)]}),
+        ]
+        if news_ids:
+            scenarios.append(Scenario('news_detail', anonymous, 'get',
+                                      lambda i: reverse('news_detail', args=[news_ids[i % len(news_ids)]])))
+        if article_ids:
+            scenarios.append(Scenario('article_detail', anonymous, 'get',
+                                      lambda i: reverse('article_detail', args=[article_ids[i % len(article_ids)]])))
+        # Пишущие сценарии последними: новые посты сбрасывают кэш списков
+        scenarios.append(Scenario(
+            'news_create', author, 'post', lambda i: reverse('news_create'), expected=302,
+            data=lambda i: {'title': f'Замер {i}', 'content': 'Текст новости для замера.', 'categories': [category(i)]},
+        ))
+        if category_ids:
+            scenarios += [
+                Scenario('subscribe', reader, 'post', lambda i: reverse('subscribe_to_category', args=[category(i)]),
+                         prepare=ensure_subscribed(False), expected=302),
+                Scenario('unsubscribe', reader, 'post', lambda i: reverse('unsubscribe_from_category', args=[category(i)]),
+                         prepare=ensure_subscribed(True), expected=302),
+            ]
+        return scenarios
+
+    def measure(self, scenario, options):
+        iteration = 0
+        for _ in range(options['warmup']):
+            scenario.request(iteration)
+            iteration += 1
+
+        timings = []
+        for _ in range(options['iterations']):
+            timings.append(scenario.request(iteration))
+            iteration += 1
+
+        # SQL и память отдельно: трассировка замедляет запросы и исказила бы время
+        queries = []
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(options['profile_iterations']):
+                scenario.setup(iteration)
+                with CaptureQueriesContext(connection) as captured:
+                    tracemalloc.reset_peak()
+                    before = tracemalloc.get_traced_memory()[0]
+                    scenario.send(iteration)
+                    peaks.append(tracemalloc.get_traced_memory()[1] - before)
+                queries.append(len(captured))
+                iteration += 1
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+            'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+            'queries': max(queries) if queries else None,
+            'alloc_kb': round(percentile(peaks, 0.5) / 1024, 1) if peaks else None,
+        }
+
+    @staticmethod
+    def compare(baseline, current, threshold):
+        """Список регрессий: время и память хуже порога (и шума), запросов к базе больше"""
+        regressions = []
+        for name, result in current.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            for metric, noise in NOISE_FLOOR.items():
+                old, new = base.get(metric), result[metric]
+                if old is not None and new is not None and new > old * (1 + threshold) and new - old > noise:
+                    regressions.append(f'{name}: {metric} {old} -> {new}')
+            if base.get('queries') is not None and result['queries'] is not None and result['queries'] > base['queries']:
+                regressions.append(f'{name}: queries {base["queries"]} -> {result["queries"]}')
+        return regressions
+
+    def print_report(self, report):
+        self.stdout.write(f'{"страница":<16}{"p50, мс":>10}{"p95, мс":>10}{"SQL":>6}{"память, КБ":>12}')
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f'{name:<16}{result["p50_ms"]:>10}{result["p95_ms"]:>10}{result["queries"]:>6}{result["alloc_kb"]:>12}'
+            )
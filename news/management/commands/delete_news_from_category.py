@@ -99,8 +99,8 @@ class Command(BaseCommand):
             # Проверяем существует ли категория в базе
             try:
                 category = Category.objects.get(id=id)
-                news_count = Post.objects.filter(categories=category, post_type='NW').count()
-                articles_count = Post.objects.filter(categories=category, post_type='AR').count()
-                self.stdout.write(f'   - {name} (ID: {id}) | 📰 Новостей: {news_count} | 📝 Статей: {articles_count}')
+                self.stdout.write(
+                    f'   - {name} (ID: {id}) | 📰 Новостей: {category.news_count} | 📝 Статей: {category.articles_count}'
+                )
             except Category.DoesNotExist:
                 self.stdout.write(f'   - {name} (ID: {id}) | ❌ Не найдена в базе')
\ No newline at end of file
@@ -0,0 +1,45 @@
+#команда python manage.py dumpnews [--output news.jsonl.gz] [--chunk-size 2000] [--workers N]
+# Потоковый экспорт пользователей, авторов, категорий, постов и комментариев
+# в gzip JSON Lines (news/dump.py); восстановление - loadnews.
+# С --workers N выгрузка пишется в каталог: большие таблицы делятся по диапазонам pk
+# между N процессами, все они читают один снимок базы, в конце - manifest.json
+
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from news import dump
+
+
+class Command(BaseCommand):
+    help = 'Экспортирует данные портала в сжатый JSON Lines без загрузки таблиц в память'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Файл выгрузки (по умолчанию news_<дата>.jsonl.gz, с --workers - каталог news_<дата>)')
+        parser.add_argument('--chunk-size', type=int, default=dump.DEFAULT_CHUNK_SIZE, help='Размер пачки строк из базы')
+        parser.add_argument('--workers', type=int, default=0, help='Параллельный экспорт в каталог N процессами')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        name = f'news_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+
+        started = time.monotonic()
+        if workers:
+            path = options['output'] or name
+            try:
+                manifest = dump.dump_parallel(path, workers, chunk_size=options['chunk_size'])
+            except NotImplementedError as e:
+                raise CommandError(str(e))
+            counts = {}
+            for entry in manifest['files']:
+                counts[entry['model']] = counts.get(entry['model'], 0) + entry['rows']
+        else:
+            path = options['output'] or f'{name}.jsonl.gz'
+            counts = dump.dump(path, chunk_size=options['chunk_size'])
+        elapsed = time.monotonic() - started
+
+        for label, count in counts.items():
+            self.stdout.write(f'   {label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Экспортировано объектов: {sum(counts.values())} за {elapsed:.1f} с -> {path}'
+        ))
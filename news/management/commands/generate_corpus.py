@@ -0,0 +1,39 @@
+#команда python manage.py generate_corpus --rows 1000000 [--seed 42] [--batch-size 5000] [--days 365]
+# Заполняет базу синтетическим корпусом (news/corpus.py) для замеров производительности:
+# пользователи, авторы, категории, посты с русским текстом, связи с категориями,
+# комментарии и подписки. Тот же seed и --rows дают те же данные
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from news import corpus
+
+
+class Command(BaseCommand):
+    help = 'Создает воспроизводимый синтетический корпус данных через bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help=f'Общий объем, строк (до {corpus.MAX_ROWS})')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=corpus.DEFAULT_BATCH_SIZE, help='Строк в одной вставке')
+        parser.add_argument('--days', type=int, default=365, help='За сколько дней до сегодня распределить посты')
+
+    def handle(self, *args, **options):
+        if not 0 < options['rows'] <= corpus.MAX_ROWS:
+            raise CommandError(f'--rows должен быть от 1 до {corpus.MAX_ROWS}')
+
+        def progress(label, count):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'   {label}: {count}')
+
+        generator = corpus.CorpusGenerator(
+            options['rows'], seed=options['seed'], batch_size=options['batch_size'],
+            days=options['days'], progress=progress,
+        )
+        started = time.monotonic()
+        created = generator.run()
+        elapsed = time.monotonic() - started
+
+        for label, count in created.items():
+            self.stdout.write(f'   {label}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'✓ Создано строк: {sum(created.values())} за {elapsed:.1f} с'))
@@ -0,0 +1,51 @@
+#команда python manage.py loadnews news.jsonl.gz|каталог [--batch-size 2000] [--restart] [--force]
+# Загружает выгрузку dumpnews пачками через bulk_create. После каждой пачки
+# пишется контрольная точка <файл>.checkpoint: прерванная загрузка при повторном
+# запуске продолжается с нее. Сигналы при загрузке не срабатывают, статистика
+# категорий, поисковый индекс и кэш пересчитываются один раз в конце.
+# Каталог параллельной выгрузки перед загрузкой сверяется с контрольными суммами манифеста.
+# Новая загрузка идет только в пустую базу; --force дописывает выгрузку в базу с данными,
+# оставляя строки с уже занятыми id как есть
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from news import dump
+
+
+class Command(BaseCommand):
+    help = 'Загружает выгрузку dumpnews с продолжением после сбоя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки .jsonl.gz или каталог с manifest.json')
+        parser.add_argument('--batch-size', type=int, default=dump.DEFAULT_CHUNK_SIZE, help='Объектов в одной вставке')
+        parser.add_argument('--restart', action='store_true', help='Игнорировать контрольную точку и начать сначала')
+        parser.add_argument('--force', action='store_true', help='Загружать в непустую базу, пропуская существующие строки')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        broken = dump.verify(path)
+        if broken:
+            raise CommandError(f'Файлы повреждены или отсутствуют: {", ".join(broken)}')
+
+        state = dump.read_checkpoint(path)
+        if (state['file'] or state['line']) and not options['restart']:
+            self.stdout.write(f'Продолжение с контрольной точки: файл {state["file"] + 1}, строка {state["line"]}')
+
+        def progress(label, count, line):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'   {label}: {count} (строка {line})')
+
+        started = time.monotonic()
+        try:
+            counts = dump.load(
+                path, batch_size=options['batch_size'], resume=not options['restart'],
+                progress=progress, force=options['force'],
+            )
+        except dump.TargetNotEmpty as e:
+            raise CommandError(f'{e}. Для загрузки в непустую базу укажите --force')
+        elapsed = time.monotonic() - started
+
+        for label, count in counts.items():
+            self.stdout.write(f'   {label}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'✓ Загружено объектов: {sum(counts.values())} за {elapsed:.1f} с'))
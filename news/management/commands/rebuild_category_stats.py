@@ -0,0 +1,12 @@
+#команда python manage.py rebuild_category_stats
+
+from django.core.management.base import BaseCommand
+from news.models import CategoryStats
+
+
+class Command(BaseCommand):
+    help = 'Полностью пересчитывает денормализованную статистику категорий'
+
+    def handle(self, *args, **options):
+        rebuilt = CategoryStats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✓ Статистика пересчитана для {len(rebuilt)} категорий'))
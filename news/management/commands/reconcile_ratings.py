@@ -0,0 +1,12 @@
+#команда python manage.py reconcile_ratings
+
+from django.core.management.base import BaseCommand
+from news.models import Author
+
+
+class Command(BaseCommand):
+    help = 'Полностью пересчитывает рейтинги всех авторов одним запросом'
+
+    def handle(self, *args, **options):
+        updated = Author.reconcile_ratings()
+        self.stdout.write(self.style.SUCCESS(f'✓ Рейтинги пересчитаны для {updated} авторов'))
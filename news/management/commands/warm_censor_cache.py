@@ -0,0 +1,25 @@
+#команда python manage.py warm_censor_cache
+# Запускать после изменения CENSOR_ROOTS/FORBIDDEN_WORDS: ключи кэша содержат
+# отпечаток списков, поэтому без прогрева первые просмотры будут считать цензуру заново
+
+from django.core.management.base import BaseCommand
+from news.censorship import engine, warm_censored_cache
+from news.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполняет кэш процензурированных заголовков и текстов постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Размер пачки постов')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.only('id', 'title', 'content', 'updated_at')
+        warmed = 0
+        for post in posts.iterator(chunk_size=options['chunk_size']):
+            warm_censored_cache(post)
+            warmed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ Кэш цензуры заполнен для {warmed} постов (списки {engine.lists_hash})')
+        )
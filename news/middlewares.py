@@ -1,15 +1,211 @@
-import pytz
-from django.utils import timezone
+"""
+TimezoneMiddleware - часовой пояс пользователя на время запроса.
+
+Пояс берется из сессии (переключатель в шапке, views.set_timezone), а если там
+ничего нет - из UserProfile.timezone авторизованного пользователя. Значение из
+профиля один раз записывается в сессию, так что профиль читается одним запросом
+за сессию. Имена проверяются по базе IANA и превращаются в закэшированные
+ZoneInfo (news/timezones.py); неизвестный пояс - пояс сайта по умолчанию.
+
+QueryInstrumentationMiddleware - учет SQL по представлениям: число запросов,
+время SQL, повторы (признак N+1), время представления и рендеринга. Пишется
+строкой key=value в журнал news.sql и заголовком Server-Timing; превышение
+бюджета из settings.SQL_BUDGETS (по имени URL) - предупреждение или исключение.
+
+Оба middleware умеют работать и синхронно, и асинхронно: под ASGI асинхронные
+представления вызываются без перехода в поток.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .models import UserProfile
+from .timezones import get_zone
+
+SESSION_KEY = 'django_timezone'
+
 
 class TimezoneMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        tzname = request.session.get('django_timezone')
-        if tzname:
-            timezone.activate(tzname)
+        if self.async_mode:
+            return self.__acall__(request)
+        tzname = request.session.get(SESSION_KEY)
+        if tzname is None and request.user.is_authenticated:
+            tzname = self.profile_timezone(request.user.pk)
+            request.session[SESSION_KEY] = tzname
+        self.activate(tzname)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        tzname = await request.session.aget(SESSION_KEY)
+        if tzname is None:
+            user = await request.auser()
+            if user.is_authenticated:
+                tzname = await self.aprofile_timezone(user.pk)
+                await request.session.aset(SESSION_KEY, tzname)
+        self.activate(tzname)
+        return await self.get_response(request)
+
+    @staticmethod
+    def activate(tzname):
+        zone = get_zone(tzname)
+        if zone is not None:
+            timezone.activate(zone)
         else:
             timezone.deactivate()
-        return self.get_response(request)
\ No newline at end of file
+
+    @staticmethod
+    def profile_timezone(user_id):
+        # Пустая строка, если профиля нет: повторно в базу за ним не ходим
+        return UserProfile.objects.filter(user_id=user_id).values_list('timezone', flat=True).first() or ''
+
+    @staticmethod
+    async def aprofile_timezone(user_id):
+        return await UserProfile.objects.filter(user_id=user_id).values_list('timezone', flat=True).afirst() or ''
+
+
+sql_logger = logging.getLogger('news.sql')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats:
+    """Запросы к базе за один HTTP-запрос (обертка connection.execute_wrapper)"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()  # (sql, параметры) - точные повторы
+        self.shapes = Counter()      # sql без параметров - один запрос в цикле (N+1)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.statements[(sql, repr(params))] += 1
+            self.shapes[sql] += 1
+
+    @property
+    def duplicates(self):
+        """Сколько запросов повторили уже выполненный запрос с теми же параметрами"""
+        return sum(count - 1 for count in self.statements.values())
+
+    @property
+    def repeated(self):
+        """Сколько раз выполнялся самый частый запрос (с любыми параметрами)"""
+        return max(self.shapes.values(), default=0)
+
+
+class QueryInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, started = QueryStats(), time.perf_counter()
+        with self.instrument(stats):
+            response = self.get_response(request)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        # Соединения Django свои в каждом потоке, а асинхронный ORM выполняет запросы
+        # в потоке sync_to_async(thread_sensitive=True) - обертка ставится там же
+        stats, started = QueryStats(), time.perf_counter()
+        stack = await sync_to_async(self.instrument)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, stats, started)
+
+    @staticmethod
+    def instrument(stats):
+        """Ставит обертку на все соединения текущего потока, снимается stack.close()"""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        return stack
+
+    def process_template_response(self, request, response):
+        # Представление отработало, дальше рендеринг шаблона
+        request._view_finished_at = time.perf_counter()
+        return response
+
+    def finish(self, request, response, stats, started):
+        finished = time.perf_counter()
+        view_finished = getattr(request, '_view_finished_at', finished)
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.view_name if match else None
+        metrics = {
+            'queries': stats.count,
+            'sql_ms': round(stats.seconds * 1000, 2),
+            'duplicates': stats.duplicates,
+            'repeated': stats.repeated,
+            'view_ms': round((view_finished - started) * 1000, 2),
+            'render_ms': round((finished - view_finished) * 1000, 2),
+            'total_ms': round((finished - started) * 1000, 2),
+        }
+        sql_logger.info(
+            'view=%s method=%s status=%s %s', url_name or '-', request.method, response.status_code,
+            ' '.join(f'{key}={value}' for key, value in metrics.items()),
+            extra={'url_name': url_name, 'sql_stats': metrics},
+        )
+        if getattr(settings, 'SQL_SERVER_TIMING', True):
+            response.headers['Server-Timing'] = self.server_timing(metrics)
+        # Ответ 5xx - представление упало, и запросы страницы ошибки (отладочная страница
+        # читает значения переменных) бюджету не подчиняются: исключение бюджета скрыло бы ошибку
+        if response.status_code < 500:
+            self.check_budget(url_name, metrics)
+        return response
+
+    @staticmethod
+    def server_timing(metrics):
+        return ', '.join([
+            f'sql;dur={metrics["sql_ms"]};desc="{metrics["queries"]} queries"',
+            f'view;dur={metrics["view_ms"]}',
+            f'render;dur={metrics["render_ms"]}',
+            f'total;dur={metrics["total_ms"]}',
+        ])
+
+    @staticmethod
+    def check_budget(url_name, metrics):
+        budget = getattr(settings, 'SQL_BUDGETS', {}).get(url_name)
+        if not budget:
+            return
+        exceeded = [
+            f'{key}={metrics[key]} > {limit}' for key, limit in budget.items()
+            if key in metrics and metrics[key] > limit
+        ]
+        if not exceeded:
+            return
+        message = f'Бюджет SQL представления {url_name} превышен: {", ".join(exceeded)}'
+        if getattr(settings, 'SQL_BUDGET_ACTION', 'log') == 'raise':
+            raise QueryBudgetExceeded(message)
+        sql_logger.warning(message, extra={'url_name': url_name, 'sql_stats': metrics})
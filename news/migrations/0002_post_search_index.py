@@ -0,0 +1,45 @@
+# Полнотекстовый индекс постов (SQLite FTS5), см. news/search.py
+
+from django.db import migrations
+
+# Схема таблицы зафиксирована здесь, а не берется из news/search.py: миграция
+# должна создавать ту же таблицу, что и в момент ее написания
+SEARCH_TABLE = 'news_post_search'
+CREATE_SEARCH_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    f"title, content, tokenize='unicode61 remove_diacritics 0')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    # to_index_text - чистая функция над текстом (стабильный API news/search.py), от моделей
+    # не зависит. Если стеммер изменится, индекс перестраивает rebuild_search_index
+    from news.search import to_index_text
+
+    schema_editor.execute(CREATE_SEARCH_TABLE)
+    Post = apps.get_model('news', 'Post')
+    rows = [
+        (pk, to_index_text(title), to_index_text(content))
+        for pk, title, content in Post.objects.values_list('pk', 'title', 'content').iterator()
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, title, content) VALUES (%s, %s, %s)', rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
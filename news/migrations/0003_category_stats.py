@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_category_stats(apps, schema_editor):
+    # Агрегат повторяет news.models.compute_category_stats на момент миграции:
+    # посты и подписчики считаются отдельно, чтобы JOIN не перемножал строки
+    Category = apps.get_model('news', 'Category')
+    CategoryStats = apps.get_model('news', 'CategoryStats')
+    categories = Category.objects.order_by()
+    stats = {
+        row.pop('pk'): row for row in categories.values('pk').annotate(
+            posts=models.Count('post'),
+            news=models.Count('post', filter=models.Q(post__post_type='NW')),
+            articles=models.Count('post', filter=models.Q(post__post_type='AR')),
+            last_post_at=models.Max('post__created_at'),
+        )
+    }
+    for row in categories.values('pk').annotate(subscribers=models.Count('subscription')):
+        stats[row['pk']]['subscribers'] = row['subscribers']
+    CategoryStats.objects.bulk_create([CategoryStats(category_id=pk, **row) for pk, row in stats.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0002_post_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='news.category', verbose_name='Category')),
+                ('posts', models.IntegerField(default=0, verbose_name='Posts')),
+                ('news', models.IntegerField(default=0, verbose_name='News')),
+                ('articles', models.IntegerField(default=0, verbose_name='Articles')),
+                ('subscribers', models.IntegerField(default=0, verbose_name='Subscribers')),
+                ('last_post_at', models.DateTimeField(blank=True, null=True, verbose_name='Last post at')),
+            ],
+            options={
+                'verbose_name': 'Category statistics',
+                'verbose_name_plural': 'Category statistics',
+            },
+        ),
+        migrations.RunPython(fill_category_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Индексы под горячие запросы постов и уникальность связи пост-категория
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def remove_duplicate_post_categories(apps, schema_editor):
+    """
+    Перед уникальным ограничением оставляем по одной связи на пару (пост, категория).
+    Дубли учтены в CategoryStats (миграция 0003), а delete() без сигналов, поэтому
+    счетчики затронутых категорий пересчитываются здесь же
+    """
+    PostCategory = apps.get_model('news', 'PostCategory')
+    Category = apps.get_model('news', 'Category')
+    CategoryStats = apps.get_model('news', 'CategoryStats')
+    keep = PostCategory.objects.values('post', 'category').annotate(first=models.Min('id')).values_list('first', flat=True)
+    duplicates = PostCategory.objects.exclude(id__in=list(keep))
+    category_ids = set(duplicates.values_list('category_id', flat=True))
+    if not category_ids:
+        return
+    duplicates.delete()
+
+    # Подписчики от дублей не зависят - пересчитываются только счетчики постов
+    rows = Category.objects.filter(pk__in=category_ids).order_by().values('pk').annotate(
+        posts=models.Count('post'),
+        news=models.Count('post', filter=models.Q(post__post_type='NW')),
+        articles=models.Count('post', filter=models.Q(post__post_type='AR')),
+        last_post_at=models.Max('post__created_at'),
+    )
+    for row in rows:
+        pk = row.pop('pk')
+        CategoryStats.objects.update_or_create(category_id=pk, defaults=row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0004_post_widget_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_post_categories, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['post_type', '-created_at', '-id'], name='news_post_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'created_at'], name='news_post_author_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='postcategory',
+            constraint=models.UniqueConstraint(fields=('post', 'category'), name='news_postcategory_unique'),
+        ),
+        # Индексы внешних ключей удаляются после того, как их покрыли составные индексы
+        migrations.AlterField(
+            model_name='post',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='news.author', verbose_name='Author'),
+        ),
+        migrations.AlterField(
+            model_name='postcategory',
+            name='post',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='news.post', verbose_name='Post'),
+        ),
+    ]
@@ -1,30 +1,57 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from . import tagged_cache, votes
 
 
 class Author(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name=_('User'))
     rating = models.IntegerField(default=0, verbose_name=_('Rating'))
 
+    # Веса рейтинга: рейтинг статей ×3, комментарии автора ×1, комментарии к его статьям ×1
+    POST_RATING_WEIGHT = 3
+    COMMENT_RATING_WEIGHT = 1
+    POST_COMMENT_RATING_WEIGHT = 1
+
+    @classmethod
+    def rating_expression(cls):
+        """Выражение для полного пересчета рейтинга одним UPDATE по всем авторам"""
+        post_rating = Post.objects.filter(author=OuterRef('pk')).order_by().values('author').annotate(
+            total=Sum('rating')
+        ).values('total')
+        comment_rating = Comment.objects.filter(user=OuterRef('user')).order_by().values('user').annotate(
+            total=Sum('rating')
+        ).values('total')
+        post_comment_rating = Comment.objects.filter(post__author=OuterRef('pk')).order_by().values(
+            'post__author'
+        ).annotate(total=Sum('rating')).values('total')
+
+        return (
+            Coalesce(Subquery(post_rating), 0) * cls.POST_RATING_WEIGHT
+            + Coalesce(Subquery(comment_rating), 0) * cls.COMMENT_RATING_WEIGHT
+            + Coalesce(Subquery(post_comment_rating), 0) * cls.POST_COMMENT_RATING_WEIGHT
+        )
+
+    @classmethod
+    def reconcile_ratings(cls):
+        """Полностью пересчитывает рейтинги всех авторов одним запросом"""
+        return cls.objects.update(rating=cls.rating_expression())
+
+    @classmethod
+    def add_rating(cls, delta, **lookup):
+        """Атомарно меняет рейтинг автора на delta (F-выражение, без гонок)"""
+        if delta:
+            cls.objects.filter(**lookup).update(rating=F('rating') + delta)
+
     def update_rating(self):
         """Обновляет рейтинг автора"""
-        # Суммарный рейтинг статей автора × 3
-        post_rating = self.post_set.aggregate(pr=Sum('rating'))['pr'] or 0
-        post_rating *= 3
-
-        # Суммарный рейтинг комментариев автора
-        comment_rating = self.user.comment_set.aggregate(cr=Sum('rating'))['cr'] or 0
-
-        # Суммарный рейтинг комментариев к статьям автора
-        from .models import Comment  # Локальный импорт для избежания циклических зависимостей
-        post_comment_rating = Comment.objects.filter(post__author=self).aggregate(pcr=Sum('rating'))['pcr'] or 0
-
-        self.rating = post_rating + comment_rating + post_comment_rating
-        self.save()
+        Author.objects.filter(pk=self.pk).update(rating=self.rating_expression())
+        self.refresh_from_db(fields=['rating'])
 
     def __str__(self):
         return self.user.username
@@ -44,20 +71,33 @@ class Category(models.Model):
         verbose_name=_('Subscribers')
     )
 
+    def get_stats(self):
+        """Статистика категории (для списков загружайте ее через select_related('stats'))"""
+        try:
+            return self.stats
+        except CategoryStats.DoesNotExist:
+            self.stats = CategoryStats.rebuild([self.pk])[0]
+            return self.stats
+
     @property
     def post_count(self):
         """Количество постов в категории"""
-        return self.post_set.count()
+        return self.get_stats().posts
 
     @property
     def news_count(self):
         """Количество новостей в категории"""
-        return self.post_set.filter(post_type='NW').count()
+        return self.get_stats().news
 
     @property
     def articles_count(self):
         """Количество статей в категории"""
-        return self.post_set.filter(post_type='AR').count()
+        return self.get_stats().articles
+
+    @property
+    def subscriber_count(self):
+        """Количество подписчиков категории"""
+        return self.get_stats().subscribers
 
     class Meta:
         verbose_name = _('Category')
@@ -67,6 +107,111 @@ class Category(models.Model):
         return self.name
 
 
+def compute_category_stats(categories):
+    """
+    Считает статистику категорий из queryset двумя агрегирующими запросами
+    (посты и подписчики отдельно, чтобы JOIN не перемножал строки)
+    """
+    stats = {
+        row['pk']: row for row in categories.order_by().values('pk').annotate(
+            posts=Count('post'),
+            news=Count('post', filter=Q(post__post_type='NW')),
+            articles=Count('post', filter=Q(post__post_type='AR')),
+            last_post_at=Max('post__created_at'),
+        )
+    }
+    for row in categories.order_by().values('pk').annotate(subscribers=Count('subscription')):
+        stats[row['pk']]['subscribers'] = row['subscribers']
+    return stats
+
+
+class CategoryStats(models.Model):
+    """
+    Денормализованные счетчики категории, чтобы списки категорий и админка
+    не делали COUNT на каждую строку. Поддерживаются сигналами Post, PostCategory
+    и Subscription в той же транзакции, что и изменение; полный пересчет -
+    команда rebuild_category_stats
+    """
+    STAT_FIELDS = ['posts', 'news', 'articles', 'subscribers', 'last_post_at']
+
+    category = models.OneToOneField(
+        Category,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name=_('Category')
+    )
+    posts = models.IntegerField(default=0, verbose_name=_('Posts'))
+    news = models.IntegerField(default=0, verbose_name=_('News'))
+    articles = models.IntegerField(default=0, verbose_name=_('Articles'))
+    subscribers = models.IntegerField(default=0, verbose_name=_('Subscribers'))
+    last_post_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Last post at'))
+
+    class Meta:
+        verbose_name = _('Category statistics')
+        verbose_name_plural = _('Category statistics')
+
+    def __str__(self):
+        return f"{self.category_id}: {self.posts}"
+
+    @classmethod
+    def rebuild(cls, category_ids=None):
+        """Пересчитывает статистику категорий (всех, если category_ids не задан)"""
+        categories = Category.objects.all()
+        if category_ids is not None:
+            categories = categories.filter(pk__in=category_ids)
+        rows = [
+            cls(category_id=pk, **{field: row[field] for field in cls.STAT_FIELDS})
+            for pk, row in compute_category_stats(categories).items()
+        ]
+        return cls.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['category'], update_fields=cls.STAT_FIELDS
+        )
+
+    @classmethod
+    def _apply(cls, category_ids, **updates):
+        # Категории без строки статистики пропускаются: Category.get_stats() посчитает их с нуля
+        category_ids = list(category_ids)
+        if category_ids:
+            cls.objects.filter(category_id__in=category_ids).update(**updates)
+
+    @classmethod
+    def add_post(cls, category_ids, post_type, created_at):
+        """Пост добавлен в категории: счетчики через F(), без гонок"""
+        type_field = 'news' if post_type == Post.NEWS else 'articles'
+        cls._apply(
+            category_ids,
+            posts=F('posts') + 1,
+            **{type_field: F(type_field) + 1},
+            last_post_at=Greatest(Coalesce('last_post_at', Value(created_at)), Value(created_at)),
+        )
+
+    @classmethod
+    def remove_post(cls, category_ids, post_type):
+        """Пост убран из категорий: дата последнего поста берется из оставшихся"""
+        type_field = 'news' if post_type == Post.NEWS else 'articles'
+        last_post_at = PostCategory.objects.filter(category=OuterRef('pk')).order_by().values(
+            'category'
+        ).annotate(last=Max('post__created_at')).values('last')
+        cls._apply(
+            category_ids,
+            posts=F('posts') - 1,
+            **{type_field: F(type_field) - 1},
+            last_post_at=Subquery(last_post_at),
+        )
+
+    @classmethod
+    def change_post_type(cls, category_ids, old_type, new_type):
+        old_field = 'news' if old_type == Post.NEWS else 'articles'
+        new_field = 'news' if new_type == Post.NEWS else 'articles'
+        if old_field != new_field:
+            cls._apply(category_ids, **{old_field: F(old_field) - 1, new_field: F(new_field) + 1})
+
+    @classmethod
+    def add_subscribers(cls, category_id, delta):
+        cls._apply([category_id], subscribers=F('subscribers') + delta)
+
+
 class Subscription(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_('User'))
     category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name=_('Category'))
@@ -81,6 +226,31 @@ class Subscription(models.Model):
         return f"{self.user.username} - {self.category.name}"
 
 
+class PostQuerySet(models.QuerySet):
+    """Готовые выборки постов без N+1 запросов в шаблонах"""
+
+    def _with_author_and_categories(self):
+        # Автор одним JOIN, категории всех постов выборки одним запросом
+        return self.select_related('author__user').prefetch_related(
+            models.Prefetch('categories', queryset=Category.objects.only('id', 'name'))
+        )
+
+    def for_listing(self):
+        """
+        Для списков: автор и категории без N+1. content не откладывается - при промахе
+        кэша фрагмента превью поста цензурируется из него
+        """
+        return self._with_author_and_categories()
+
+    def for_detail(self):
+        """Для детальной страницы: автор, категории и полный текст поста"""
+        return self._with_author_and_categories()
+
+    def headlines(self):
+        """Для виджетов и главной страницы: без тяжелого поля content"""
+        return self.select_related('author__user').defer('content')
+
+
 class Post(models.Model):
     ARTICLE = 'AR'
     NEWS = 'NW'
@@ -92,6 +262,7 @@ class Post(models.Model):
     author = models.ForeignKey(
         Author,
         on_delete=models.CASCADE,
+        db_index=False,  # Покрывается индексом (author, created_at)
         verbose_name=_('Author')
     )
     post_type = models.CharField(
@@ -127,15 +298,35 @@ class Post(models.Model):
         verbose_name=_('Is published')
     )
 
+    objects = PostQuerySet.as_manager()
+
     def like(self):
         """Увеличивает рейтинг на 1"""
-        self.rating += 1
-        self.save()
+        self.change_rating(1)
 
     def dislike(self):
         """Уменьшает рейтинг на 1"""
-        self.rating -= 1
-        self.save()
+        self.change_rating(-1)
+
+    def change_rating(self, delta):
+        """
+        Меняет рейтинг поста. Обновляется только поле rating через F(),
+        поэтому одновременные голоса не теряются и content не перезаписывается
+        """
+        if votes.is_buffered():
+            votes.buffer_vote(self, delta)
+        else:
+            Post.apply_rating_delta(self.pk, delta)
+        self.rating += delta
+
+    @classmethod
+    def apply_rating_delta(cls, pk, delta):
+        """Атомарно применяет изменение рейтинга к посту и его автору"""
+        with transaction.atomic():
+            cls.objects.filter(pk=pk).update(rating=F('rating') + delta)
+            Author.add_rating(delta * Author.POST_RATING_WEIGHT, post__pk=pk)
+            # update() не вызывает post_save, а рейтинг показывается в закэшированных карточках
+            transaction.on_commit(lambda: tagged_cache.invalidate(tagged_cache.post_tag(pk)))
 
     def preview(self):
         """Возвращает превью контента"""
@@ -174,12 +365,24 @@ class Post(models.Model):
         verbose_name = _('Post')
         verbose_name_plural = _('Posts')
         ordering = ['-created_at']
+        indexes = [
+            # Списки новостей/статей: тип + курсорная сортировка. is_published в индекс не входит:
+            # Django сравнивает булево поле как голую колонку (WHERE is_published), и SQLite
+            # не может использовать ее как равенство в середине индекса - сортировка ушла бы в temp b-tree
+            models.Index(fields=['post_type', '-created_at', '-id'], name='news_post_list_idx'),
+            # Лимит публикаций автора за день; заменяет обычный индекс внешнего ключа author
+            models.Index(fields=['author', 'created_at'], name='news_post_author_created_idx'),
+            # Виджеты последних и популярных постов (news_tags), фильтр "только популярные"
+            models.Index(fields=['-created_at'], name='news_post_created_idx'),
+            models.Index(fields=['-rating'], name='news_post_rating_idx'),
+        ]
 
 
 class PostCategory(models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
+        db_index=False,  # Покрывается уникальным индексом (post, category)
         verbose_name=_('Post')
     )
     category = models.ForeignKey(
@@ -191,6 +394,9 @@ class PostCategory(models.Model):
     class Meta:
         verbose_name = _('Post Category')
         verbose_name_plural = _('Post Categories')
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'category'], name='news_postcategory_unique'),
+        ]
 
     def __str__(self):
         return f"{self.post.title} - {self.category.name}"
@@ -223,13 +429,29 @@ class Comment(models.Model):
 
     def like(self):
         """Увеличивает рейтинг комментария на 1"""
-        self.rating += 1
-        self.save()
+        self.change_rating(1)
 
     def dislike(self):
         """Уменьшает рейтинг комментария на 1"""
-        self.rating -= 1
-        self.save()
+        self.change_rating(-1)
+
+    def change_rating(self, delta):
+        """Меняет рейтинг комментария (атомарно или через буфер голосов)"""
+        if votes.is_buffered():
+            votes.buffer_vote(self, delta)
+        else:
+            Comment.apply_rating_delta(self.pk, delta)
+        self.rating += delta
+
+    @classmethod
+    def apply_rating_delta(cls, pk, delta):
+        """Атомарно меняет рейтинг комментария, его автора и автора статьи"""
+        with transaction.atomic():
+            cls.objects.filter(pk=pk).update(rating=F('rating') + delta)
+            # Автор комментария (если пользователь является автором)
+            Author.add_rating(delta * Author.COMMENT_RATING_WEIGHT, user__comment__pk=pk)
+            # Автор статьи, к которой оставлен комментарий
+            Author.add_rating(delta * Author.POST_COMMENT_RATING_WEIGHT, post__comment__pk=pk)
 
     @property
     def short_text(self):
@@ -0,0 +1,145 @@
+"""
+Кэш целых страниц списков и постов.
+
+Страница рендерится один раз как общий "каркас": все персональные части
+(меню пользователя, формы с CSRF-токеном, текущее время, сообщения, кнопки
+автора и подписки) помечены в шаблонах тегом {% hole %} и в каркасе остаются
+метками <!--hole:<секрет>:...-->. Каркас хранится в кэше с тегами зависимостей
+(news/tagged_cache.py), а на каждый запрос метки заполняются маленькими
+шаблонами из templates/news/holes/ - как ESI на прокси.
+
+Ключ каркаса: полный путь с параметрами, язык, часовой пояс и тема (день/ночь).
+Пока каркас в кэше, анонимный запрос не обращается к базе.
+
+В метке есть секрет, выведенный из SECRET_KEY: текст поста попадает в каркас
+без экранирования комментариев, и без секрета автор мог бы вставить в пост свою
+метку и заставить страницу рендерить любой шаблон с его параметрами.
+"""
+import functools
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.template import engines
+from django.template.loader import get_template
+from django.utils.crypto import salted_hmac
+from django.utils import timezone
+from django.utils.translation import get_language
+
+from . import tagged_cache
+
+
+@functools.cache
+def hole_prefix():
+    secret = salted_hmac('news.page_cache.hole', 'marker').hexdigest()[:32]
+    return f'<!--hole:{secret}:'
+
+
+@functools.cache
+def hole_re():
+    return re.compile(re.escape(hole_prefix()) + r'(.*?)-->')
+
+
+def hole_marker(template_name, params):
+    data = json.dumps({'template': template_name, 'params': params}, ensure_ascii=False)
+    # Внутри HTML-комментария не должно оказаться "-->"
+    data = data.replace('>', '\\u003e')
+    return f'{hole_prefix()}{data}-->'
+
+
+def is_night(now=None):
+    """Та же граница, что и у темы в default.html"""
+    hour = (now or timezone.now()).hour
+    return hour >= 19 or hour <= 7
+
+
+def page_cache_timeout():
+    return getattr(settings, 'PAGE_CACHE_SECONDS', 0)
+
+
+def is_cacheable(request):
+    return request.method in ('GET', 'HEAD') and page_cache_timeout() > 0
+
+
+def page_cache_key(request):
+    parts = [
+        request.get_full_path(),
+        get_language(),
+        timezone.get_current_timezone_name(),
+        'night' if is_night() else 'day',
+    ]
+    return 'page:' + hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def hole_context(request, extra_context=None):
+    """Контекст для заполнения меток: один раз на запрос, а не на каждую метку"""
+    context = {}
+    for processor in engines['django'].engine.template_context_processors:
+        context.update(processor(request))
+    context.update(extra_context or {})
+    return context
+
+
+def render_holes(request, shell, extra_context=None):
+    """Заполняет метки каркаса персональными частями для текущего пользователя"""
+    if hole_prefix() not in shell:
+        return shell
+    context = hole_context(request, extra_context)
+
+    def fill(match):
+        data = json.loads(match.group(1))
+        return get_template(data['template']).render({**context, **data['params']})
+
+    return hole_re().sub(fill, shell)
+
+
+class CachedPageMixin:
+    """
+    Кэш страницы для ListView/DetailView постов. page_cache_tags - теги,
+    известные до запроса к базе (список), теги показанных постов добавляются после рендера
+    """
+    page_cache_tags = ()
+
+    def get_page_cache_tags(self):
+        tags = list(self.page_cache_tags)
+        if 'pk' in self.kwargs:
+            tags.append(tagged_cache.post_tag(self.kwargs['pk']))
+        return tags
+
+    def get_rendered_page_tags(self, context):
+        if context.get('object') is not None:
+            return tagged_cache.post_tags(context['object'])
+        tags = []
+        for post in context.get('object_list') or []:
+            tags += tagged_cache.post_tags(post)
+        return tags
+
+    def get_hole_context(self):
+        """Дополнительные данные для меток (например, подписки пользователя)"""
+        return {}
+
+    def get(self, request, *args, **kwargs):
+        if not is_cacheable(request):
+            return super().get(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        shell = tagged_cache.get_entry(key)
+        status = 'hit'
+        if shell is None:
+            status = 'miss'
+            versions = tagged_cache.snapshot(self.get_page_cache_tags())
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response.context_data['page_shell'] = True
+            shell = response.render().content.decode(response.charset)
+            tagged_cache.set_entry(
+                key, shell, self.get_rendered_page_tags(response.context_data),
+                versions=versions, timeout=page_cache_timeout()
+            )
+
+        response = HttpResponse(render_holes(request, shell, self.get_hole_context()))
+        response['X-Page-Cache'] = status
+        return response
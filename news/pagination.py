@@ -0,0 +1,169 @@
+"""
+Пагинация списков постов.
+
+Keyset (курсорная) пагинация выбирает страницу условием по (created_at, id)
+вместо OFFSET, поэтому 5000-я страница стоит столько же, сколько первая.
+Ссылки на соседние страницы передаются непрозрачными токенами ?after=/?before=.
+Общее количество постов берется из кэша, а не считается COUNT(*) на каждой странице.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from . import tagged_cache
+
+COUNT_CACHE_TIMEOUT = 60
+
+
+def encode_cursor(post):
+    """Превращает позицию поста в списке в непрозрачный токен"""
+    raw = json.dumps([post.created_at.isoformat(), post.pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (created_at, id) из токена или None, если токен испорчен"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, pk = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def cached_count(queryset, cache_key, timeout=COUNT_CACHE_TIMEOUT, tags=None):
+    """
+    Количество объектов из кэша. Без тегов COUNT(*) выполняется не чаще раза в timeout секунд,
+    с тегами значение точное: оно сбрасывается при изменении постов списка
+    """
+    if tags:
+        return tagged_cache.get_or_set(cache_key, queryset.count, tags)
+    return cache.get_or_set(cache_key, queryset.count, timeout)
+
+
+class CachedCountPaginator(Paginator):
+    """Обычный Paginator, который берет count из кэша"""
+
+    def __init__(self, object_list, per_page, count_cache_key=None, count_cache_tags=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_cache_key = count_cache_key
+        self.count_cache_tags = count_cache_tags
+
+    @cached_property
+    def count(self):
+        if self.count_cache_key is None:
+            return super().count
+        return cached_count(self.object_list, self.count_cache_key, tags=self.count_cache_tags)
+
+
+class KeysetPage:
+    """Страница курсорной пагинации (интерфейс похож на django.core.paginator.Page)"""
+    is_keyset = True
+
+    def __init__(self, object_list, count, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.count = count
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginate_keyset(queryset, per_page, after=None, before=None, count=None):
+    """
+    Возвращает KeysetPage для queryset, упорядоченного по (-created_at, -id).
+    after - токен последнего поста предыдущей страницы (листаем к старым постам),
+    before - токен первого поста следующей страницы (листаем к новым постам).
+    """
+    after = decode_cursor(after) if after else None
+    before = decode_cursor(before) if before else None
+
+    if before:
+        created_at, pk = before
+        rows = list(queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        ).order_by('created_at', 'id')[:per_page + 1])
+        has_more_newer = len(rows) > per_page
+        object_list = rows[:per_page][::-1]
+        has_more_older = True
+    else:
+        if after:
+            created_at, pk = after
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        rows = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+        has_more_older = len(rows) > per_page
+        object_list = rows[:per_page]
+        has_more_newer = after is not None
+
+    next_cursor = encode_cursor(object_list[-1]) if object_list and has_more_older else None
+    previous_cursor = encode_cursor(object_list[0]) if object_list and has_more_newer else None
+    return KeysetPage(object_list, count, next_cursor, previous_cursor)
+
+
+class PostPaginationMixin:
+    """
+    Пагинация для ListView постов. Режим задается POST_LIST_PAGINATION:
+    'keyset' - курсорная пагинация, 'offset' - обычные номера страниц.
+    В обоих режимах общее количество берется из кэша.
+    """
+    count_cache_key = None
+    count_cache_tags = None
+
+    def get_pagination_mode(self):
+        return getattr(settings, 'POST_LIST_PAGINATION', 'keyset')
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return CachedCountPaginator(
+            queryset, per_page, count_cache_key=self.count_cache_key, count_cache_tags=self.count_cache_tags,
+            orphans=orphans, allow_empty_first_page=allow_empty_first_page, **kwargs
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() != 'keyset':
+            return super().paginate_queryset(queryset, page_size)
+
+        page = paginate_keyset(
+            queryset,
+            page_size,
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+            count=cached_count(
+                queryset, self.count_cache_key, tags=self.count_cache_tags
+            ) if self.count_cache_key else None,
+        )
+        return None, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get('page_obj')
+        if page is None:
+            context['total_count'] = len(context['object_list'])
+        elif getattr(page, 'is_keyset', False):
+            context['total_count'] = page.count
+        else:
+            context['total_count'] = page.paginator.count
+        return context
@@ -0,0 +1,151 @@
+"""
+Лимит публикаций автора за день (POSTS_PER_DAY, по умолчанию 3).
+
+Счетчик постов автора за текущие сутки лежит в кэше:
+    tagged:publish_limit:<user_id>:<дата>:<часовой пояс>:...
+"Сутки" считаются в часовом поясе пользователя (текущем активном), поэтому
+пояс входит в ключ. При промахе счетчик создается одним COUNT по индексу
+(author, created_at), дальше проверка и резервирование места - один cache.incr:
+из двух одновременных отправок формы лимит пройдет только одна (при атомарном
+incr, как у Redis/memcached).
+
+Посты, созданные в обход формы (админка, shell), и удаленные посты сбрасывают
+счетчик через тег publish_limit:<user_id> (news/signals.py), и он пересчитывается
+из базы.
+
+На кэше без атомарного incr (файловый) две одновременные отправки могут обе
+пройти reserve(), поэтому форма еще раз проверяет лимит по базе в транзакции
+сохранения поста (confirm): строка автора блокируется, посты за сутки
+пересчитываются. Одновременные публикации одного автора проходят эту проверку
+по очереди.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from . import tagged_cache
+
+# Запас, чтобы счетчик не истек ровно на границе суток
+EXPIRY_MARGIN = 60 * 60
+
+
+def daily_limit():
+    return getattr(settings, 'POSTS_PER_DAY', 3)
+
+
+def user_tag(user_id):
+    return f'publish_limit:{user_id}'
+
+
+def day_bounds(now=None):
+    """Начало текущих и следующих суток в часовом поясе пользователя"""
+    local_now = timezone.localtime(now)
+    start = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Полночь следующего дня заново привязывается к поясу: при переходе на летнее время сутки не 24 часа
+    end = timezone.make_aware((start + timedelta(days=1)).replace(tzinfo=None))
+    return start, end
+
+
+def _counter_key(user_id, day_start):
+    key = f'publish_limit:{user_id}:{day_start.date().isoformat()}:{timezone.get_current_timezone_name()}'
+    return tagged_cache.make_key(key, [user_tag(user_id)])
+
+
+def _counter(user):
+    """Ключ счетчика и его значение; при промахе счетчик заполняется из базы"""
+    from .models import Post
+
+    day_start, day_end = day_bounds()
+    key = _counter_key(user.pk, day_start)
+    count = cache.get(key)
+    if count is None:
+        count = Post.objects.filter(author__user=user, created_at__gte=day_start).count()
+        timeout = int((day_end - timezone.now()).total_seconds()) + EXPIRY_MARGIN
+        if not cache.add(key, count, timeout):
+            count = cache.get(key, count)
+    return key, count
+
+
+def posts_today(user):
+    return _counter(user)[1]
+
+
+def remaining(user):
+    return max(daily_limit() - posts_today(user), 0)
+
+
+def can_publish(user):
+    return posts_today(user) < daily_limit()
+
+
+def reserve(user):
+    """
+    Атомарно занимает место под новый пост. Возвращает количество постов за
+    сегодня с учетом нового или None, если лимит исчерпан
+    """
+    key, count = _counter(user)
+    if count >= daily_limit():
+        return None
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Счетчик вытеснен между чтением и incr - заполняем заново
+        key, count = _counter(user)
+        count = cache.incr(key)
+    if count > daily_limit():
+        cache.decr(key)
+        return None
+    return count
+
+
+def release(user):
+    """Возвращает место, если пост после reserve() так и не был сохранен"""
+    try:
+        cache.decr(_counter(user)[0])
+    except ValueError:
+        pass
+
+
+def lock_author(author_id):
+    """Блокирует строку автора до конца текущей транзакции"""
+    from .models import Author
+
+    if connection.features.has_select_for_update:
+        list(Author.objects.select_for_update().filter(pk=author_id).values_list('pk'))
+    else:
+        # SQLite не знает FOR UPDATE, но первая запись блокирует базу до конца транзакции
+        Author.objects.filter(pk=author_id).update(rating=F('rating'))
+
+
+def confirm(user, author_id):
+    """
+    Проверка лимита по базе; вызывается в транзакции, которая сохранит пост.
+    Если база лимит не подтвердила, счетчик в кэше разошелся с ней и сбрасывается
+    """
+    from .models import Post
+
+    lock_author(author_id)
+    day_start, _ = day_bounds()
+    if Post.objects.filter(author_id=author_id, created_at__gte=day_start).count() < daily_limit():
+        return True
+    invalidate(user.pk)
+    return False
+
+
+def invalidate(user_id):
+    """Счетчик пересчитается из базы при следующем обращении"""
+    tagged_cache.invalidate(user_tag(user_id))
+
+
+def limit_info(user):
+    count = posts_today(user)
+    return {
+        'limit': daily_limit(),
+        'today_posts_count': count,
+        'remaining_posts': max(daily_limit() - count, 0),
+        'can_publish': count < daily_limit(),
+    }
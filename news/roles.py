@@ -0,0 +1,53 @@
+"""
+Роли пользователя (группы) без запроса к базе на каждую проверку.
+
+Названия групп пользователя хранятся в кэше под ключом roles:<user_id> и
+запоминаются на объекте request.user, так что в пределах запроса группы
+читаются один раз, а между запросами - из кэша. Ключ сбрасывается сигналами
+при изменении User.groups и при переименовании/удалении группы (news/signals.py).
+"""
+from django.core.cache import cache
+
+AUTHORS_GROUP = 'authors'
+ROLES_TIMEOUT = 60 * 60 * 24
+
+_MEMO_ATTR = '_news_group_names'
+
+
+def _cache_key(user_id):
+    return f'roles:{user_id}'
+
+
+def group_names(user):
+    """Названия групп пользователя (frozenset)"""
+    if not user.is_authenticated:
+        return frozenset()
+    names = getattr(user, _MEMO_ATTR, None)
+    if names is None:
+        names = frozenset(cache.get_or_set(
+            _cache_key(user.pk),
+            lambda: list(user.groups.values_list('name', flat=True)),
+            ROLES_TIMEOUT,
+        ))
+        setattr(user, _MEMO_ATTR, names)
+    return names
+
+
+def has_role(user, group_name):
+    return group_name in group_names(user)
+
+
+def is_author(user):
+    return has_role(user, AUTHORS_GROUP)
+
+
+def invalidate(*user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def forget(user):
+    """Сбрасывает запомненные на объекте группы (после изменения групп в том же запросе)"""
+    try:
+        delattr(user, _MEMO_ATTR)
+    except AttributeError:
+        pass
@@ -0,0 +1,251 @@
+"""
+Полнотекстовый поиск по постам.
+
+Индекс - виртуальная таблица SQLite FTS5 news_post_search (rowid = id поста),
+в которой хранятся уже нормализованные основы слов заголовка и текста.
+Основы получаются русским стеммером Snowball, поэтому запрос "выборы"
+находит "выборов", "выборах" и т.д. Результаты ранжируются функцией bm25,
+совпадения в заголовке весят больше, чем в тексте.
+
+Индекс поддерживается сигналами Post (news/signals.py) и полностью
+перестраивается командой rebuild_search_index. На других СУБД поиск
+работает через icontains по заголовку и тексту.
+"""
+import re
+from functools import lru_cache
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+
+SEARCH_TABLE = 'news_post_search'
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+WORD_RE = re.compile(r'\w+')
+
+# --- Русский стеммер (алгоритм Snowball) ---
+
+VOWELS = 'аеиоуыэюя'
+RV_RE = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+PERFECTIVE_GERUND_RE = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE_RE = re.compile(r'(с[яь])$')
+ADJECTIVE_RE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE_RE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB_RE = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN_RE = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL_RE = re.compile(r'(ост|ость)$')
+SUPERLATIVE_RE = re.compile(r'(ейше|ейш)$')
+
+
+def _region(word, start=0):
+    """Начало области R: после первой согласной, следующей за гласной"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    """Возвращает основу русского слова. Словарь небольшой, поэтому результаты кэшируются"""
+    word = word.lower().replace('ё', 'е')
+    match = RV_RE.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+
+    # Шаг 1: деепричастия, иначе возвратность + прилагательные/глаголы/существительные
+    rv, found = PERFECTIVE_GERUND_RE.subn('', rv)
+    if not found:
+        rv = REFLEXIVE_RE.sub('', rv)
+        rv, found = ADJECTIVE_RE.subn('', rv)
+        if found:
+            rv = PARTICIPLE_RE.sub('', rv)
+        else:
+            rv, found = VERB_RE.subn('', rv)
+            if not found:
+                rv = NOUN_RE.sub('', rv)
+
+    # Шаг 2: окончание "и"
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательные суффиксы в области R2
+    derivational = DERIVATIONAL_RE.search(rv)
+    if derivational:
+        r2 = _region(word, _region(word))
+        if len(prefix) + derivational.start() >= r2:
+            rv = rv[:derivational.start()]
+
+    # Шаг 4: "нн" -> "н", превосходная степень, мягкий знак
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        rv, found = SUPERLATIVE_RE.subn('', rv)
+        if found and rv.endswith('нн'):
+            rv = rv[:-1]
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text):
+    """Разбивает текст (в том числе HTML) на основы слов"""
+    text = text or ''
+    if '<' in text:
+        # strip_tags медленный, а у большинства постов разметки нет
+        text = strip_tags(text)
+    return [stem(word) for word in WORD_RE.findall(text.lower())]
+
+
+def to_index_text(text):
+    """
+    Текст для индекса: основы слов через пробел. Зависит только от текста -
+    ее вызывает миграция 0002, поэтому сигнатуру не меняем
+    """
+    return ' '.join(tokenize(text))
+
+
+def build_match(query):
+    """Строка MATCH для FTS5: все основы запроса, последняя - как префикс"""
+    stems = tokenize(query)
+    if not stems:
+        return ''
+    terms = [f'"{term}"' for term in stems]
+    # Последнее слово могут еще дописывать - ищем его по префиксу
+    terms[-1] += '*'
+    return ' AND '.join(terms)
+
+
+# --- Работа с индексом ---
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def create_index_table(schema_editor=None):
+    cursor_owner = schema_editor.connection if schema_editor else connection
+    with cursor_owner.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            f"title, content, tokenize='unicode61 remove_diacritics 0')"
+        )
+
+
+def index_post(post):
+    """Добавляет или обновляет пост в индексе"""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, content) VALUES (%s, %s, %s)',
+            [post.pk, to_index_text(post.title), to_index_text(post.content)]
+        )
+
+
+def remove_post(post_id):
+    """Удаляет пост из индекса"""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild_index(posts, chunk_size=1000):
+    """Полностью перестраивает индекс из queryset постов. Возвращает количество постов"""
+    if not is_supported():
+        return 0
+    indexed = 0
+    # Одна транзакция: в режиме autocommit SQLite фиксировала бы каждую вставку отдельно
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Пересоздать таблицу быстрее, чем удалять строки из FTS по одной
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+        create_index_table()
+        batch = []
+        for post in posts.only('id', 'title', 'content').iterator(chunk_size=chunk_size):
+            batch.append((post.pk, to_index_text(post.title), to_index_text(post.content)))
+            if len(batch) >= chunk_size:
+                cursor.executemany(
+                    f'INSERT INTO {SEARCH_TABLE} (rowid, title, content) VALUES (%s, %s, %s)', batch
+                )
+                indexed += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, title, content) VALUES (%s, %s, %s)', batch
+            )
+            indexed += len(batch)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+class SearchResults:
+    """
+    Ленивый результат поиска, совместимый с Paginator:
+    count() считает совпадения, срез загружает только нужную страницу в порядке релевантности.
+    """
+
+    def __init__(self, queryset, query):
+        self.queryset = queryset
+        self.query = query
+        self.match = build_match(query)
+        self._count = None
+
+    def _matched(self):
+        """
+        queryset, ограниченный совпадениями из индекса. Подзапрос к FTS отдает
+        только найденные id, поэтому остальные условия проверяются поиском по
+        первичному ключу лишь для них, а не для всей таблицы постов
+        """
+        if not is_supported():
+            return self.queryset.filter(Q(title__icontains=self.query) | Q(content__icontains=self.query))
+        return self.queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [self.match]
+        ))
+
+    def count(self):
+        if self._count is None:
+            self._count = self._matched().count() if self.match else 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        if not self.match:
+            return []
+        if not is_supported():
+            return list(self._matched().order_by('-created_at', '-id')[item])
+
+        offset = item.start or 0
+        limit = (item.stop - offset) if item.stop is not None else -1
+        filter_sql, params = self._matched().order_by().values('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} '
+                f'WHERE {SEARCH_TABLE} MATCH %s AND +rowid IN ({filter_sql}) '
+                f'ORDER BY bm25({SEARCH_TABLE}, {TITLE_WEIGHT}, {CONTENT_WEIGHT}) '
+                f'LIMIT %s OFFSET %s',
+                [self.match, *params, limit, offset]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = self.queryset.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def search_posts(queryset, query):
+    """Ищет query по заголовку и тексту постов из queryset"""
+    return SearchResults(queryset, query)
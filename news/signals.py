@@ -1,4 +1,5 @@
-from django.db.models.signals import post_save, post_delete, post_migrate
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, post_migrate, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.contenttypes.models import ContentType
@@ -6,9 +7,11 @@ from django.core.mail import send_mail
 from django.core.cache import cache
 from django.template.loader import render_to_string
 from django.conf import settings
-from .models import Post, Category
+from .models import Author, Comment, Post, Category, CategoryStats, PostCategory, Subscription
 from django.urls import reverse
-from .utils import clear_post_cache
+from .censorship import warm_censored_cache, evict_censored_cache
+from . import publish_limit, roles, search, tagged_cache
+from .tasks import notify_subscribers as notify_subscribers_task
 
 @receiver(post_save, sender=User)
 def add_user_to_common_group(sender, instance, created, **kwargs):
@@ -21,6 +24,33 @@ def add_user_to_common_group(sender, instance, created, **kwargs):
             print("Группа 'common' не найдена! Создайте ее в админке.")
 
 
+@receiver(m2m_changed, sender=User.groups.through)
+def clear_roles_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    """Группы пользователя изменились (user.groups или group.user_set)"""
+    if action == 'pre_clear' and reverse:
+        # После clear уже не узнать, кто был в группе
+        instance._cleared_user_ids = list(instance.user_set.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        roles.invalidate(instance.pk)
+        roles.forget(instance)
+    elif action == 'post_clear':
+        roles.invalidate(*getattr(instance, '_cleared_user_ids', []))
+    else:
+        roles.invalidate(*(pk_set or []))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def clear_roles_cache_on_group_change(sender, instance, **kwargs):
+    """Переименование или удаление группы меняет роли всех ее участников"""
+    if kwargs.get('created'):
+        return
+    roles.invalidate(*instance.user_set.values_list('id', flat=True))
+
+
 def send_welcome_email(sender, instance, created, **kwargs):
     if created:  # Отправляем только для новых пользователей
         # Формируем контекст для письма
@@ -49,84 +79,174 @@ def send_welcome_email(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=Post)
 def notify_subscribers(sender, instance, created, **kwargs):
+    """Отмечает новую статью: рассылка запускается, когда у нее появятся категории"""
     if created and instance.post_type == 'AR':  # Только для статей
-        categories = instance.categories.all()
+        instance._notify_subscribers = True
 
-        for category in categories:
-            subscribers = category.subscribers.all()
 
-            for subscriber in subscribers:
-                context = {
-                    'post': instance,
-                    'user': subscriber,
-                    'category': category,
-                    'post_url': f"http://127.0.0.1:8000/news/{instance.id}/",
-                }
+@receiver(m2m_changed, sender=Post.categories.through)
+def schedule_subscribers_notification(sender, instance, action, **kwargs):
+    """
+    Категории сохраняются формой уже после post_save, поэтому рассылка
+    ставится в очередь здесь и только после фиксации транзакции
+    """
+    if action == 'post_add' and getattr(instance, '_notify_subscribers', False):
+        instance._notify_subscribers = False
+        post_id = instance.pk
+        transaction.on_commit(lambda: notify_subscribers_task.delay(post_id))
 
-                html_content = render_to_string('news/email/new_post_notification.html', context)
-                text_content = render_to_string('news/email/new_post_notification.txt', context)
 
-                # РЕАЛЬНАЯ ОТПРАВКА
-                send_mail(
-                    subject=instance.title,
-                    message=text_content,
-                    from_email='noreply@newsportal.com',
-                    recipient_list=[subscriber.email],
-                    html_message=html_content,
-                    fail_silently=False,
-                )
+@receiver(pre_delete, sender=Post)
+def remember_post_categories(sender, instance, **kwargs):
+    # К post_delete связи с категориями уже удалены, а их кэш тоже нужно сбросить
+    instance._cache_category_ids = list(instance.categories.values_list('id', flat=True))
 
 
 @receiver(post_save, sender=Post)
 @receiver(post_delete, sender=Post)
 def clear_cache_on_post_change(sender, instance, **kwargs):
-    clear_post_cache(sender, instance, **kwargs)
+    """Сбрасывает все записи кэша, зависящие от поста, его списка и категорий"""
+    category_ids = getattr(instance, '_cache_category_ids', None)
+    if category_ids is None:
+        # У нового поста категорий еще нет, они придут через m2m_changed
+        category_ids = [] if kwargs.get('created') else list(instance.categories.values_list('id', flat=True))
+    tagged_cache.invalidate(*tagged_cache.post_tags(instance, category_ids))
+
+    # Цензура считается один раз на редактирование, а не на каждый просмотр
+    if kwargs.get('signal') is post_delete:
+        evict_censored_cache(instance)
+    else:
+        warm_censored_cache(instance)
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def update_search_index(sender, instance, **kwargs):
+    """Поддерживает полнотекстовый индекс в актуальном состоянии"""
+    if kwargs.get('signal') is post_delete:
+        search.remove_post(instance.pk)
+    else:
+        search.index_post(instance)
+
 
 @receiver(post_save, sender=Category)
 @receiver(post_delete, sender=Category)
 def clear_category_cache(sender, instance, **kwargs):
     # Очищаем кэш категорий
     cache.delete('categories')
+    tagged_cache.invalidate(tagged_cache.category_tag(instance.pk), tagged_cache.categories_tag())
+
+
+@receiver(m2m_changed, sender=Post.categories.through)
+def clear_cache_on_categories_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Пост добавлен в категорию или убран из нее (с любой стороны связи)"""
+    if action == 'pre_clear':
+        # После clear уже не узнать, какие связи были
+        if reverse:
+            instance._cleared_ids = list(instance.post_set.values_list('id', flat=True))
+        else:
+            instance._cleared_ids = list(instance.categories.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_ids', [])
+
+    if reverse:
+        # instance - категория, pk_set - посты
+        posts = Post.objects.filter(pk__in=pk_set).values_list('id', 'post_type')
+        tags = [tagged_cache.category_tag(instance.pk)]
+        for post_id, post_type in posts:
+            tags += [tagged_cache.post_tag(post_id), tagged_cache.list_tag(post_type)]
+    else:
+        tags = tagged_cache.post_tags(instance, pk_set or [])
+    tagged_cache.invalidate(*tags)
 
 
 @receiver(post_save, sender=Post)
 @receiver(post_delete, sender=Post)
-def clear_post_cache(sender, instance, **kwargs):
-    """Очистка кэша при изменении постов"""
-    try:
-        # Очищаем кэш детальной страницы
-        if instance.post_type == 'NW':
-            cache.delete(f'news_detail_{instance.id}')
-        elif instance.post_type == 'AR':
-            cache.delete(f'article_detail_{instance.id}')
-
-        # Очищаем основные кэши списков
-        cache_keys_to_clear = [
-            'news_list',
-            'article_list',
-            'articles_header',
-            'articles_pagination_1',
-            'articles_pagination_2',
-            'news_header',
-            'news_pagination_1',
-            'news_pagination_2',
-            'navigation',
-            'footer'
-        ]
-
-        for key in cache_keys_to_clear:
-            cache.delete(key)
-
-        # Очищаем кэш связанных статей (правильно работаем с categories)
-        if hasattr(instance, 'categories'):
-            categories = instance.categories.all()
-            for category in categories:
-                cache.delete(f'related_articles_{category.id}')
-
-        print(f"Кэш очищен для поста {instance.id}")
-
-    except Exception as e:
-        print(f"Ошибка при очистке кэша: {e}")
+def reset_publish_limit(sender, instance, **kwargs):
+    """Пост создан в обход формы или удален - счетчик дневного лимита пересчитается из базы"""
+    if kwargs.get('signal') is post_save:
+        if not kwargs.get('created') or getattr(instance, '_publish_limit_reserved', False):
+            return
+    publish_limit.invalidate(instance.author.user_id)
+
+
+# --- Рейтинг авторов ---
+# Голоса меняют рейтинг авторов дельтами (Post/Comment.apply_rating_delta), поэтому
+# удаленные пост или комментарий тоже вычитаются дельтой, без полного пересчета
+
+@receiver(post_delete, sender=Post)
+def subtract_post_rating(sender, instance, **kwargs):
+    """Комментарии удаляемого поста вычитаются своим сигналом (каскад удаляет их раньше поста)"""
+    Author.add_rating(-instance.rating * Author.POST_RATING_WEIGHT, pk=instance.author_id)
+
+
+@receiver(post_delete, sender=Comment)
+def subtract_comment_rating(sender, instance, **kwargs):
+    Author.add_rating(-instance.rating * Author.COMMENT_RATING_WEIGHT, user_id=instance.user_id)
+    Author.add_rating(-instance.rating * Author.POST_COMMENT_RATING_WEIGHT, post__pk=instance.post_id)
+
+
+# --- Статистика категорий (CategoryStats) ---
+
+@receiver(post_save, sender=Category)
+def create_category_stats(sender, instance, created, **kwargs):
+    if created:
+        CategoryStats.objects.get_or_create(category=instance)
+
+
+@receiver(m2m_changed, sender=Post.categories.through)
+def update_category_stats_on_add(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    add() создает связи через bulk_create без post_save. Удаление связей
+    (remove, clear, каскад) приходит через post_delete PostCategory
+    """
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        for post in Post.objects.filter(pk__in=pk_set).only('post_type', 'created_at'):
+            CategoryStats.add_post([instance.pk], post.post_type, post.created_at)
+    else:
+        CategoryStats.add_post(pk_set, instance.post_type, instance.created_at)
+
+
+@receiver(post_save, sender=PostCategory)
+def update_category_stats_on_link(sender, instance, created, **kwargs):
+    if created:
+        CategoryStats.add_post([instance.category_id], instance.post.post_type, instance.post.created_at)
+
+
+@receiver(post_delete, sender=PostCategory)
+def update_category_stats_on_unlink(sender, instance, **kwargs):
+    CategoryStats.remove_post([instance.category_id], instance.post.post_type)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_type(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and (update_fields is None or 'post_type' in update_fields):
+        instance._stats_post_type = Post.objects.filter(pk=instance.pk).values_list(
+            'post_type', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Post)
+def update_category_stats_on_type_change(sender, instance, created, **kwargs):
+    old_type = getattr(instance, '_stats_post_type', None)
+    instance._stats_post_type = None
+    if not created and old_type and old_type != instance.post_type:
+        category_ids = instance.categories.values_list('id', flat=True)
+        CategoryStats.change_post_type(category_ids, old_type, instance.post_type)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def update_category_stats_on_subscription(sender, instance, **kwargs):
+    if kwargs.get('signal') is post_delete:
+        CategoryStats.add_subscribers(instance.category_id, -1)
+    elif kwargs.get('created'):
+        CategoryStats.add_subscribers(instance.category_id, 1)
+
 
 @receiver(post_migrate)
 def create_authors_group(sender, **kwargs):
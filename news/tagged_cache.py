@@ -0,0 +1,129 @@
+"""
+Кэш с тегами зависимостей.
+
+Каждая запись кэша объявляет теги, от которых зависит: post:<id>, category:<id>,
+list:NW, list:AR, categories. У каждого тега есть счетчик поколений, и текущие поколения
+всех тегов записи входят в ее ключ. Сброс тега - это один cache.incr: старые
+записи становятся недостижимыми и сами истекают по таймауту, а записи,
+не зависящие от тега, продолжают отдаваться из кэша.
+
+    tagged_cache.get_or_set('news_count', queryset.count, [list_tag('NW')])
+    tagged_cache.invalidate(post_tag(post.pk), list_tag(post.post_type))
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+
+DEFAULT_TIMEOUT = 60 * 10
+TAG_VERSION_TIMEOUT = None  # Счетчики поколений не должны истекать раньше записей
+
+
+def post_tag(pk):
+    return f'post:{pk}'
+
+
+def category_tag(pk):
+    return f'category:{pk}'
+
+
+def list_tag(post_type):
+    return f'list:{post_type}'
+
+
+def categories_tag():
+    """Список категорий целиком (добавление, переименование, удаление)"""
+    return 'categories'
+
+
+def post_tags(post, category_ids=None):
+    """Теги, которые сбрасываются при изменении поста"""
+    if category_ids is None:
+        category_ids = [category.pk for category in post.categories.all()] if post.pk else []
+    return [post_tag(post.pk), list_tag(post.post_type), *(category_tag(pk) for pk in category_ids)]
+
+
+def _version_key(tag):
+    return f'cache_tag:{tag}'
+
+
+def _new_version():
+    # Если счетчик вытеснен из кэша, он начинается с текущего времени,
+    # а не с 1, чтобы не совпасть с поколением старых записей
+    return int(time.time() * 1000)
+
+
+def tag_versions(tags):
+    """Текущие поколения тегов (одним get_many, недостающие создаются)"""
+    keys = {_version_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = _new_version()
+            if not cache.add(key, version, TAG_VERSION_TIMEOUT):
+                version = cache.get(key, version)
+            versions[key] = version
+    return [versions[_version_key(tag)] for tag in tags]
+
+
+def make_key(key, tags):
+    """Ключ записи с учетом поколений всех ее тегов"""
+    tags = sorted(frozenset(tags))
+    fingerprint = ':'.join(f'{tag}={version}' for tag, version in zip(tags, tag_versions(tags)))
+    return f'tagged:{key}:{hashlib.md5(fingerprint.encode()).hexdigest()}'
+
+
+def get(key, tags, default=None):
+    return cache.get(make_key(key, tags), default)
+
+
+def set(key, value, tags, timeout=DEFAULT_TIMEOUT):
+    # Ключ содержит поколения тегов, поэтому значение под ним не меняется:
+    # add не перезаписывает запись и не сбрасывает L1 других процессов
+    cache.add(make_key(key, tags), value, timeout)
+
+
+def get_or_set(key, default, tags, timeout=DEFAULT_TIMEOUT):
+    """Как cache.get_or_set, default может быть функцией"""
+    return cache.get_or_set(make_key(key, tags), default, timeout)
+
+
+def invalidate(*tags):
+    """Сбрасывает все записи, зависящие от любого из тегов"""
+    for tag in tags:
+        key = _version_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Счетчика еще нет - записей с этим тегом тоже нет
+            cache.add(key, _new_version(), TAG_VERSION_TIMEOUT)
+
+
+# --- Записи, теги которых известны только после вычисления значения ---
+
+def snapshot(tags):
+    """Поколения тегов на момент начала вычисления"""
+    tags = list(dict.fromkeys(tags))
+    return dict(zip(tags, tag_versions(tags)))
+
+
+def set_entry(key, value, tags, versions=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Сохраняет значение вместе с поколениями его тегов. versions - снимок, сделанный
+    до вычисления: если тег сбросили во время вычисления, запись сразу будет устаревшей
+    """
+    versions = dict(versions or {})
+    missing = [tag for tag in dict.fromkeys(tags) if tag not in versions]
+    versions.update(snapshot(missing))
+    cache.set(f'tagged_entry:{key}', (versions, value), timeout)
+
+
+def get_entry(key, default=None):
+    """Значение, сохраненное set_entry, если ни один из его тегов не сброшен"""
+    entry = cache.get(f'tagged_entry:{key}')
+    if entry is None:
+        return default
+    versions, value = entry
+    if tag_versions(list(versions)) != list(versions.values()):
+        return default
+    return value
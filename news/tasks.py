@@ -1,63 +1,224 @@
+import secrets
+import time
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
 from celery import shared_task
-from django.core.mail import send_mail
+from django.conf import settings
+from django.core.mail import get_connection, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.html import escape
 from datetime import timedelta
-from .models import Subscription, Post, Category
+from .models import Subscription, Post, Category, PostCategory
+from .votes import flush_votes
+
+# Сколько писем отправляется за одно обращение к почтовому соединению
+EMAIL_BATCH_SIZE = getattr(settings, 'EMAIL_BATCH_SIZE', 100)
+
+
+def placeholder(name):
+    """
+    Метка для подстановки в отрендеренный общий текст письма. Случайная часть не дает
+    тексту поста или названию категории совпасть с меткой и попасть под замену
+    """
+    return f'__{name}_{secrets.token_hex(8)}__'
+
+
+def send_in_batches(messages, batch_size=EMAIL_BATCH_SIZE):
+    """Отправляет письма пачками через одно переиспользуемое соединение"""
+    sent = 0
+    connection = get_connection()
+    connection.open()
+    try:
+        batch = []
+        for message in messages:
+            message.connection = connection
+            batch.append(message)
+            if len(batch) >= batch_size:
+                sent += connection.send_messages(batch) or 0
+                batch = []
+        if batch:
+            sent += connection.send_messages(batch) or 0
+    finally:
+        connection.close()
+    return sent
+
+
+@shared_task
+def notify_subscribers(post_id):
+    """Уведомляет подписчиков категорий о новой статье"""
+    post = Post.objects.select_related('author__user').get(pk=post_id)
+    category_ids = list(post.categories.values_list('id', flat=True))
+
+    # Один запрос на всех получателей. Пользователь, подписанный на несколько
+    # категорий поста, получает одно письмо (о первой из них)
+    recipients = {}
+    categories = {}
+    subscriptions = Subscription.objects.filter(
+        category_id__in=category_ids
+    ).exclude(user__email='').order_by('user_id', 'category_id').values_list(
+        'user_id', 'user__username', 'user__email', 'category_id', 'category__name'
+    )
+    for user_id, username, email, category_id, category_name in subscriptions:
+        if user_id not in recipients:
+            recipients[user_id] = (username, email, category_id)
+            categories[category_id] = Category(id=category_id, name=category_name)
+
+    if not recipients:
+        return f"No subscribers for post {post_id}"
+
+    # Общая часть письма рендерится один раз на категорию
+    post_url = f"http://127.0.0.1:8000/news/{post.id}/"
+    name_placeholder = placeholder('SUBSCRIBER_NAME')
+    rendered = {}
+    for category_id, category in categories.items():
+        context = {
+            'post': post,
+            'user': {'username': name_placeholder},
+            'category': category,
+            'post_url': post_url,
+        }
+        rendered[category_id] = (
+            render_to_string('news/email/new_post_notification.html', context),
+            render_to_string('news/email/new_post_notification.txt', context),
+        )
+
+    def build_messages():
+        for username, email, category_id in recipients.values():
+            html_content, text_content = rendered[category_id]
+            message = EmailMultiAlternatives(
+                subject=post.title,
+                body=text_content.replace(name_placeholder, username),
+                from_email='noreply@newsportal.com',
+                to=[email],
+            )
+            message.attach_alternative(
+                html_content.replace(name_placeholder, escape(username)),
+                'text/html'
+            )
+            yield message
+
+    sent = send_in_batches(build_messages())
+    print(f"✅ Notification about post {post_id} sent to {sent} subscribers")
+    return f"Notification sent to {sent} subscribers"
 
 
 @shared_task
-def send_weekly_digest():
-    """Отправляет еженедельную рассылку подписчикам"""
+def send_weekly_digest(chunk_size=2000):
+    """Отправляет еженедельную рассылку подписчикам: одно письмо на пользователя"""
     try:
+        started = time.monotonic()
         # Дата неделю назад
         week_ago = timezone.now() - timedelta(days=7)
+        week_start, week_end = week_ago.date(), timezone.now().date()
 
         print("Starting weekly digest...")
 
-        # Для каждой категории
-        for category in Category.objects.all():
-            # Новые статьи в категории за неделю
-            new_posts = Post.objects.filter(
-                categories=category,
+        # Новые статьи за неделю, сгруппированные по категориям
+        posts = {
+            post.id: post
+            for post in Post.objects.filter(
                 created_at__gte=week_ago,
                 post_type='AR'  # Только статьи
+            ).select_related('author__user').order_by('-created_at')
+        }
+        posts_by_category = defaultdict(list)
+        category_names = {}
+        links = PostCategory.objects.filter(post_id__in=posts).values_list(
+            'category_id', 'category__name', 'post_id'
+        )
+        for category_id, category_name, post_id in links:
+            posts_by_category[category_id].append(posts[post_id])
+            category_names[category_id] = category_name
+
+        if not posts_by_category:
+            print("No new articles this week")
+            return "Weekly digest: no new articles"
+
+        # Блок каждой категории рендерится один раз и переиспользуется во всех письмах
+        blocks = {}
+        for category_id, category_posts in posts_by_category.items():
+            category_posts.sort(key=lambda post: post.created_at, reverse=True)
+            context = {
+                'category': Category(id=category_id, name=category_names[category_id]),
+                'posts': category_posts,
+            }
+            blocks[category_id] = (
+                render_to_string('news/email/weekly_digest_category.html', context),
+                render_to_string('news/email/weekly_digest_category.txt', context),
             )
 
-            if new_posts.exists():
-                # Получаем подписчиков категории
-                subscribers = category.subscribers.all()
+        # Общая рамка письма тоже рендерится один раз, с метками вместо имени и блоков категорий
+        name_placeholder = placeholder('SUBSCRIBER_NAME')
+        blocks_placeholder = placeholder('DIGEST_CATEGORIES')
+        frame_context = {
+            'user': {'username': name_placeholder},
+            'week_start': week_start,
+            'week_end': week_end,
+            'categories_block': blocks_placeholder,
+        }
+        html_frame = render_to_string('news/email/weekly_digest.html', frame_context)
+        text_frame = render_to_string('news/email/weekly_digest.txt', frame_context)
+
+        # Подписки читаются потоком, упорядоченным по пользователю, поэтому
+        # в памяти одновременно находится только один пользователь
+        subscriptions = Subscription.objects.filter(
+            category_id__in=posts_by_category
+        ).exclude(user__email='').order_by('user_id', 'category_id').values_list(
+            'user_id', 'user__username', 'user__email', 'category_id'
+        ).iterator(chunk_size=chunk_size)
+
+        stats = {'users': 0}
 
-                print(f"Category {category.name}: {new_posts.count()} new posts, {subscribers.count()} subscribers")
+        def build_messages():
+            for user_id, rows in groupby(subscriptions, key=itemgetter(0)):
+                rows = list(rows)
+                username, email = rows[0][1], rows[0][2]
+                category_ids = [row[3] for row in rows]
 
-                for subscriber in subscribers:
-                    # Формируем контент письма
-                    context = {
-                        'user': subscriber,
-                        'category': category,
-                        'posts': new_posts,
-                        'week_start': week_ago.date(),
-                        'week_end': timezone.now().date(),
-                    }
+                if len(category_ids) == 1:
+                    subject = f'Еженедельная рассылка: новые статьи в категории "{category_names[category_ids[0]]}"'
+                else:
+                    subject = 'Еженедельная рассылка: новые статьи в ваших категориях'
 
-                    html_message = render_to_string('news/email/weekly_digest.html', context)
-                    text_message = render_to_string('news/email/weekly_digest.txt', context)
+                html_message = html_frame.replace(name_placeholder, escape(username)).replace(
+                    blocks_placeholder, ''.join(blocks[category_id][0] for category_id in category_ids)
+                )
+                text_message = text_frame.replace(name_placeholder, username).replace(
+                    blocks_placeholder, ''.join(blocks[category_id][1] for category_id in category_ids)
+                )
 
-                    # РЕАЛЬНАЯ ОТПРАВКА EMAIL
-                    send_mail(
-                        subject=f'Еженедельная рассылка: новые статьи в категории "{category.name}"',
-                        message=text_message,
-                        from_email='noreply@newsportal.com',
-                        recipient_list=[subscriber.email],
-                        html_message=html_message,
-                        fail_silently=False,
-                    )
+                message = EmailMultiAlternatives(
+                    subject=subject,
+                    body=text_message,
+                    from_email='noreply@newsportal.com',
+                    to=[email],
+                )
+                message.attach_alternative(html_message, 'text/html')
+                stats['users'] += 1
+                yield message
 
-                    print(f"✅ Email sent to {subscriber.email} with {new_posts.count()} posts")
+        sent = send_in_batches(build_messages())
 
-        print("Weekly digest completed successfully")
-        return f"Weekly digest sent for {Category.objects.count()} categories"
+        elapsed = time.monotonic() - started
+        rate = stats['users'] / elapsed if elapsed else 0
+        print(
+            f"Weekly digest completed: {len(posts)} posts in {len(posts_by_category)} categories, "
+            f"{sent} emails to {stats['users']} users in {elapsed:.2f}s ({rate:.0f} users/s)"
+        )
+        return f"Weekly digest sent to {stats['users']} users in {elapsed:.2f}s ({rate:.0f} users/s)"
 
     except Exception as e:
         print(f"Error in weekly digest: {e}")
-        return f"Error: {e}"
\ No newline at end of file
+        return f"Error: {e}"
+
+
+@shared_task
+def flush_rating_votes():
+    """Переносит в базу голоса, накопленные в буфере (режим RATING_VOTES_BUFFERED)"""
+    updated = flush_votes()
+    if updated:
+        print(f"Rating votes flushed for {updated} objects")
+    return updated
@@ -1,13 +1,125 @@
 from django import template
-from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+from news import page_cache, tagged_cache
+from news.compute_cache import cached_compute
 from news.models import Category
+from news.timezones import SELECT_CACHE_TIMEOUT, select_timezones
 
 register = template.Library()
 
 @register.simple_tag
 def get_cached_categories():
-    categories = cache.get('categories')
-    if not categories:
-        categories = Category.objects.all()
-        cache.set('categories', categories, 10)  # 10сек
-    return categories
\ No newline at end of file
+    # Ключ 'categories' сбрасывается сигналом при изменении категорий
+    return cached_compute('categories', lambda: list(Category.objects.all()), 60 * 10)
+
+
+@register.simple_tag(takes_context=True)
+def timezone_select(context):
+    """
+    <select> переключателя часовых поясов. Готовый HTML строится один раз
+    на язык и выбранный пояс (значение из сессии, которое активирует TimezoneMiddleware)
+    """
+    request = context.get('request')
+    selected = request.session.get('django_timezone', '') if request is not None else ''
+    key = f'timezone_select:{get_language()}:{selected}'
+    html = cached_compute(key, lambda: render_to_string('news/includes/timezone_select.html', {
+        'timezones': select_timezones(),
+        'current_timezone': selected,
+    }), SELECT_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+@register.filter
+def post_cache_tags(post):
+    """Теги фрагмента с постом: сам пост, его список и категории (берутся из prefetch)"""
+    return tagged_cache.post_tags(post)
+
+
+class TaggedCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, vary_on, tags):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.tags = tags
+
+    def render(self, context):
+        timeout = self.timeout.resolve(context)
+        tags = self.tags.resolve(context)
+        if isinstance(tags, str):
+            tags = tags.split(',')
+        key = make_template_fragment_key(self.fragment_name, [var.resolve(context) for var in self.vary_on])
+
+        value = tagged_cache.get(key, tags)
+        if value is None:
+            value = self.nodelist.render(context)
+            tagged_cache.set(key, value, tags, int(timeout))
+        return value
+
+
+@register.tag
+def tagged_cache_block(parser, token):
+    """
+    Как {% cache %}, но фрагмент сбрасывается по тегам, а не только по таймауту:
+
+        {% tagged_cache_block 600 "news_item" post.pk LANGUAGE_CODE tags=post|post_cache_tags %}
+            ...
+        {% endtagged_cache_block %}
+
+    tags - список тегов или строка через запятую ("list:NW,category:3")
+    """
+    nodelist = parser.parse(('endtagged_cache_block',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 4 or not bits[-1].startswith('tags='):
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' требует таймаут, имя фрагмента и последним аргументом tags=..."
+        )
+    return TaggedCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:-1]],
+        parser.compile_filter(bits[-1][len('tags='):]),
+    )
+
+
+class HoleNode(template.Node):
+    def __init__(self, template_name, params):
+        self.template_name = template_name
+        self.params = params
+
+    def render(self, context):
+        params = {name: value.resolve(context) for name, value in self.params.items()}
+        if context.get('page_shell'):
+            # Общий шаблон страницы: вместо персональной части оставляем метку
+            return page_cache.hole_marker(self.template_name, params)
+        fragment = context.template.engine.get_template(self.template_name)
+        with context.push(**params):
+            return fragment.render(context)
+
+
+@register.tag
+def hole(parser, token):
+    """
+    Персональная часть закэшированной страницы (кнопки автора, форма выхода, время):
+
+        {% hole "news/holes/list_actions.html" kind="news" post_id=post.pk %}
+
+    Обычно просто подключает шаблон с параметрами. При рендере общего шаблона страницы
+    оставляет метку, которую news.page_cache заполняет для каждого запроса отдельно.
+    Параметры должны сериализоваться в JSON
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' требует имя шаблона")
+    params = {}
+    for bit in bits[2:]:
+        name, sep, value = bit.partition('=')
+        if not sep:
+            raise template.TemplateSyntaxError(f"'{bits[0]}' принимает только параметры вида name=value")
+        params[name] = parser.compile_filter(value)
+    return HoleNode(bits[1].strip('"\''), params)
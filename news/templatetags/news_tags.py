@@ -1,54 +1,83 @@
 from django import template
-from news.models import Category, Post
+from django.db.models import Count, Q
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+from news import tagged_cache
+from news.compute_cache import cached_compute
+from news.models import Category, Post
 from datetime import timedelta
 
 register = template.Library()
 
+# Виджеты зависят от всех постов обоих списков; сбрасываются сигналами
+POST_LIST_TAGS = [tagged_cache.list_tag(Post.NEWS), tagged_cache.list_tag(Post.ARTICLE)]
+
+# Рейтинг меняется без post_save (Post.apply_rating_delta), поэтому популярные живут недолго
+POPULAR_POSTS_TIMEOUT = 60
+
 
-@register.inclusion_tag('news/includes/categories_sidebar.html')
+def render_cached_fragment(name, template_name, get_context, tags, timeout=tagged_cache.DEFAULT_TIMEOUT):
+    """
+    HTML виджета из кэша: один рендер на язык и часовой пояс, пока не сброшен
+    ни один из тегов. get_context вызывается только при промахе
+    """
+    key = f'widget:{name}:{get_language()}:{timezone.get_current_timezone_name()}'
+    html = cached_compute(key, lambda: render_to_string(template_name, get_context()), timeout, tags=tags)
+    return mark_safe(html)
+
+
+@register.simple_tag
 def show_categories():
-    categories = Category.objects.annotate(
-        post_count=models.Count('post'),
-        news_count=models.Count('post', filter=models.Q(post__post_type='NW')),
-        article_count=models.Count('post', filter=models.Q(post__post_type='AR'))
+    def get_context():
+        # Счетчики из CategoryStats: один запрос с JOIN вместо агрегатов по всем постам
+        return {'categories': list(Category.objects.select_related('stats').order_by('name'))}
+
+    return render_cached_fragment(
+        'categories', 'news/includes/categories_sidebar.html', get_context,
+        [tagged_cache.categories_tag(), *POST_LIST_TAGS]
     )
-    return {'categories': categories}
 
 
-@register.inclusion_tag('news/includes/recent_posts.html')
+@register.simple_tag
 def show_recent_posts(count=5, post_type=None):
-    queryset = Post.objects.all()
-    if post_type:
-        queryset = queryset.filter(post_type=post_type)
+    def get_context():
+        queryset = Post.objects.headlines()
+        if post_type:
+            queryset = queryset.filter(post_type=post_type)
+        return {'posts': list(queryset.order_by('-created_at')[:count])}
 
-    recent_posts = queryset.order_by('-created_at')[:count]
-    return {'posts': recent_posts}
+    return render_cached_fragment(
+        f'recent:{count}:{post_type}', 'news/includes/recent_posts.html', get_context, POST_LIST_TAGS
+    )
 
 
-@register.inclusion_tag('news/includes/popular_posts.html')
+@register.simple_tag
 def show_popular_posts(count=5, post_type=None):
-    queryset = Post.objects.all()
-    if post_type:
-        queryset = queryset.filter(post_type=post_type)
+    def get_context():
+        queryset = Post.objects.headlines()
+        if post_type:
+            queryset = queryset.filter(post_type=post_type)
+        return {'posts': list(queryset.order_by('-rating')[:count])}
 
-    popular_posts = queryset.order_by('-rating')[:count]
-    return {'posts': popular_posts}
+    return render_cached_fragment(
+        f'popular:{count}:{post_type}', 'news/includes/popular_posts.html', get_context,
+        POST_LIST_TAGS, POPULAR_POSTS_TIMEOUT
+    )
 
 
 @register.simple_tag
 def get_post_stats():
-    """Статистика по постам"""
-    total_posts = Post.objects.count()
-    total_news = Post.objects.filter(post_type='NW').count()
-    total_articles = Post.objects.filter(post_type='AR').count()
-
-    week_ago = timezone.now() - timedelta(days=7)
-    recent_posts = Post.objects.filter(created_at__gte=week_ago).count()
-
-    return {
-        'total_posts': total_posts,
-        'total_news': total_news,
-        'total_articles': total_articles,
-        'recent_posts': recent_posts,
-    }
\ No newline at end of file
+    """Статистика по постам (один агрегирующий запрос)"""
+    def compute():
+        week_ago = timezone.now() - timedelta(days=7)
+        return Post.objects.aggregate(
+            total_posts=Count('id'),
+            total_news=Count('id', filter=Q(post_type=Post.NEWS)),
+            total_articles=Count('id', filter=Q(post_type=Post.ARTICLE)),
+            recent_posts=Count('id', filter=Q(created_at__gte=week_ago)),
+        )
+
+    # recent_posts зависит от времени, поэтому без изменений постов запись живет минуту
+    return cached_compute('post_stats', compute, 60, tags=POST_LIST_TAGS)
@@ -1,3 +1,1544 @@
-from django.test import TestCase
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, Group, Permission, User
+from django.contrib.messages import get_messages
+from django.contrib.sessions.backends.cache import SessionStore
+from django.template import Context, Template
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseServerError
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .filters import ArticleFilter, NewsFilter
+from .middlewares import QueryBudgetExceeded, QueryInstrumentationMiddleware, TimezoneMiddleware
+from .models import (
+    Author, Category, CategoryStats, Comment, Post, PostCategory, Subscription, UserProfile,
+    compute_category_stats
+)
+from .pagination import decode_cursor
+from .votes import flush_votes
+from . import cache_backends, censorship, compute_cache, corpus, dump, page_cache, publish_limit, roles, tagged_cache, tasks, votes
+
+
+def use_temp_cache(test):
+    """Переносит общий файловый кэш теста во временный каталог: cache.clear() не трогает кэш dev-сервера"""
+    location = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, location, ignore_errors=True)
+    shared = {**settings.CACHES['shared'], 'LOCATION': location}
+    override = override_settings(CACHES={**settings.CACHES, 'shared': shared})
+    override.enable()
+    test.addCleanup(override.disable)
+
+
+def create_post(username='author'):
+    author = Author.objects.create(user=User.objects.create_user(username))
+    return Post.objects.create(author=author, post_type=Post.ARTICLE, title='Заголовок', content='Текст')
+
+
+class RatingVotesTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+
+    def test_stale_instances_do_not_lose_votes(self):
+        post = create_post()
+        first = Post.objects.get(pk=post.pk)
+        second = Post.objects.get(pk=post.pk)
+
+        first.like()
+        second.like()
+        second.dislike()
+        first.like()
+
+        post.refresh_from_db()
+        post.author.refresh_from_db()
+        self.assertEqual(post.rating, 2)
+        self.assertEqual(post.author.rating, 2 * Author.POST_RATING_WEIGHT)
+
+    def test_like_updates_only_rating(self):
+        post = create_post()
+        stale = Post.objects.get(pk=post.pk)
+        Post.objects.filter(pk=post.pk).update(content='Новый текст')
+
+        # SAVEPOINT, UPDATE поста, UPDATE автора, RELEASE SAVEPOINT
+        with self.assertNumQueries(4):
+            stale.like()
+
+        post.refresh_from_db()
+        self.assertEqual(post.content, 'Новый текст')
+        self.assertEqual(post.updated_at, stale.updated_at)
+
+    def test_comment_vote_updates_both_authors(self):
+        post = create_post()
+        commenter = Author.objects.create(user=User.objects.create_user('commenter'))
+        comment = Comment.objects.create(post=post, user=commenter.user, text='Комментарий')
+
+        comment.like()
+        comment.like()
+        comment.dislike()
+
+        commenter.refresh_from_db()
+        post.author.refresh_from_db()
+        self.assertEqual(commenter.rating, 1)
+        self.assertEqual(post.author.rating, 1)
+
+        Author.reconcile_ratings()
+        commenter.refresh_from_db()
+        post.author.refresh_from_db()
+        self.assertEqual((commenter.rating, post.author.rating), (1, 1))
+
+    def assert_ratings_reconciled(self):
+        expected = dict(Author.objects.annotate(expected=Author.rating_expression()).values_list('pk', 'expected'))
+        self.assertEqual(dict(Author.objects.values_list('pk', 'rating')), expected)
+
+    def test_deleting_posts_and_comments_subtracts_their_rating(self):
+        post = create_post()
+        commenter = Author.objects.create(user=User.objects.create_user('commenter'))
+        kept = Comment.objects.create(post=post, user=commenter.user, text='Останется')
+        removed = Comment.objects.create(post=post, user=commenter.user, text='Удалится')
+        post.like()
+        post.like()
+        kept.like()
+        removed.dislike()
+        self.assert_ratings_reconciled()
+
+        removed.delete()
+        self.assert_ratings_reconciled()
+        # Каскад: пост вместе с комментариями
+        Post.objects.get(pk=post.pk).delete()
+        self.assert_ratings_reconciled()
+        self.assertEqual(list(Author.objects.values_list('rating', flat=True)), [0, 0])
+
+    def test_reconcile_ratings_command(self):
+        post = create_post()
+        post.like()
+        Author.objects.update(rating=1000)
+
+        call_command('reconcile_ratings', stdout=StringIO())
+        self.assert_ratings_reconciled()
+        self.assertEqual(Author.objects.get(pk=post.author_id).rating, Author.POST_RATING_WEIGHT)
+
+
+@override_settings(RATING_VOTES_BUFFERED=True, CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'votes'},
+})
+class BufferedVotesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_votes_are_flushed_in_one_update(self):
+        post = create_post()
+        for _ in range(10):
+            post.like()
+        post.dislike()
+
+        self.assertEqual(Post.objects.get(pk=post.pk).rating, 0)
+
+        # UPDATE поста и автора (плюс savepoint) независимо от количества кликов
+        with self.assertNumQueries(4):
+            self.assertEqual(flush_votes(), 1)
+
+        self.assertEqual(Post.objects.get(pk=post.pk).rating, 9)
+        self.assertEqual(Author.objects.get(pk=post.author_id).rating, 9 * Author.POST_RATING_WEIGHT)
+        self.assertEqual(flush_votes(), 0)
+
+    def test_votes_after_flush_are_queued_again(self):
+        post = create_post()
+        post.like()
+        flush_votes()
+        post.like()
+        flush_votes()
+
+        self.assertEqual(Post.objects.get(pk=post.pk).rating, 2)
+
+    def test_unwritten_slot_is_skipped_after_grace_period(self):
+        post = create_post()
+        # Процесс выделил слот 1 и упал, не записав его
+        cache.add('votes:seq', 0)
+        cache.incr('votes:seq')
+        post.like()
+
+        self.assertEqual(flush_votes(), 0)
+        gap_slot, seen_at = cache.get('votes:gap')
+        self.assertEqual(gap_slot, 1)
+        cache.set('votes:gap', (1, seen_at - votes.SLOT_GRACE_SECONDS))
+        self.assertEqual(flush_votes(), 1)
+        self.assertEqual(Post.objects.get(pk=post.pk).rating, 1)
+        self.assertEqual(cache.get('votes:flushed'), 2)
+
+    def test_failed_update_keeps_votes_in_buffer(self):
+        post = create_post()
+        post.like()
+        with mock.patch.object(Post, 'apply_rating_delta', side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                flush_votes()
+        self.assertIsNone(cache.get('votes:flush_lock'))
+
+        post.like()
+        self.assertEqual(flush_votes(), 1)
+        self.assertEqual(Post.objects.get(pk=post.pk).rating, 2)
+
+    def test_overlapping_flush_does_nothing(self):
+        post = create_post()
+        post.like()
+        cache.add('votes:flush_lock', 'other flush')
+        self.assertEqual(flush_votes(), 0)
+        self.assertEqual(votes.pending_delta(post), 1)
+        cache.delete('votes:flush_lock')
+        self.assertEqual(flush_votes(), 1)
+
+    def test_buffer_keys_expire_after_flush(self):
+        post = create_post()
+        post.like()
+        flush_votes()
+        self.assertEqual(votes.pending_delta(post), 0)
+
+        later = time.time() + votes.BUFFER_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertIsNone(cache.get(f'votes:delta:post:{post.pk}'))
+            # Объект, снова попавший в очередь, продлевает срок своей суммы
+            cache.add(f'votes:delta:post:{post.pk}', 0, 60)
+            post.like()
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later + 120):
+            self.assertEqual(votes.pending_delta(post), 1)
+
+    def test_non_atomic_cache_is_rejected(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        file_cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        two_tier = {'BACKEND': 'news.cache_backends.TwoTierCache', 'OPTIONS': {'SHARED': 'shared'}}
+        with override_settings(CACHES={'default': two_tier, 'shared': file_cache}):
+            with self.assertRaises(ImproperlyConfigured):
+                create_post().like()
+        locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'votes-shared'}
+        with override_settings(CACHES={'default': two_tier, 'shared': locmem}):
+            self.assertTrue(votes.is_buffered())
+
+
+class ConcurrentVotesTest(TransactionTestCase):
+    threads = 8
+    votes_per_thread = 25
+
+    def setUp(self):
+        use_temp_cache(self)
+
+    def test_concurrent_likes_are_not_lost(self):
+        post = create_post()
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def vote():
+            try:
+                instance = Post.objects.get(pk=post.pk)
+                barrier.wait()
+                for _ in range(self.votes_per_thread):
+                    while True:
+                        try:
+                            instance.like()
+                            break
+                        except OperationalError:
+                            # Тестовая SQLite в памяти блокирует таблицу целиком,
+                            # отклоненный голос откатывается целиком и повторяется
+                            time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=vote) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        post.refresh_from_db()
+        post.author.refresh_from_db()
+        expected = self.threads * self.votes_per_thread
+        self.assertEqual(post.rating, expected)
+        self.assertEqual(post.author.rating, expected * Author.POST_RATING_WEIGHT)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        author = Author.objects.create(user=User.objects.create_user('author'))
+        same_time = timezone.now()
+        posts = Post.objects.bulk_create([
+            Post(author=author, post_type=Post.NEWS, title=f'Новость {i}', content='Текст')
+            for i in range(25)
+        ])
+        # Часть постов с одинаковым created_at: порядок должен добиваться по id
+        Post.objects.filter(pk__in=[post.pk for post in posts[:6]]).update(created_at=same_time)
+        self.expected = list(Post.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def walk_forward(self):
+        url = reverse('news_list')
+        pages, cursor = [], None
+        while True:
+            response = self.client.get(url, {'after': cursor} if cursor else {})
+            page = response.context['page_obj']
+            pages.append(page)
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages_cover_all_posts_once(self):
+        pages = self.walk_forward()
+        seen = [post.pk for page in pages for post in page]
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(pages[-1].count, 25)
+
+    def test_previous_cursor_returns_previous_page(self):
+        pages = self.walk_forward()
+        response = self.client.get(reverse('news_list'), {'before': pages[2].previous_cursor})
+        self.assertEqual(list(response.context['page_obj']), list(pages[1]))
+
+    def test_deep_page_query_is_constant(self):
+        last = self.walk_forward()[-1]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('news_list'), {'after': last.previous_cursor})
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        response = self.client.get(reverse('news_list'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'][0].pk, self.expected[0])
+
+
+class PostQueryCountTest(TestCase):
+    """Количество запросов на страницу не должно зависеть от количества постов"""
+
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.author = Author.objects.create(user=User.objects.create_user('author'))
+        self.categories = [Category.objects.create(name=f'Категория {i}') for i in range(3)]
+
+    def create_posts(self, count, post_type):
+        posts = Post.objects.bulk_create([
+            Post(author=self.author, post_type=post_type, title=f'Пост {i}', content='Текст')
+            for i in range(count)
+        ])
+        PostCategory.objects.bulk_create([
+            PostCategory(post=post, category=category)
+            for post in posts for category in self.categories[:2]
+        ])
+        return posts
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_pages(self):
+        for post_type, url in [(Post.NEWS, reverse('news_list')), (Post.ARTICLE, reverse('article_list'))]:
+            with self.subTest(url=url):
+                self.create_posts(2, post_type)
+                few = self.count_queries(url)
+                self.create_posts(8, post_type)
+                many = self.count_queries(url)
+                self.assertEqual(few, many)
+                # Посты, COUNT для статистики и категории одним запросом
+                self.assertLessEqual(many, 3)
+
+    def test_search_page(self):
+        self.create_posts(2, Post.NEWS)
+        few = self.count_queries(reverse('news_search') + '?q=Пост')
+        self.create_posts(8, Post.NEWS)
+        self.assertEqual(few, self.count_queries(reverse('news_search') + '?q=Пост'))
+
+    def test_detail_page_for_subscriber(self):
+        post = self.create_posts(1, Post.ARTICLE)[0]
+        user = User.objects.create_user('reader')
+        Subscription.objects.create(user=user, category=self.categories[0])
+        self.client.force_login(user)
+        # Первый запрос сессии один раз переносит пояс из профиля в сессию
+        self.client.get(reverse('home'))
+
+        few = self.count_queries(reverse('article_detail', args=[post.pk]))
+        PostCategory.objects.create(post=post, category=self.categories[2])
+        self.assertEqual(few, self.count_queries(reverse('article_detail', args=[post.pk])))
+
+
+class CategoryStatsTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.author = Author.objects.create(user=User.objects.create_user('author'))
+        self.politics = Category.objects.create(name='Политика')
+        self.sport = Category.objects.create(name='Спорт')
+
+    def create_post(self, post_type=Post.NEWS):
+        return Post.objects.create(author=self.author, post_type=post_type, title='Пост', content='Текст')
+
+    def assertStatsAccurate(self):
+        expected = compute_category_stats(Category.objects.all())
+        for stats in CategoryStats.objects.all():
+            with self.subTest(category=stats.category_id):
+                self.assertEqual(
+                    {field: getattr(stats, field) for field in CategoryStats.STAT_FIELDS},
+                    {field: expected[stats.category_id][field] for field in CategoryStats.STAT_FIELDS},
+                )
+
+    def test_signals_keep_stats_accurate(self):
+        news, article = self.create_post(), self.create_post(Post.ARTICLE)
+        news.categories.add(self.politics, self.sport)
+        self.sport.post_set.add(article)
+        PostCategory.objects.create(post=article, category=self.politics)
+        self.assertStatsAccurate()
+        self.assertEqual(CategoryStats.objects.get(category=self.politics).posts, 2)
+
+        news.post_type = Post.ARTICLE
+        news.save()
+        self.assertStatsAccurate()
+
+        news.categories.remove(self.sport)
+        article.categories.clear()
+        self.assertStatsAccurate()
+
+        user = User.objects.create_user('reader')
+        Subscription.objects.create(user=user, category=self.sport)
+        Subscription.objects.create(user=user, category=self.politics)
+        Subscription.objects.filter(category=self.politics).delete()
+        self.assertStatsAccurate()
+
+        news.delete()
+        self.assertStatsAccurate()
+        self.assertEqual(CategoryStats.objects.get(category=self.politics).last_post_at, None)
+
+    def test_rebuild_and_missing_rows(self):
+        self.create_post().categories.add(self.politics)
+        CategoryStats.objects.update(posts=100)
+        CategoryStats.objects.filter(category=self.sport).delete()
+        CategoryStats.rebuild()
+        self.assertStatsAccurate()
+
+        CategoryStats.objects.filter(category=self.politics).delete()
+        self.assertEqual(Category.objects.get(pk=self.politics.pk).post_count, 1)
+
+    def test_sidebar_query_count_does_not_depend_on_categories(self):
+        template = Template('{% load news_tags %}{% show_categories %}')
+        for i in range(5):
+            Category.objects.create(name=f'Категория {i}')
+        with self.assertNumQueries(1):
+            html = template.render(Context())
+        self.assertIn('Категория 4', html)
+
+
+class NewsTagsTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.author = Author.objects.create(user=User.objects.create_user('author'))
+        self.category = Category.objects.create(name='Политика')
+
+    def create_post(self, title, post_type=Post.NEWS, rating=0):
+        post = Post.objects.create(author=self.author, post_type=post_type, title=title, content='Текст', rating=rating)
+        post.categories.add(self.category)
+        return post
+
+    def render(self, source):
+        return Template('{% load news_tags %}' + source).render(Context())
+
+    def test_post_stats_single_query(self):
+        self.create_post('Новость')
+        self.create_post('Статья', Post.ARTICLE)
+        with self.assertNumQueries(1):
+            stats = self.render('{% get_post_stats as stats %}{{ stats.total_posts }}/{{ stats.total_news }}/'
+                                '{{ stats.total_articles }}/{{ stats.recent_posts }}')
+        self.assertEqual(stats, '2/1/1/2')
+
+    def test_widgets_are_cached_until_posts_change(self):
+        self.create_post('Первая', rating=5)
+        source = '{% show_recent_posts %}{% show_popular_posts %}{% show_categories %}'
+        html = self.render(source)
+        self.assertIn('Первая', html)
+        self.assertIn('Политика', html)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(source), html)
+
+        self.create_post('Вторая', Post.ARTICLE, rating=10)
+        html = self.render(source)
+        self.assertIn('Вторая', html)
+        self.assertIn('title="Articles">1<', html)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть только в SQLite')
+class EmailTasksTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        self.post = create_post()
+        self.sport = Category.objects.create(name='Спорт')
+        self.science = Category.objects.create(name='Наука')
+        self.post.categories.add(self.sport, self.science)
+        self.reader = User.objects.create_user('reader', email='reader@example.com')
+        for category in (self.sport, self.science):
+            Subscription.objects.create(user=self.reader, category=category)
+
+    def test_notification_once_per_subscriber_with_one_render_per_category(self):
+        for username, categories in (('sports_fan', [self.sport]), ('scientist', [self.science])):
+            user = User.objects.create_user(username, email=f'{username}@example.com')
+            for category in categories:
+                Subscription.objects.create(user=user, category=category)
+
+        with mock.patch.object(tasks, 'render_to_string', wraps=tasks.render_to_string) as render:
+            tasks.notify_subscribers(self.post.pk)
+        # Письма о двух категориях: по html и txt на каждую
+        self.assertEqual(render.call_count, 4)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [
+            'reader@example.com', 'scientist@example.com', 'sports_fan@example.com'
+        ])
+        greetings = {message.to[0]: message.body for message in mail.outbox}
+        self.assertIn('Здравствуйте, sports_fan!', greetings['sports_fan@example.com'])
+        self.assertIn('Здравствуйте, reader!', greetings['reader@example.com'])
+
+    def test_notification_text_is_not_escaped_and_body_keeps_placeholders(self):
+        Post.objects.filter(pk=self.post.pk).update(content='Tom & Jerry "__SUBSCRIBER_NAME__"')
+        tasks.notify_subscribers(self.post.pk)
+
+        message = mail.outbox[0]
+        self.assertIn('Tom & Jerry "__SUBSCRIBER_NAME__"', message.body)
+        html = message.alternatives[0][0]
+        self.assertIn('Tom &amp; Jerry &quot;__SUBSCRIBER_NAME__&quot;', html)
+        self.assertIn('Здравствуйте, reader!', html)
+
+    def test_weekly_digest_sends_one_email_per_user(self):
+        Post.objects.filter(pk=self.post.pk).update(title='Tom & Jerry')
+        tasks.send_weekly_digest()
+        self.assertEqual(len(mail.outbox), 1)
+        body = mail.outbox[0].body
+        self.assertIn('Здравствуйте, reader!', body)
+        self.assertIn('Tom & Jerry', body)
+        self.assertIn('Tom &amp; Jerry', mail.outbox[0].alternatives[0][0])
+        self.assertIn('=== Спорт ===', body)
+        self.assertIn('=== Наука ===', body)
+
+
+class QueryPlanTest(TestCase):
+    """Горячие запросы из views, filters и tasks должны идти по индексам, без сортировки во временном дереве"""
+
+    def setUp(self):
+        use_temp_cache(self)
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_list_pages(self):
+        from .views import ArticleList, NewsList
+        now = timezone.now()
+        for view in (NewsList, ArticleList):
+            with self.subTest(view=view.__name__):
+                queryset = view().get_queryset()
+                self.assertUsesIndex(queryset[:11], 'news_post_list_idx')
+                # Курсорная пагинация (news.pagination.keyset_page) в обе стороны
+                self.assertUsesIndex(queryset.filter(
+                    Q(created_at__lt=now) | Q(created_at=now, id__lt=10)
+                ).order_by('-created_at', '-id')[:11], 'news_post_list_idx')
+                self.assertUsesIndex(queryset.filter(
+                    Q(created_at__gt=now) | Q(created_at=now, id__gt=10)
+                ).order_by('created_at', 'id')[:11], 'news_post_list_idx')
+
+    def test_filters_and_home(self):
+        for filter_class in (NewsFilter, ArticleFilter):
+            with self.subTest(filter=filter_class.__name__):
+                filterset = filter_class(queryset=Post.objects.all())
+                self.assertUsesIndex(filterset.queryset[:10], 'news_post_list_idx')
+                recent = filterset.filter_recent(filterset.queryset, 'only_recent', True)
+                self.assertIn('news_post_list_idx (post_type=? AND created_at>?)', recent.explain())
+        self.assertUsesIndex(
+            Post.objects.headlines().filter(post_type='NW').order_by('-created_at')[:3], 'news_post_list_idx'
+        )
+
+    def test_publish_limit(self):
+        user = User.objects.create_user('author')
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        plan = Post.objects.filter(author__user=user, created_at__gte=today).order_by().explain()
+        self.assertIn('news_post_author_created_idx (author_id=? AND created_at>?)', plan)
+
+    def test_widgets(self):
+        self.assertUsesIndex(
+            Post.objects.headlines().filter(rating__gt=100).order_by('-rating')[:5], 'news_post_rating_idx'
+        )
+        self.assertUsesIndex(Post.objects.headlines().order_by('-created_at')[:5], 'news_post_created_idx')
+
+    def test_weekly_digest(self):
+        week_ago = timezone.now() - timedelta(days=7)
+        self.assertUsesIndex(
+            Post.objects.filter(created_at__gte=week_ago, post_type='AR').order_by('-created_at'),
+            'news_post_list_idx'
+        )
+        plan = PostCategory.objects.filter(post_id__in=[1, 2]).values_list('category_id', 'post_id').explain()
+        self.assertIn('COVERING INDEX', plan)
+
+    def test_post_category_is_unique(self):
+        author = Author.objects.create(user=User.objects.create_user('author'))
+        post = Post.objects.create(author=author, post_type=Post.NEWS, title='Пост', content='Текст')
+        category = Category.objects.create(name='Политика')
+        PostCategory.objects.create(post=post, category=category)
+        with self.assertRaises(IntegrityError):
+            PostCategory.objects.create(post=post, category=category)
+
+
+class PublishLimitTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.user = User.objects.create_user('author', password='pass')
+        group, _ = Group.objects.get_or_create(name='authors')
+        self.user.groups.add(group)
+        self.user.user_permissions.add(Permission.objects.get(codename='add_post'))
+        self.author = Author.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Политика')
+        self.client.force_login(self.user)
+
+    def create_via_form(self, title):
+        return self.client.post(reverse('news_create'), {
+            'title': title, 'content': 'Текст', 'categories': [self.category.pk],
+        })
+
+    def test_limit_enforced_by_counter(self):
+        for i in range(3):
+            self.create_via_form(f'Новость {i}')
+        self.assertEqual(Post.objects.filter(author=self.author).count(), 3)
+
+        response = self.create_via_form('Лишняя')
+        self.assertEqual(Post.objects.filter(author=self.author).count(), 3)
+        self.assertIn('more than 3 news/articles', str(list(get_messages(response.wsgi_request))[-1]))
+        self.assertFalse(publish_limit.can_publish(self.user))
+        self.assertIsNone(publish_limit.reserve(self.user))
+
+        # Проверка лимита берет счетчик из кэша, без COUNT
+        with self.assertNumQueries(0):
+            self.assertEqual(publish_limit.remaining(self.user), 0)
+
+        # Удаление поста сбрасывает счетчик, и он пересчитывается из базы
+        Post.objects.filter(author=self.author).first().delete()
+        self.assertEqual(publish_limit.remaining(self.user), 1)
+
+    def test_posts_created_outside_the_form_are_counted(self):
+        self.assertEqual(publish_limit.remaining(self.user), 3)
+        Post.objects.create(author=self.author, post_type=Post.NEWS, title='Из админки', content='Текст')
+        self.assertEqual(publish_limit.remaining(self.user), 2)
+
+    def test_day_starts_at_local_midnight(self):
+        post = Post.objects.create(author=self.author, post_type=Post.NEWS, title='Пост', content='Текст')
+        for tz in ('Pacific/Kiritimati', 'Pacific/Pago_Pago'):
+            with self.subTest(tz=tz), timezone.override(tz):
+                day_start, day_end = publish_limit.day_bounds()
+                self.assertEqual(timezone.localtime(day_start).hour, 0)
+                self.assertEqual(day_end - day_start, timedelta(days=1))
+
+                Post.objects.filter(pk=post.pk).update(created_at=day_start - timedelta(seconds=1))
+                publish_limit.invalidate(self.user.pk)
+                self.assertEqual(publish_limit.posts_today(self.user), 0)
+
+                Post.objects.filter(pk=post.pk).update(created_at=day_start)
+                publish_limit.invalidate(self.user.pk)
+                self.assertEqual(publish_limit.posts_today(self.user), 1)
+
+
+
+class ConcurrentPublishLimitTest(TransactionTestCase):
+    threads = 6
+
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.user = User.objects.create_user('author')
+        self.user.groups.add(Group.objects.get_or_create(name='authors')[0])
+        self.user.user_permissions.add(Permission.objects.get(codename='add_post'))
+        self.author = Author.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Политика')
+
+    def test_database_guard_holds_when_cache_counter_races(self):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def publish(n, client):
+            try:
+                barrier.wait(timeout=30)
+                while True:
+                    try:
+                        client.post(reverse('news_create'), {
+                            'title': f'Новость {n}', 'content': 'Текст', 'categories': [self.category.pk],
+                        })
+                        break
+                    except OperationalError:
+                        # Тестовая SQLite в памяти блокирует таблицу целиком - запрос повторяется
+                        time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        # Неатомарный incr файлового кэша: все отправки проходят проверку счетчика
+        with mock.patch.object(publish_limit, 'reserve', return_value=1):
+            workers = []
+            for n in range(self.threads):
+                client = Client()
+                client.force_login(self.user)
+                workers.append(threading.Thread(target=publish, args=(n, client)))
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Post.objects.filter(author=self.author).count(), publish_limit.daily_limit())
+
+class RolesTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.authors, _ = Group.objects.get_or_create(name='authors')
+        self.user = User.objects.create_user('reader')
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_roles_are_memoized_and_cached(self):
+        user = self.fresh_user()
+        with self.assertNumQueries(1):
+            self.assertFalse(roles.is_author(user))
+            self.assertFalse(roles.is_author(user))
+
+        # Следующий запрос - новый объект пользователя, группы берутся из кэша
+        other_request_user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertFalse(roles.is_author(other_request_user))
+
+    def test_group_changes_invalidate_cache(self):
+        self.assertFalse(roles.is_author(self.fresh_user()))
+
+        self.user.groups.add(self.authors)
+        self.assertTrue(roles.is_author(self.fresh_user()))
+
+        self.authors.user_set.remove(self.user)
+        self.assertFalse(roles.is_author(self.fresh_user()))
+
+        self.authors.user_set.add(self.user)
+        self.assertTrue(roles.is_author(self.fresh_user()))
+        self.authors.user_set.clear()
+        self.assertFalse(roles.is_author(self.fresh_user()))
+
+        self.authors.user_set.add(self.user)
+        self.authors.name = 'editors'
+        self.authors.save()
+        self.assertFalse(roles.is_author(self.fresh_user()))
+
+    def test_page_checks_role_once(self):
+        self.user.groups.add(self.authors)
+        self.client.force_login(self.user)
+        self.client.get(reverse('news_list'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('become_author'))
+        self.assertFalse([q for q in queries if 'auth_user_groups' in q['sql']])
+
+
+class TimezoneSelectTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+
+    def test_selected_timezone_comes_from_session(self):
+        response = self.client.get(reverse('news_list'))
+        self.assertContains(response, '<option value="Asia/Tokyo" >')
+
+        self.client.post(reverse('set_timezone'), {'timezone': 'Asia/Tokyo'})
+        self.assertContains(self.client.get(reverse('news_list')), '<option value="Asia/Tokyo" selected>')
+        self.assertContains(self.client.get(reverse('news_search')), '<option value="Asia/Tokyo" selected>')
+
+    def test_zone_outside_common_list_stays_selectable(self):
+        self.client.post(reverse('set_timezone'), {'timezone': 'Asia/Kamchatka'})
+        self.assertContains(self.client.get(reverse('news_list')), '<option value="Asia/Kamchatka" selected>')
+
+
+class TimezoneMiddlewareTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        self.user = User.objects.create_user('reader')
+        self.seen = []
+
+    def get_response(self, request):
+        self.seen.append(timezone.get_current_timezone())
+        return 'response'
+
+    async def aget_response(self, request):
+        return self.get_response(request)
+
+    def make_request(self, user=None, tzname=None):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        if tzname is not None:
+            request.session['django_timezone'] = tzname
+        request.user = user or AnonymousUser()
+
+        async def auser():
+            return request.user
+        request.auser = auser
+        return request
+
+    def test_session_timezone_is_cached_zoneinfo(self):
+        middleware = TimezoneMiddleware(self.get_response)
+        with self.assertNumQueries(0):
+            middleware(self.make_request(tzname='Asia/Tokyo'))
+            middleware(self.make_request(tzname='Asia/Tokyo'))
+        self.assertEqual(self.seen[0].key, 'Asia/Tokyo')
+        self.assertIs(self.seen[0], self.seen[1])
+
+    def test_unknown_timezone_falls_back_to_default(self):
+        TimezoneMiddleware(self.get_response)(self.make_request(tzname='Mars/Olympus'))
+        self.assertEqual(str(self.seen[0]), 'Europe/Moscow')
+
+    def test_profile_timezone_is_read_once_per_session(self):
+        UserProfile.objects.create(user=self.user, timezone='America/New_York')
+        middleware = TimezoneMiddleware(self.get_response)
+        request = self.make_request(user=self.user)
+        with self.assertNumQueries(1):
+            middleware(request)
+        self.assertEqual(request.session['django_timezone'], 'America/New_York')
+        with self.assertNumQueries(0):
+            middleware(request)
+        self.assertEqual([zone.key for zone in self.seen], ['America/New_York'] * 2)
+
+    async def test_async_mode(self):
+        await UserProfile.objects.acreate(user=self.user, timezone='Asia/Shanghai')
+        middleware = TimezoneMiddleware(self.aget_response)
+        self.assertTrue(middleware.async_mode)
+
+        self.assertEqual(await middleware(self.make_request(tzname='Europe/Paris')), 'response')
+        await middleware(self.make_request(user=self.user))
+        await middleware(self.make_request())
+        self.assertEqual([str(zone) for zone in self.seen], ['Europe/Paris', 'Asia/Shanghai', 'Europe/Moscow'])
+
+    def test_set_timezone_rejects_unknown_names(self):
+        self.client.post(reverse('set_timezone'), {'timezone': 'Mars/Olympus'})
+        self.assertNotIn('django_timezone', self.client.session)
+        self.client.post(reverse('set_timezone'), {'timezone': 'Europe/Berlin'})
+        self.assertEqual(self.client.session['django_timezone'], 'Europe/Berlin')
+
+    def test_set_timezone_resets_to_server_time(self):
+        self.client.post(reverse('set_timezone'), {'timezone': 'Europe/Berlin'})
+        response = self.client.post(reverse('set_timezone'), {'timezone': ''}, follow=True)
+        self.assertEqual(self.client.session['django_timezone'], '')
+        self.assertEqual(str(list(response.context['messages'])[-1]), 'Timezone updated successfully!')
+
+        TimezoneMiddleware(self.get_response)(self.make_request(user=self.user, tzname=''))
+        self.assertEqual(str(self.seen[0]), 'Europe/Moscow')
+
+
+
+class QueryInstrumentationTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.post = create_post()
+
+    def get_response(self, request):
+        for _ in range(3):
+            list(Post.objects.filter(pk=self.post.pk))
+        list(Post.objects.filter(pk=self.post.pk + 1))
+        return HttpResponse('ok')
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('news.sql', 'INFO') as logs:
+            response = self.client.get(reverse('news_list'))
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+        self.assertEqual(logs.records[0].url_name, 'news_list')
+        self.assertIn('view=news_list', logs.output[0])
+        self.assertEqual(logs.records[0].sql_stats['duplicates'], 0)
+
+    def test_counts_duplicates_and_repeated_queries(self):
+        middleware = QueryInstrumentationMiddleware(self.get_response)
+        with self.assertLogs('news.sql', 'INFO') as logs:
+            middleware(RequestFactory().get('/'))
+        stats = logs.records[0].sql_stats
+        self.assertEqual(stats['queries'], 4)
+        self.assertEqual(stats['duplicates'], 2)
+        self.assertEqual(stats['repeated'], 4)
+
+    async def test_async_mode(self):
+        async def aget_response(request):
+            await Post.objects.filter(pk=self.post.pk).afirst()
+            await Post.objects.filter(pk=self.post.pk).afirst()
+            return HttpResponse('ok')
+
+        middleware = QueryInstrumentationMiddleware(aget_response)
+        self.assertTrue(middleware.async_mode)
+        with self.assertLogs('news.sql', 'INFO') as logs:
+            response = await middleware(RequestFactory().get('/'))
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertEqual(logs.records[0].sql_stats['duplicates'], 1)
+
+    @override_settings(SQL_BUDGETS={'news_list': {'queries': 0}}, SQL_BUDGET_ACTION='log')
+    def test_budget_exceeded_is_logged(self):
+        with self.assertLogs('news.sql', 'WARNING') as logs:
+            response = self.client.get(reverse('news_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('news_list', logs.output[0])
+        self.assertIn('queries=', logs.output[0])
+
+    @override_settings(SQL_BUDGETS={'news_list': {'queries': 0}}, SQL_BUDGET_ACTION='raise')
+    def test_budget_exceeded_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('news_list'))
+
+    @override_settings(SQL_BUDGETS={'news_list': {'queries': 0}}, SQL_BUDGET_ACTION='raise')
+    def test_server_errors_are_not_replaced_by_budget_errors(self):
+        def failing_view(request):
+            list(Post.objects.all())
+            return HttpResponseServerError()
+
+        request = RequestFactory().get('/')
+        request.resolver_match = mock.Mock(view_name='news_list')
+        response = QueryInstrumentationMiddleware(failing_view)(request)
+        self.assertEqual(response.status_code, 500)
+
+    @override_settings(SQL_BUDGET_ACTION='raise')
+    def test_detail_pages_fit_declared_budgets_on_cold_cache(self):
+        category = Category.objects.create(name='Политика')
+        news = Post.objects.create(author=self.post.author, post_type=Post.NEWS, title='Новость', content='Текст')
+        for post in (self.post, news):
+            post.categories.add(category)
+        Subscription.objects.create(user=self.post.author.user, category=category)
+        self.client.force_login(self.post.author.user)
+        for url in (reverse('article_detail', args=[self.post.pk]), reverse('news_detail', args=[news.pk])):
+            cache.clear()
+            with self.assertLogs('news.sql', 'INFO') as logs:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(logs.records[-1].sql_stats['duplicates'], 0)
+
+    @override_settings(SQL_BUDGETS={'news_list': {'queries': 100}}, SQL_BUDGET_ACTION='raise', SQL_SERVER_TIMING=False)
+    def test_within_budget(self):
+        response = self.client.get(reverse('news_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+
+class CensoredCacheTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.post = create_post()
+        self.post.content = 'Он мудак'
+        self.post.save()
+
+    def cached_variants(self, post):
+        keys = {variant: censorship.censored_cache_key(post, variant) for variant in censorship.CENSORED_VARIANTS}
+        values = cache.get_many(keys.values())
+        return {variant: values.get(key) for variant, key in keys.items()}
+
+    def test_save_warms_every_variant(self):
+        self.assertEqual(self.cached_variants(self.post), {
+            variant: render(self.post) for variant, render in censorship.CENSORED_VARIANTS.items()
+        })
+        # Просмотр не цензурирует заново
+        with mock.patch.object(censorship.engine, 'censor', side_effect=AssertionError):
+            self.assertEqual(censorship.get_censored(self.post, 'content'), 'Он м****')
+
+    def test_edit_and_word_lists_change_the_key(self):
+        old_key = censorship.censored_cache_key(self.post, 'content')
+        self.post.content = 'Он редиска'
+        self.post.save()
+        self.assertNotEqual(censorship.censored_cache_key(self.post, 'content'), old_key)
+        self.assertEqual(censorship.get_censored(self.post, 'content'), 'Он р*****а')
+
+        with mock.patch.object(censorship.engine, 'lists_hash', 'changed'):
+            self.assertIsNone(cache.get(censorship.censored_cache_key(self.post, 'content')))
+
+    def test_delete_evicts_current_version(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.delete()
+        post.pk = self.post.pk
+        self.assertEqual(set(self.cached_variants(post).values()), {None})
+
+
+class NewsSearchTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.author = Author.objects.create(user=User.objects.create_user('author'))
+
+    def create_news(self, title, content='Текст'):
+        return Post.objects.create(author=self.author, post_type=Post.NEWS, title=title, content=content)
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('news_search'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [post.pk for post in response.context['news']]
+
+    def test_stemmed_title_and_content_match(self):
+        in_title = self.create_news('Выборы президента')
+        in_content = self.create_news('Итоги недели', 'Подведены итоги выборов в регионах')
+        self.create_news('Погода', 'Завтра дожди')
+
+        # Совпадение в заголовке ранжируется выше совпадения в тексте
+        self.assertEqual(self.search('выборах'), [in_title.pk, in_content.pk])
+
+    def test_index_follows_edits_and_deletes(self):
+        post = self.create_news('Футбольный матч')
+        self.assertEqual(self.search('матчи'), [post.pk])
+
+        post.title = 'Хоккейный турнир'
+        post.save()
+        self.assertEqual(self.search('матчи'), [])
+        self.assertEqual(self.search('турниры'), [post.pk])
+
+        post.delete()
+        self.assertEqual(self.search('турниры'), [])
+
+    def test_results_are_paginated(self):
+        for i in range(15):
+            self.create_news(f'Новости спорта {i}')
+        first = self.search('спорт')
+        second = self.search('спорт', page=2)
+        self.assertEqual((len(first), len(second)), (10, 5))
+        self.assertFalse(set(first) & set(second))
+
+
+class TaggedCacheTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.author = Author.objects.create(user=User.objects.create_user('author'))
+        self.category = Category.objects.create(name='Политика')
+
+    def create_news(self, title):
+        post = Post.objects.create(author=self.author, post_type=Post.NEWS, title=title, content='Текст')
+        post.categories.add(self.category)
+        return post
+
+    def test_saving_post_invalidates_only_dependent_entries(self):
+        first, second = self.create_news('Первая'), self.create_news('Вторая')
+        tagged_cache.set('first', 1, tagged_cache.post_tags(first))
+        tagged_cache.set('second', 2, [tagged_cache.post_tag(second.pk)])
+        tagged_cache.set('articles', 3, [tagged_cache.list_tag(Post.ARTICLE)])
+
+        first.title = 'Первая (обновлено)'
+        first.save()
+
+        self.assertIsNone(tagged_cache.get('first', tagged_cache.post_tags(first)))
+        self.assertEqual(tagged_cache.get('second', [tagged_cache.post_tag(second.pk)]), 2)
+        self.assertEqual(tagged_cache.get('articles', [tagged_cache.list_tag(Post.ARTICLE)]), 3)
+
+    def test_list_page_is_never_stale(self):
+        post = self.create_news('Старый заголовок')
+        url = reverse('news_list')
+        self.assertContains(self.client.get(url), 'Старый заголовок')
+
+        post.title = 'Новый заголовок'
+        post.save()
+        self.assertContains(self.client.get(url), 'Новый заголовок')
+
+        self.category.name = 'Экономика'
+        self.category.save()
+        self.assertContains(self.client.get(url), 'Экономика')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.like()
+        self.assertContains(self.client.get(url), 'Rating:</strong> 1')
+
+        self.create_news('Еще одна новость')
+        self.assertEqual(self.client.get(url).context['total_news_count'], 2)
+
+    def test_category_change_invalidates_post(self):
+        post = self.create_news('Новость')
+        other = Category.objects.create(name='Спорт')
+        tags = tagged_cache.post_tags(post, [self.category.pk, other.pk])
+        tagged_cache.set('post', 1, tags)
+
+        other.post_set.add(post)
+        self.assertIsNone(tagged_cache.get('post', tags))
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.author = Author.objects.create(user=User.objects.create_user('author'))
+        self.post = Post.objects.create(author=self.author, post_type=Post.NEWS, title='Новость', content='Текст')
+        self.url = reverse('news_detail', args=[self.post.pk])
+
+    def test_warm_anonymous_page_does_not_touch_database(self):
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Новость')
+
+    def test_personal_parts_are_filled_per_user(self):
+        self.client.get(self.url)
+
+        self.client.force_login(self.author.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, reverse('news_update', args=[self.post.pk]))
+        self.assertNotContains(response, '<!--hole:')
+
+        self.client.force_login(User.objects.create_user('reader'))
+        response = self.client.get(self.url)
+        self.assertNotContains(response, reverse('news_update', args=[self.post.pk]))
+        self.assertContains(response, ', reader')
+
+    def test_edit_invalidates_page(self):
+        self.client.get(self.url)
+        self.post.title = 'Исправленная новость'
+        self.post.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Исправленная новость')
+
+    def test_hole_markers_in_post_content_are_not_filled(self):
+        # Текст поста в списке выводится как HTML: автор пытается вставить метку,
+        # которая отрендерит для каждого читателя меню пользователя с формой выхода
+        self.post.content = '<!--hole:{"template":"news/holes/user_nav.html","params":{}}-->'
+        self.post.save()
+        self.client.force_login(User.objects.create_user('reader'))
+        for status in ('miss', 'hit'):
+            response = self.client.get(reverse('news_list'))
+            self.assertEqual(response['X-Page-Cache'], status)
+            self.assertContains(response, self.post.content)
+            self.assertContains(response, reverse('account_logout'), count=1)
+
+    def test_subscriptions_are_read_once_per_page(self):
+        user = User.objects.create_user('reader')
+        category = Category.objects.create(name='Политика')
+        self.post.categories.add(category)
+        Subscription.objects.create(user=user, category=category)
+        self.client.force_login(user)
+        self.client.get(reverse('home'))
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, reverse('unsubscribe_from_category', args=[category.pk]))
+        subscription_queries = [q for q in captured if 'news_subscription' in q['sql']]
+        self.assertEqual(len(subscription_queries), 1)
+
+
+def two_tier_worker(worker_id, workers, rounds, barrier, results):
+    """Воркер в отдельном процессе: каждый раунд - один "запрос" с чтением и записью"""
+    for n in range(rounds):
+        barrier.wait()
+        cache_backends._start_request()
+        try:
+            value = cache.get('shared-value')
+            others = cache.get_many([f'worker:{i}' for i in range(workers) if i != worker_id])
+        finally:
+            cache_backends._finish_request()
+        results.put((worker_id, n, value, others))
+        # Все прочитали - теперь каждый пишет свой ключ для следующего раунда
+        barrier.wait()
+        cache.set(f'worker:{worker_id}', n)
+        barrier.wait()
+
+
+class TwoTierCacheProcessesTest(SimpleTestCase):
+    workers = 4
+    rounds = 6
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        override = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'news.cache_backends.TwoTierCache',
+                'OPTIONS': {'SHARED': 'shared', 'LOCAL_TIMEOUT': 600},
+            },
+            'shared': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            },
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_workers_see_each_others_writes(self):
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(self.workers + 1)
+        results = context.Queue()
+        processes = [
+            context.Process(target=two_tier_worker, args=(i, self.workers, self.rounds, barrier, results))
+            for i in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        try:
+            seen = []
+            for n in range(self.rounds):
+                # Нечетные раунды проверяют удаление, четные - перезапись уже закэшированного в L1 значения
+                if n % 2:
+                    cache.delete('shared-value')
+                else:
+                    cache.set('shared-value', n)
+                for _ in range(3):
+                    barrier.wait(timeout=30)
+                seen += [results.get(timeout=30) for _ in range(self.workers)]
+        finally:
+            for process in processes:
+                process.join(timeout=30)
+
+        self.assertEqual(len(seen), self.workers * self.rounds)
+        for worker_id, n, value, others in seen:
+            self.assertEqual(value, None if n % 2 else n, (worker_id, n))
+            expected = {} if n == 0 else {
+                f'worker:{i}': n - 1 for i in range(self.workers) if i != worker_id
+            }
+            self.assertEqual(others, expected, (worker_id, n))
+
+    def test_local_tier_serves_repeated_reads(self):
+        cache.set('key', 'value')
+        shared = caches['shared']
+        cache_backends._start_request()
+        try:
+            self.assertEqual(cache.get('key'), 'value')
+            shared.set('key', 'changed behind the back')
+            # В пределах запроса значение берется из L1
+            self.assertEqual(cache.get('key'), 'value')
+        finally:
+            cache_backends._finish_request()
+
+    def read_in_request(self, backend, key):
+        cache_backends._start_request()
+        try:
+            return backend.get(key)
+        finally:
+            cache_backends._finish_request()
+
+    def test_fill_keeps_local_tiers_and_overwrite_resets_others(self):
+        # Второй экземпляр со своим L1 - как другой процесс
+        other = cache_backends.TwoTierCache('other', {'OPTIONS': {'SHARED': 'shared', 'LOCAL_TIMEOUT': 600}})
+        shared = caches['shared']
+        # Первая сверка поколения в процессе очищает его L1
+        self.read_in_request(cache, 'a')
+        self.read_in_request(other, 'a')
+        cache.set('a', 1)
+        self.assertEqual(self.read_in_request(other, 'a'), 1)
+
+        # Заполнение нового ключа не сбрасывает L1 ни у себя, ни у других
+        cache.set('b', 2)
+        shared.set('a', 'changed behind the back')
+        shared.set('b', 'changed behind the back')
+        self.assertEqual(self.read_in_request(cache, 'b'), 2)
+        self.assertEqual(self.read_in_request(other, 'a'), 1)
+
+        # Перезапись существующего ключа сбрасывает чужой L1, но не свой
+        cache.set('a', 3)
+        self.assertEqual(self.read_in_request(other, 'a'), 3)
+        self.assertEqual(self.read_in_request(cache, 'b'), 2)
+
+        cache.delete('a')
+        self.assertIsNone(self.read_in_request(other, 'a'))
+
+    def test_local_store_per_location(self):
+        params = {'OPTIONS': {'SHARED': 'shared'}}
+        first = cache_backends.TwoTierCache('first', params)
+        second = cache_backends.TwoTierCache('second', params)
+        self.assertIsNot(first._store, second._store)
+        self.assertIs(cache_backends.TwoTierCache('first', params)._store, first._store)
+        # Без LOCATION - по алиасу общего кэша
+        self.assertIsNot(cache_backends.TwoTierCache('', params)._store,
+                         cache_backends.TwoTierCache('', {'OPTIONS': {'SHARED': 'default'}})._store)
+
+
+class CachedComputeTest(SimpleTestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['value']
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(compute_cache.cached_compute('key', compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['value']] * 8)
+
+    def test_slow_compute_does_not_block_keys_of_its_stripe(self):
+        started, finish = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            finish.wait(5)
+            return ['slow']
+
+        # Все ключи попадают в одну корзину
+        with mock.patch.object(compute_cache, '_stripes', [threading.Lock()]):
+            thread = threading.Thread(target=compute_cache.cached_compute, args=('slow', slow))
+            thread.start()
+            started.wait(5)
+            begun = time.monotonic()
+            self.assertEqual(compute_cache.cached_compute('fast', lambda: ['fast']), ['fast'])
+            self.assertLess(time.monotonic() - begun, 1)
+            finish.set()
+            thread.join()
+        self.assertEqual(compute_cache.cached_compute('slow', slow), ['slow'])
+
+    def test_empty_result_is_cached(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return []
+
+        self.assertEqual(compute_cache.cached_compute('empty', compute), [])
+        self.assertEqual(compute_cache.cached_compute('empty', compute), [])
+        self.assertEqual(len(calls), 1)
+
+    def test_early_refresh_near_expiry(self):
+        self.assertFalse(compute_cache.should_refresh(0.01, time.time() + 60))
+        self.assertTrue(compute_cache.should_refresh(0.01, time.time() - 1))
+        # Вычисление дольше оставшегося срока - почти наверняка пересчитываем заранее
+        refreshes = sum(compute_cache.should_refresh(10, time.time() + 1) for _ in range(100))
+        self.assertGreater(refreshes, 80)
+
+
+class DumpDataMixin:
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = f'{self.directory}/news.jsonl.gz'
+
+        self.user = User.objects.create_user('writer', password='secret')
+        self.user.groups.add(Group.objects.get(name='authors'))
+        UserProfile.objects.create(user=self.user, timezone='Asia/Tokyo')
+        author = Author.objects.create(user=self.user, rating=7)
+        self.sport = Category.objects.create(name='Спорт')
+        Subscription.objects.create(user=self.user, category=self.sport)
+        for number in range(5):
+            post = Post.objects.create(author=author, post_type=Post.NEWS, title=f'Матч {number}', content='Счет')
+            post.categories.add(self.sport)
+        self.post = Post.objects.order_by('pk').first()
+        Comment.objects.create(post=self.post, user=self.user, text='Отлично')
+        self.created_at = timezone.now() - timedelta(days=30)
+        Post.objects.filter(pk=self.post.pk).update(created_at=self.created_at)
+
+    def wipe(self):
+        User.objects.all().delete()
+        Category.objects.all().delete()
+
+    def assert_restored(self):
+        user = User.objects.get(username='writer')
+        self.assertTrue(user.check_password('secret'))
+        self.assertTrue(roles.is_author(user))
+        self.assertEqual(UserProfile.objects.get(user=user).timezone, 'Asia/Tokyo')
+        self.assertEqual(Author.objects.get(user=user).rating, 7)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).created_at, self.created_at)
+        self.assertEqual(Comment.objects.get().post_id, self.post.pk)
+        sport = Category.objects.get(name='Спорт')
+        self.assertEqual((sport.news_count, sport.subscriber_count), (5, 1))
+        self.assertEqual(PostCategory.objects.count(), 5)
+
+
+class DumpLoadTest(DumpDataMixin, TestCase):
+    def test_round_trip(self):
+        counts = dump.dump(self.path, chunk_size=2)
+        self.assertEqual((counts['news.post'], counts['news.postcategory']), (5, 5))
+        self.wipe()
+
+        loaded = dump.load(self.path, batch_size=3)
+        self.assertEqual(loaded['news.post'], 5)
+        self.assert_restored()
+        self.assertFalse(os.path.exists(dump.checkpoint_path(self.path)))
+
+    def test_resume_from_checkpoint(self):
+        dump.dump(self.path)
+        self.wipe()
+
+        def crash(label, count, line):
+            if label == 'news.post' and count >= 2:
+                raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            dump.load(self.path, batch_size=2, progress=crash)
+        self.assertEqual(Post.objects.count(), 2)
+        checkpoint = dump.read_checkpoint(self.path)['line']
+        self.assertGreater(checkpoint, 0)
+
+        loaded = dump.load(self.path, batch_size=2)
+        self.assertEqual(loaded['news.post'], 3)
+        self.assertNotIn('auth.user', loaded)
+        self.assert_restored()
+
+    def test_committed_batch_without_checkpoint_is_not_loaded_twice(self):
+        dump.dump(self.path)
+        self.wipe()
+
+        def crash(label, count, line):
+            if label == 'news.post' and count >= 2:
+                raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            dump.load(self.path, batch_size=2, progress=crash)
+        # Пачка зафиксирована, а контрольная точка осталась на предыдущей
+        state = dump.read_checkpoint(self.path)
+        state['line'] -= 2
+        dump.write_checkpoint(self.path, state)
+
+        dump.load(self.path, batch_size=2)
+        self.assert_restored()
+
+    def test_load_keeps_unrelated_cache_entries(self):
+        dump.dump(self.path)
+        self.wipe()
+        news_tags = [tagged_cache.list_tag(Post.NEWS)]
+        tagged_cache.set('news_count', 0, news_tags)
+        roles.group_names(self.user)
+        cache.set('votes:delta:post:1', 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dump.load(self.path)
+        self.assertIsNone(tagged_cache.get('news_count', news_tags))
+        self.assertIsNone(cache.get(f'roles:{self.user.pk}'))
+        self.assertEqual(cache.get('votes:delta:post:1'), 4)
+
+    def test_refuses_non_empty_target(self):
+        dump.dump(self.path)
+        Post.objects.filter(pk=self.post.pk).update(title='Изменено')
+
+        with self.assertRaises(dump.TargetNotEmpty):
+            dump.load(self.path)
+        with self.assertRaisesMessage(CommandError, '--force'):
+            call_command('loadnews', self.path, stdout=StringIO())
+
+        # force дописывает выгрузку, не трогая существующие строки
+        Post.objects.exclude(pk=self.post.pk).delete()
+        loaded = dump.load(self.path, force=True)
+        self.assertEqual(loaded['news.post'], 5)
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).title, 'Изменено')
+
+
+# Снимок SQLite делается через backup API, который ждет конца открытой транзакции
+# записи, поэтому данные должны быть зафиксированы
+class ParallelDumpTest(DumpDataMixin, TransactionTestCase):
+    def test_parallel_dump_from_snapshot(self):
+        directory = f'{self.directory}/parallel'
+        manifest = dump.dump_parallel(directory, workers=2, chunk_size=2)
+
+        post_files = [entry for entry in manifest['files'] if entry['model'] == 'news.post']
+        self.assertEqual([entry['rows'] for entry in post_files], [2, 3])
+        self.assertEqual(post_files[0]['pk_range'][1], post_files[1]['pk_range'][0])
+        self.assertFalse(os.path.exists(f'{directory}/.snapshot.sqlite3'))
+        self.assertEqual(dump.verify(directory), [])
+        self.wipe()
+
+        loaded = dump.load(directory, batch_size=2)
+        self.assertEqual(loaded['news.post'], 5)
+        self.assert_restored()
+
+    def test_verify_detects_damaged_shard(self):
+        directory = f'{self.directory}/parallel'
+        manifest = dump.dump_parallel(directory, workers=2)
+        damaged = manifest['files'][-1]['file']
+        with open(f'{directory}/{damaged}', 'ab') as f:
+            f.write(b'garbage')
+        self.assertEqual(dump.verify(directory), [damaged])
+
+
+class CorpusTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+
+    def generate(self):
+        created = corpus.CorpusGenerator(2000, seed=7, batch_size=300).run()
+        snapshot = list(Post.objects.order_by('pk').values_list('author_id', 'title', 'created_at', 'rating'))
+        return created, snapshot
+
+    def test_corpus_is_deterministic(self):
+        created, posts = self.generate()
+        self.assertEqual(created['news.post'], 400)
+        self.assertEqual(Post.objects.count(), 400)
+        self.assertEqual(PostCategory.objects.count(), created['news.postcategory'])
+        self.assertGreaterEqual(created['news.postcategory'], 400)
+        self.assertTrue(Post.objects.filter(content__contains='мудак').exists())
+        # Сигналы не срабатывали - производные данные пересчитаны в конце
+        self.assertEqual(sum(stats.posts for stats in CategoryStats.objects.all()), created['news.postcategory'])
+        self.assertTrue(roles.is_author(Author.objects.first().user))
+
+        User.objects.all().delete()
+        Category.objects.all().delete()
+        self.assertEqual(self.generate(), (created, posts))
+
+
+class BenchmarkRequestsTest(TestCase):
+    def setUp(self):
+        use_temp_cache(self)
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.output = f'{directory}/result.json'
+        post = create_post()
+        post.categories.add(Category.objects.create(name='Наука'))
+
+    def benchmark(self, **options):
+        call_command('benchmark_requests', iterations=2, warmup=1, profile_iterations=1,
+                     output=self.output, stdout=StringIO(), **options)
+        with open(self.output, encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_report_and_rollback(self):
+        report = self.benchmark()
+        self.assertEqual(set(report['results']), {
+            'news_list', 'article_list', 'news_search', 'article_detail', 'news_create', 'subscribe', 'unsubscribe'
+        })
+        # Единственный пост после прогрева отдается из кэша страниц
+        self.assertEqual(report['results']['article_detail']['queries'], 0)
+        self.assertGreater(report['results']['subscribe']['queries'], 0)
+        self.assertEqual(report['meta']['posts'], 1 + 1 + 2 + 1)
+        # Созданные замером посты и пользователи откатываются
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(User.objects.filter(username__startswith='benchmark_').exists())
+
+    def test_more_queries_than_baseline_fail_the_run(self):
+        report = self.benchmark(only=['subscribe'])
+        queries = report['results']['subscribe']['queries']
+        report['results']['subscribe']['queries'] -= 1
+        baseline = f'{self.output}.baseline'
+        with open(baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f)
+        with self.assertRaisesMessage(CommandError, f'subscribe: queries {queries - 1} -> {queries}'):
+            self.benchmark(only=['subscribe'], baseline=baseline)
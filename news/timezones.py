@@ -0,0 +1,40 @@
+"""Часовые пояса для переключателя в шапке сайта"""
+import functools
+import zoneinfo
+
+# Список распространенных часовых поясов (можно расширить)
+COMMON_TIMEZONES = [
+    'UTC',
+    'Europe/Moscow',
+    'Europe/London',
+    'Europe/Berlin',
+    'Europe/Paris',
+    'America/New_York',
+    'America/Los_Angeles',
+    'Asia/Tokyo',
+    'Asia/Shanghai',
+    'Australia/Sydney',
+]
+
+# HTML списка меняется только вместе с кодом, поэтому живет долго
+SELECT_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+@functools.cache
+def known_timezones():
+    """Все имена поясов из базы IANA (читается с диска один раз на процесс)"""
+    return frozenset(zoneinfo.available_timezones()) | frozenset(COMMON_TIMEZONES)
+
+
+@functools.cache
+def select_timezones():
+    """Варианты переключателя: сначала распространенные пояса, затем все остальные по алфавиту"""
+    return COMMON_TIMEZONES + sorted(known_timezones() - frozenset(COMMON_TIMEZONES))
+
+
+@functools.cache
+def get_zone(name):
+    """ZoneInfo по имени или None для неизвестного пояса; объекты создаются один раз"""
+    if not name or name not in known_timezones():
+        return None
+    return zoneinfo.ZoneInfo(name)
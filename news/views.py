@@ -5,7 +5,6 @@ from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMix
 from django.contrib.auth.models import Group
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseForbidden
-from django.utils import timezone
 from datetime import timedelta
 from django.contrib import messages
 from django.shortcuts import redirect
@@ -13,33 +12,58 @@ from .models import Post, Author, Category, Subscription, Article, News
 from .forms import PostForm, ArticleForm, NewsForm
 from django_filters.views import FilterView
 from .filters import NewsFilter, ArticleFilter
+from . import publish_limit, roles
+from .pagination import PostPaginationMixin
+from .page_cache import CachedPageMixin
+from .search import search_posts
+from .tagged_cache import list_tag
+from .timezones import get_zone
+from django.core.paginator import Paginator
+from django.db import transaction
 from django.views.generic import TemplateView
-from django.views.decorators.cache import cache_page
-from django.utils.decorators import method_decorator
 from django.utils.translation import gettext as _
+from django.utils.functional import SimpleLazyObject, cached_property
 
 
 def set_timezone(request):
     if request.method == 'POST':
-        request.session['django_timezone'] = request.POST['timezone']
-        messages.success(request, _('Timezone updated successfully!'))
+        tzname = request.POST.get('timezone', '')
+        # Пустое значение - "Время сервера": TimezoneMiddleware сбрасывает активный пояс
+        if tzname and get_zone(tzname) is None:
+            messages.error(request, _('Unknown timezone'))
+        else:
+            request.session['django_timezone'] = tzname
+            messages.success(request, _('Timezone updated successfully!'))
         return redirect(request.META.get('HTTP_REFERER', '/'))
     return redirect('/')
 
 
-# Список распространенных часовых поясов (можно расширить)
-COMMON_TIMEZONES = [
-    'UTC',
-    'Europe/Moscow',
-    'Europe/London',
-    'Europe/Berlin',
-    'Europe/Paris',
-    'America/New_York',
-    'America/Los_Angeles',
-    'Asia/Tokyo',
-    'Asia/Shanghai',
-    'Australia/Sydney',
-]
+def get_subscribed_category_ids(user):
+    """id категорий, на которые подписан пользователь (один запрос вместо запроса на категорию)"""
+    if not user.is_authenticated:
+        return set()
+    return set(Subscription.objects.filter(user=user).values_list('category_id', flat=True))
+
+
+class SubscribedCategoriesMixin:
+    """
+    Подписки пользователя для кнопок подписки на странице поста. Одно ленивое значение
+    на запрос и для контекста страницы, и для меток кэша: запрос к базе - только если
+    кнопки рендерятся, и не больше одного раза
+    """
+
+    @cached_property
+    def subscribed_category_ids(self):
+        user = self.request.user
+        return SimpleLazyObject(lambda: get_subscribed_category_ids(user))
+
+    def get_hole_context(self):
+        return {'subscribed_category_ids': self.subscribed_category_ids}
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['subscribed_category_ids'] = self.subscribed_category_ids
+        return context
 
 
 # Главная страница
@@ -49,62 +73,94 @@ class HomePageView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         try:
-            context['latest_news'] = Post.objects.filter(post_type='NW').order_by('-created_at')[:3]
+            context['latest_news'] = Post.objects.headlines().filter(post_type='NW').order_by('-created_at')[:3]
         except Exception as e:
             context['latest_news'] = []
             print(f"Ошибка при получении новостей: {e}")
 
-        # Добавляем контекст для времени и часовых поясов
-        context['current_time'] = timezone.now()
-        context['timezones'] = COMMON_TIMEZONES
         return context
 
 
 # Список новостей
-class NewsList(ListView):
+class NewsList(CachedPageMixin, PostPaginationMixin, ListView):
     model = Post
     template_name = 'news/news_list.html'
     context_object_name = 'posts'
     paginate_by = 10
+    count_cache_key = 'post_count_NW_published'
+    count_cache_tags = [list_tag('NW')]
+    page_cache_tags = [list_tag('NW')]
 
     def get_queryset(self):
-        return Post.objects.filter(
+        return Post.objects.for_listing().filter(
             post_type='NW',
             is_published=True
-        ).order_by('-created_at')
+        ).order_by('-created_at', '-id')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['is_author'] = self.request.user.groups.filter(
-            name='authors').exists() if self.request.user.is_authenticated else False
-        # Добавляем контекст для времени и часовых поясов
-        context['current_time'] = timezone.now()
-        context['timezones'] = COMMON_TIMEZONES
-        # Добавляем общее количество для статистики
-        context['total_news_count'] = Post.objects.filter(
-            post_type='NW',
-            is_published=True
-        ).count()
+        context['is_author'] = roles.is_author(self.request.user)
+        # Общее количество для статистики (из кэша, без отдельного COUNT)
+        context['total_news_count'] = context['total_count']
 
         return context
 
 
 # Детальная страница новости
-class NewsDetail(DetailView):
+class NewsDetail(SubscribedCategoriesMixin, CachedPageMixin, DetailView):
     model = Post
     template_name = 'news/news_detail.html'
     context_object_name = 'news'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        # Добавляем контекст для времени и часовых поясов
-        context['current_time'] = timezone.now()
-        context['timezones'] = COMMON_TIMEZONES
-        return context
+    def get_queryset(self):
+        return Post.objects.for_detail()
+
+
+class PublishLimitMixin:
+    """Лимит публикаций в день для форм создания постов (news/publish_limit.py)"""
+
+    def limit_exceeded(self):
+        messages.error(
+            self.request,
+            _('You have exceeded the publication limit! You cannot publish more than %(limit)s news/articles per day.') % {
+                'limit': publish_limit.daily_limit()
+            }
+        )
+        return redirect('news_list')
+
+    def get_limit_context(self):
+        if not self.request.user.is_authenticated:
+            return {'remaining_posts': 0, 'daily_limit': publish_limit.daily_limit()}
+        return {
+            'remaining_posts': publish_limit.remaining(self.request.user),
+            'daily_limit': publish_limit.daily_limit(),
+        }
+
+    def save_within_limit(self, form):
+        """
+        Занимает место в дневном лимите и сохраняет пост. Возвращает (response, сколько
+        постов еще можно опубликовать сегодня) или (None, 0), если лимит исчерпан
+        """
+        user = self.request.user
+        count = publish_limit.reserve(user)
+        if count is None:
+            return None, 0
+        # Пост уже учтен в счетчике, сигналу не нужно его сбрасывать
+        form.instance._publish_limit_reserved = True
+        try:
+            with transaction.atomic():
+                # Счетчик в кэше мог пропустить лишнюю публикацию - последнее слово за базой
+                if not publish_limit.confirm(user, form.instance.author_id):
+                    return None, 0
+                response = super().form_valid(form)
+        except Exception:
+            publish_limit.release(user)
+            raise
+        return response, max(publish_limit.daily_limit() - count, 0)
 
 
 # Создание новости
-class NewsCreate(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
+class NewsCreate(LoginRequiredMixin, PermissionRequiredMixin, PublishLimitMixin, CreateView):
     permission_required = ('news.add_post',)
     form_class = PostForm
     model = Post
@@ -113,52 +169,21 @@ class NewsCreate(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     login_url = '/accounts/login/'
 
     def dispatch(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='authors').exists():
+        if not roles.is_author(request.user):
             messages.error(request, _("Only authors can create news. Become an author!"))
             return redirect('news_list')
 
-        if not self.can_publish_today(request.user):
-            messages.error(
-                request,
-                _('You have exceeded the publication limit! You cannot publish more than 3 news/articles per day.')
-            )
-            return redirect('news_list')
+        if not publish_limit.can_publish(request.user):
+            return self.limit_exceeded()
 
         return super().dispatch(request, *args, **kwargs)
 
-    def can_publish_today(self, user):
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_posts_count = Post.objects.filter(
-            author__user=user,
-            created_at__gte=today_start
-        ).count()
-        return today_posts_count < 3
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        if self.request.user.is_authenticated:
-            today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_posts_count = Post.objects.filter(
-                author__user=self.request.user,
-                created_at__gte=today_start
-            ).count()
-            context['remaining_posts'] = 3 - today_posts_count
-        else:
-            context['remaining_posts'] = 0
-
-        context['current_time'] = timezone.now()
-        context['timezones'] = COMMON_TIMEZONES
+        context.update(self.get_limit_context())
         return context
 
     def form_valid(self, form):
-        if not self.can_publish_today(self.request.user):
-            messages.error(
-                self.request,
-                _('You have exceeded the publication limit! You cannot publish more than 3 news/articles per day.')
-            )
-            return redirect('news_list')
-
         post = form.save(commit=False)
         post.post_type = 'NW'
 
@@ -168,15 +193,10 @@ class NewsCreate(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
             author = Author.objects.create(user=self.request.user)
 
         post.author = author
-        response = super().form_valid(form)
-
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_posts_count = Post.objects.filter(
-            author__user=self.request.user,
-            created_at__gte=today_start
-        ).count()
+        response, remaining_posts = self.save_within_limit(form)
+        if response is None:
+            return self.limit_exceeded()
 
-        remaining_posts = 3 - today_posts_count
         messages.success(
             self.request,
             _('News created successfully! Today you can publish %(remaining_posts)s more posts.') % {
@@ -197,7 +217,7 @@ class NewsUpdate(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
     def dispatch(self, request, *args, **kwargs):
         obj = self.get_object()
 
-        if not request.user.groups.filter(name='authors').exists():
+        if not roles.is_author(request.user):
             messages.error(request, _("Only authors can edit news. Become an author!"))
             return redirect('news_list')
 
@@ -211,12 +231,6 @@ class NewsUpdate(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
 
         return super().dispatch(request, *args, **kwargs)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['current_time'] = timezone.now()
-        context['timezones'] = COMMON_TIMEZONES
-        return context
-
 
 class NewsDelete(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
     permission_required = ('news.delete_post',)
@@ -228,7 +242,7 @@ class NewsDelete(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
     def dispatch(self, request, *args, **kwargs):
         obj = self.get_object()
 
-        if not request.user.groups.filter(name='authors').exists():
+        if not roles.is_author(request.user):
             messages.error(request, _("Only authors can delete news. Become an author!"))
             return redirect('news_list')
 
@@ -242,14 +256,8 @@ class NewsDelete(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
 
         return super().dispatch(request, *args, **kwargs)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['current_time'] = timezone.now()
-        context['timezones'] = COMMON_TIMEZONES
-        return context
-
 
-class ArticleCreate(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
+class ArticleCreate(LoginRequiredMixin, PermissionRequiredMixin, PublishLimitMixin, CreateView):
     permission_required = ('news.add_post',)
     form_class = PostForm
     model = Post
@@ -257,66 +265,30 @@ class ArticleCreate(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     login_url = '/accounts/login/'
 
     def dispatch(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='authors').exists():
+        if not roles.is_author(request.user):
             messages.error(request, _("Only authors can create articles. Become an author!"))
             return redirect('news_list')
 
-        if not self.can_publish_today(request.user):
-            messages.error(
-                request,
-                _('You have exceeded the publication limit! You cannot publish more than 3 news/articles per day.')
-            )
-            return redirect('news_list')
+        if not publish_limit.can_publish(request.user):
+            return self.limit_exceeded()
 
         return super().dispatch(request, *args, **kwargs)
 
-    def can_publish_today(self, user):
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_posts_count = Post.objects.filter(
-            author__user=user,
-            created_at__gte=today_start
-        ).count()
-        return today_posts_count < 3
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        if self.request.user.is_authenticated:
-            today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_posts_count = Post.objects.filter(
-                author__user=self.request.user,
-                created_at__gte=today_start
-            ).count()
-            context['remaining_posts'] = 3 - today_posts_count
-        else:
-            context['remaining_posts'] = 0
-
-        context['current_time'] = timezone.now()
-        context['timezones'] = COMMON_TIMEZONES
+        context.update(self.get_limit_context())
         return context
 
     def form_valid(self, form):
-        if not self.can_publish_today(self.request.user):
-            messages.error(
-                self.request,
-                _('You have exceeded the publication limit! You cannot publish more than 3 news/articles per day.')
-            )
-            return redirect('news_list')
-
         post = form.save(commit=False)
         post.post_type = 'AR'
 
         author, created = Author.objects.get_or_create(user=self.request.user)
         post.author = author
-        response = super().form_valid(form)
-
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_posts_count = Post.objects.filter(
-            author__user=self.request.user,
-            created_at__gte=today_start
-        ).count()
+        response, remaining_posts = self.save_within_limit(form)
+        if response is None:
+            return self.limit_exceeded()
 
-        remaining_posts = 3 - today_posts_count
         messages.success(
             self.request,
             _('Article created successfully! Today you can publish %(remaining_posts)s more posts.') % {
@@ -337,7 +309,7 @@ class ArticleUpdate(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
     def dispatch(self, request, *args, **kwargs):
         obj = self.get_object()
 
-        if not request.user.groups.filter(name='authors').exists():
+        if not roles.is_author(request.user):
             messages.error(request, _("Only authors can edit articles. Become an author!"))
             return redirect('news_list')
 
@@ -351,12 +323,6 @@ class ArticleUpdate(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
 
         return super().dispatch(request, *args, **kwargs)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['current_time'] = timezone.now()
-        context['timezones'] = COMMON_TIMEZONES
-        return context
-
 
 class ArticleDelete(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
     permission_required = ('news.delete_post',)
@@ -368,7 +334,7 @@ class ArticleDelete(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
     def dispatch(self, request, *args, **kwargs):
         obj = self.get_object()
 
-        if not request.user.groups.filter(name='authors').exists():
+        if not roles.is_author(request.user):
             messages.error(request, _("Only authors can delete articles. Become an author!"))
             return redirect('news_list')
 
@@ -382,63 +348,57 @@ class ArticleDelete(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
 
         return super().dispatch(request, *args, **kwargs)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['current_time'] = timezone.now()
-        context['timezones'] = COMMON_TIMEZONES
-        return context
 
-
-class ArticleList(ListView):
+class ArticleList(CachedPageMixin, PostPaginationMixin, ListView):
     model = Post
     template_name = 'news/article_list.html'
     context_object_name = 'articles'
     paginate_by = 10
+    count_cache_key = 'post_count_AR'
+    count_cache_tags = [list_tag('AR')]
+    page_cache_tags = [list_tag('AR')]
 
     def get_queryset(self):
-        return Post.objects.filter(post_type='AR').order_by('-created_at')
+        return Post.objects.for_listing().filter(post_type='AR').order_by('-created_at', '-id')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['is_author'] = self.request.user.groups.filter(
-            name='authors').exists() if self.request.user.is_authenticated else False
-        context['current_time'] = timezone.now()
-        context['timezones'] = COMMON_TIMEZONES
+        context['is_author'] = roles.is_author(self.request.user)
         return context
 
 
-class ArticleDetail(DetailView):
+class ArticleDetail(SubscribedCategoriesMixin, CachedPageMixin, DetailView):
     model = Post
     template_name = 'news/article_detail.html'
     context_object_name = 'article'
 
     def get_queryset(self):
-        return Post.objects.filter(post_type='AR')
+        return Post.objects.for_detail().filter(post_type='AR')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Добавляем контекст для времени и часовых поясов
-        context['current_time'] = timezone.now()
-        context['timezones'] = COMMON_TIMEZONES
 
         # Добавляем информацию об авторе для шаблона
-        context['is_author'] = self.request.user.groups.filter(
-            name='authors').exists() if self.request.user.is_authenticated else False
+        context['is_author'] = roles.is_author(self.request.user)
 
         return context
 
 
 def news_search(request):
-    news_list = Post.objects.filter(post_type='NW').order_by('-created_at')
-    query = request.GET.get('q', '')
+    query = request.GET.get('q', '').strip()
+    news_list = Post.objects.for_listing().filter(post_type='NW')
     if query:
-        news_list = news_list.filter(title__icontains=query)
+        # Поиск по заголовку и тексту через полнотекстовый индекс, лучшие совпадения первыми
+        news_list = search_posts(news_list, query)
+    else:
+        news_list = news_list.order_by('-created_at', '-id')
+
+    page_obj = Paginator(news_list, 10).get_page(request.GET.get('page'))
 
     return render(request, 'news/news_search.html', {
-        'news': news_list,
+        'news': page_obj,
+        'page_obj': page_obj,
         'query': query,
-        'current_time': timezone.now(),
-        'timezones': COMMON_TIMEZONES,
     })
 
 
@@ -450,9 +410,10 @@ def become_author(request):
         # Создаем группу authors если её нет
         authors_group, created = Group.objects.get_or_create(name='authors')
 
-        if not user.groups.filter(name='authors').exists():
+        if not roles.is_author(user):
             # Добавляем пользователя в группу authors
             authors_group.user_set.add(user)
+            roles.forget(user)
 
             # Создаем запись Author если её нет
             from .models import Author
@@ -466,12 +427,10 @@ def become_author(request):
             return redirect('news_list')
 
     # Проверяем, является ли пользователь уже автором
-    is_author = user.groups.filter(name='authors').exists()
+    is_author = roles.is_author(user)
 
     return render(request, 'news/become_author.html', {
         'is_author': is_author,
-        'current_time': timezone.now(),
-        'timezones': COMMON_TIMEZONES,
     })
 
 
@@ -512,9 +471,7 @@ def unsubscribe_from_category(request, category_id):
 
 @login_required
 def my_subscriptions(request):
-    subscriptions = Subscription.objects.filter(user=request.user)
+    subscriptions = Subscription.objects.filter(user=request.user).select_related('category')
     return render(request, 'news/my_subscriptions.html', {
         'subscriptions': subscriptions,
-        'current_time': timezone.now(),
-        'timezones': COMMON_TIMEZONES,
     })
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+Буферизованный подсчет голосов (лайков/дизлайков).
+
+В обычном режиме каждый голос сразу превращается в UPDATE ... SET rating = rating + 1.
+Если включен RATING_VOTES_BUFFERED, голоса копятся в кэше и раз в
+RATING_VOTES_FLUSH_SECONDS переносятся в базу задачей flush_rating_votes:
+популярный пост получает один UPDATE за сброс, а не за каждый клик.
+
+Буферу нужен общий кэш с атомарными incr и add (Redis, memcached): у файлового
+кэша и кэша в базе incr - это get + set, и одновременные голоса терялись бы,
+поэтому с ними включенный буфер - ImproperlyConfigured.
+
+Устройство буфера:
+    votes:delta:<model>:<pk>   - накопленная сумма голосов (cache.incr)
+    votes:pending:<model>:<pk> - признак, что объект уже стоит в очереди
+    votes:seq                  - номер последнего слота очереди
+    votes:slot:<n>             - (model, pk) объекта, попавшего в очередь
+    votes:flushed              - номер последнего обработанного слота
+    votes:gap                  - (n, время) первого незаписанного слота, который ждет сброс
+    votes:flush_lock           - идет сброс
+
+Суммы голосов, слоты и votes:gap живут BUFFER_TIMEOUT - намного дольше интервала
+сброса. Срок суммы продлевается, когда объект встает в очередь, поэтому она не
+истекает до ближайшего сброса, а после него обнуленная сумма исчезает сама.
+"""
+import time
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.exceptions import ImproperlyConfigured
+
+# Сутки - с запасом больше RATING_VOTES_FLUSH_SECONDS
+BUFFER_TIMEOUT = 24 * 60 * 60
+# Два счетчика очереди (seq, flushed) не истекают: они должны оставаться согласованными
+QUEUE_COUNTER_TIMEOUT = None
+# Слот выделен, но не записан (процесс упал между incr и set): сколько секунд его ждать
+SLOT_GRACE_SECONDS = 60
+# Признак очереди живет ограниченно: объект из потерянного слота снова встанет в очередь
+PENDING_TIMEOUT = 10 * 60
+FLUSH_LOCK_TIMEOUT = 5 * 60
+
+
+def has_atomic_counters(backend):
+    """incr выполняет само хранилище, а не get + set из BaseCache"""
+    # TwoTierCache хранит счетчики в общем кэше
+    backend = getattr(backend, 'shared', backend)
+    return type(backend).incr is not BaseCache.incr and not isinstance(backend, DummyCache)
+
+
+def is_buffered():
+    if not getattr(settings, 'RATING_VOTES_BUFFERED', False):
+        return False
+    backend = caches['default']
+    if not has_atomic_counters(backend):
+        raise ImproperlyConfigured(
+            'RATING_VOTES_BUFFERED требует кэш с атомарным incr (Redis, memcached), '
+            f'а не {type(getattr(backend, "shared", backend)).__name__}'
+        )
+    return True
+
+
+def _delta_key(model_name, pk):
+    return f'votes:delta:{model_name}:{pk}'
+
+
+def _pending_key(model_name, pk):
+    return f'votes:pending:{model_name}:{pk}'
+
+
+def _incr(key, delta, timeout):
+    """Атомарный incr, создающий ключ при первом обращении"""
+    cache.add(key, 0, timeout)
+    return cache.incr(key, delta)
+
+
+def buffer_vote(obj, delta):
+    """Откладывает голос в кэш до ближайшего сброса"""
+    model_name = obj._meta.model_name
+    key = _delta_key(model_name, obj.pk)
+    _incr(key, delta, BUFFER_TIMEOUT)
+
+    # Объект ставится в очередь только один раз до сброса
+    if cache.add(_pending_key(model_name, obj.pk), 1, PENDING_TIMEOUT):
+        # Сумма, созданная давно, не должна истечь раньше сброса
+        cache.touch(key, BUFFER_TIMEOUT)
+        slot = _incr('votes:seq', 1, QUEUE_COUNTER_TIMEOUT)
+        cache.set(f'votes:slot:{slot}', (model_name, obj.pk), BUFFER_TIMEOUT)
+
+
+def pending_delta(obj):
+    """Голоса, которые еще не перенесены в базу"""
+    return cache.get(_delta_key(obj._meta.model_name, obj.pk), 0)
+
+
+def flush_votes():
+    """Переносит накопленные голоса в базу. Возвращает количество обновленных объектов"""
+    token = uuid.uuid4().hex
+    if not cache.add('votes:flush_lock', token, FLUSH_LOCK_TIMEOUT):
+        # Параллельный сброс применил бы те же суммы второй раз
+        return 0
+    try:
+        return _flush()
+    finally:
+        if cache.get('votes:flush_lock') == token:
+            cache.delete('votes:flush_lock')
+
+
+def _flush():
+    last_slot = cache.get('votes:seq', 0)
+    flushed = cache.get('votes:flushed', 0)
+    if last_slot <= flushed:
+        return 0
+
+    slot_keys = [f'votes:slot:{n}' for n in range(flushed + 1, last_slot + 1)]
+    slots = cache.get_many(slot_keys)
+
+    updated = 0
+    processed = []
+    try:
+        for n, slot_key in enumerate(slot_keys, flushed + 1):
+            if slot_key not in slots:
+                if not _slot_lost(n):
+                    # Слот уже выделен, но еще не записан - разберем его при следующем сбросе
+                    break
+                processed.append(slot_key)
+                continue
+            model_name, pk = slots[slot_key]
+
+            # Сначала снимаем признак очереди: голос, пришедший после этого,
+            # заново поставит объект в очередь и не потеряется
+            cache.delete(_pending_key(model_name, pk))
+            key = _delta_key(model_name, pk)
+            delta = cache.get(key, 0)
+            if delta:
+                apps.get_model('news', model_name).apply_rating_delta(pk, delta)
+                # Вычитаем после записи в базу и ровно прочитанное значение: при ошибке
+                # голоса остаются в буфере, параллельные голоса - тоже
+                cache.decr(key, delta)
+                updated += 1
+            processed.append(slot_key)
+    finally:
+        if processed:
+            cache.delete_many(processed)
+            cache.set('votes:flushed', flushed + len(processed), QUEUE_COUNTER_TIMEOUT)
+    return updated
+
+
+def _slot_lost(n):
+    """
+    Слот n не записан дольше SLOT_GRACE_SECONDS (процесс упал после выделения номера
+    или запись вытеснена) - его можно пропустить, а не останавливать очередь навсегда
+    """
+    now = time.time()
+    gap = cache.get('votes:gap')
+    if gap is None or gap[0] != n:
+        cache.set('votes:gap', (n, now), BUFFER_TIMEOUT)
+        return False
+    return now - gap[1] >= SLOT_GRACE_SECONDS
@@ -1,24 +1,28 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 
 class Author(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     rating = models.IntegerField(default=0)
     
     def update_rating(self):
-        # Суммарный рейтинг статей автора × 3
-        post_rating = self.post_set.aggregate(pr=Sum('rating'))['pr'] or 0
-        post_rating *= 3
-        
-        # Суммарный рейтинг комментариев автора
-        comment_rating = self.user.comment_set.aggregate(cr=Sum('rating'))['cr'] or 0
-        
-        # Суммарный рейтинг комментариев к статьям автора
-        post_comment_rating = Comment.objects.filter(post__author=self).aggregate(pcr=Sum('rating'))['pcr'] or 0
-        
-        self.rating = post_rating + comment_rating + post_comment_rating
-        self.save()
+        # Суммарный рейтинг статей автора × 3, комментариев автора и комментариев к его статьям
+        post_rating = Post.objects.filter(author=OuterRef('pk')).order_by().values('author').annotate(
+            total=Sum('rating')).values('total')
+        comment_rating = Comment.objects.filter(user=OuterRef('user')).order_by().values('user').annotate(
+            total=Sum('rating')).values('total')
+        post_comment_rating = Comment.objects.filter(post__author=OuterRef('pk')).order_by().values(
+            'post__author').annotate(total=Sum('rating')).values('total')
+
+        Author.objects.filter(pk=self.pk).update(rating=(
+            Coalesce(Subquery(post_rating), 0) * 3
+            + Coalesce(Subquery(comment_rating), 0)
+            + Coalesce(Subquery(post_comment_rating), 0)
+        ))
+        self.refresh_from_db(fields=['rating'])
     
     def __str__(self):
         return self.user.username
@@ -46,12 +50,16 @@ class Post(models.Model):
     rating = models.IntegerField(default=0)
     
     def like(self):
-        self.rating += 1
-        self.save()
+        self.change_rating(1)
     
     def dislike(self):
-        self.rating -= 1
-        self.save()
+        self.change_rating(-1)
+    
+    def change_rating(self, delta):
+        with transaction.atomic():
+            Post.objects.filter(pk=self.pk).update(rating=F('rating') + delta)
+            Author.objects.filter(pk=self.author_id).update(rating=F('rating') + delta * 3)
+        self.rating += delta
     
     def preview(self):
         return self.content[:124] + '...' if len(self.content) > 124 else self.content
@@ -71,12 +79,19 @@ class Comment(models.Model):
     rating = models.IntegerField(default=0)
     
     def like(self):
-        self.rating += 1
-        self.save()
+        self.change_rating(1)
     
     def dislike(self):
-        self.rating -= 1
-        self.save()
+        self.change_rating(-1)
+    
+    def change_rating(self, delta):
+        with transaction.atomic():
+            Comment.objects.filter(pk=self.pk).update(rating=F('rating') + delta)
+            Author.objects.filter(user_id=self.user_id).update(rating=F('rating') + delta)
+            Author.objects.filter(
+                pk=Subquery(Post.objects.filter(pk=self.post_id).values('author_id'))
+            ).update(rating=F('rating') + delta)
+        self.rating += delta
     
     def __str__(self):
         return f"Comment by {self.user.username} on {self.post.title}"
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from celery.schedules import crontab
 from django.utils.translation import gettext_lazy as _
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'news.middlewares.QueryInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -200,6 +202,7 @@ ADMINS = [
 ]
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend' # Для тестирования - письма в консоль
+EMAIL_BATCH_SIZE = 100  # Писем за одно обращение к почтовому соединению при рассылках
 
 #EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 #EMAIL_HOST = 'smtp.yandex.ru'
@@ -215,20 +218,49 @@ ACCOUNT_EMAIL_SUBJECT_PREFIX = '[News Portal] '
 ACCOUNT_EMAIL_VERIFICATION = 'optional'  # или 'mandatory' для обязательной верификации
 
 
+# Буферизация лайков/дизлайков: голоса копятся в кэше и сбрасываются в базу пачкой.
+# Нужен общий для всех процессов кэш с атомарным incr (Redis, memcached): с файловым
+# кэшем запуск завершится ImproperlyConfigured, с LocMemCache буфер у каждого процесса свой
+RATING_VOTES_BUFFERED = False
+RATING_VOTES_FLUSH_SECONDS = 10
+
 CELERY_BEAT_SCHEDULE = {
     'send-weekly-digest': {
         'task': 'news.tasks.send_weekly_digest',
         'schedule': crontab(day_of_week=1, hour=8, minute=0),  # Понедельник 8:00
     },
 }
+# Сброс буфера голосов нужен только в буферизованном режиме. Перед выключением
+# буфера накопленные голоса переносятся в базу вручную (задача flush_rating_votes)
+if RATING_VOTES_BUFFERED:
+    CELERY_BEAT_SCHEDULE['flush-rating-votes'] = {
+        'task': 'news.tasks.flush_rating_votes',
+        'schedule': float(RATING_VOTES_FLUSH_SECONDS),
+    }
 
 
-# Добавляем кэш-бэкенд (для теста)
+# Двухуровневый кэш (news/cache_backends.py): LRU в памяти процесса перед общим
+# для всех воркеров файловым кэшем. Сбросы кэша из одного воркера видны остальным
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-    }
+        'BACKEND': 'news.cache_backends.TwoTierCache',
+        # Имя L1 в памяти процесса: у каждого алиаса TwoTierCache свое
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 60,
+            # Часто меняющиеся счетчики и блокировки всегда читаются из общего кэша
+            'LOCAL_EXCLUDE_PREFIXES': ['votes:', 'cache_tag:', 'compute_lock:', 'tagged:publish_limit:'],
+        },
+    },
+    # Общий кэш. incr у файлового кэша не атомарен между процессами:
+    # для RATING_VOTES_BUFFERED нужен Redis или memcached
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'newsportal_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
 
 # Или для Redis (для прода)
@@ -245,6 +277,40 @@ CACHES = {
 
 CACHE_MIDDLEWARE_SECONDS = 30
 
+# Кэш страниц списков и постов с персональными "дырками" (news/page_cache.py), 0 - выключен
+PAGE_CACHE_SECONDS = 60 * 5
+
+# Сколько постов автор может опубликовать за сутки (в своем часовом поясе)
+POSTS_PER_DAY = 3
+
+# Пагинация списков новостей и статей: 'keyset' (курсорная) или 'offset' (?page=N)
+POST_LIST_PAGINATION = 'keyset'
+
+# Время жизни кэша процензурированных заголовков и текстов постов
+CENSORED_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Учет SQL по представлениям (news.middlewares.QueryInstrumentationMiddleware).
+# Бюджеты по именам URL из news/urls.py: queries, sql_ms, duplicates (точные повторы
+# запроса), repeated (сколько раз выполнен один и тот же запрос - признак N+1)
+SQL_BUDGETS = {
+    'home': {'queries': 8, 'duplicates': 0},
+    'news_list': {'queries': 10, 'duplicates': 0, 'repeated': 2},
+    'article_list': {'queries': 10, 'duplicates': 0, 'repeated': 2},
+    'news_search': {'queries': 12, 'duplicates': 0, 'repeated': 2},
+    'news_detail': {'queries': 12, 'duplicates': 0, 'repeated': 2},
+    'article_detail': {'queries': 12, 'duplicates': 0, 'repeated': 2},
+    'news_create': {'queries': 25, 'repeated': 4},
+    'article_create': {'queries': 25, 'repeated': 4},
+    'subscribe_to_category': {'queries': 12, 'duplicates': 0},
+    'unsubscribe_from_category': {'queries': 12, 'duplicates': 0},
+    'my_subscriptions': {'queries': 10, 'duplicates': 0, 'repeated': 2},
+}
+# При превышении бюджета: 'log' - предупреждение в логе sql, 'raise' - исключение (включается
+# явно: SQL_BUDGET_ACTION=raise в окружении или override_settings в тестах бюджетов)
+SQL_BUDGET_ACTION = os.environ.get('SQL_BUDGET_ACTION', 'log')
+# Заголовок Server-Timing с временем SQL, представления и рендеринга
+SQL_SERVER_TIMING = True
+
 # Настройки логирования
 LOGGING = {
     'version': 1,
@@ -329,6 +395,13 @@ LOGGING = {
             'filename': os.path.join(BASE_DIR, 'logs', 'security.log'),
             'formatter': 'security_file',
         },
+        # Файл sql.log - запросы к базе по представлениям
+        'sql_file': {
+            'level': 'INFO',
+            'class': 'logging.FileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'sql.log'),
+            'formatter': 'general_file',
+        },
         # Email - только при DEBUG=False
         'mail_admins': {
             'level': 'ERROR',
@@ -378,6 +451,12 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        # Учет SQL по представлениям, превышения бюджета - еще и в консоль
+        'news.sql': {
+            'handlers': ['sql_file', 'console_warning'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
     'root': {
         'handlers': ['console_debug', 'console_warning', 'console_error'],